@@ -7,5 +7,9 @@ from .audiogenerator import Audiogenerator
 from .midiprocessing import Midiprocessing
 from .audioanalyzer import Audioanalyzer
 from .dissonancereduction import Dissonancereduction
+from .tuningcache import Tuningcache
+from .scheduler import Scheduler
+from .tuningprocess import TuningProcess
 from .tuner import Tuner
+from .asynctuner import AsyncTuner
 from .tuner import plot_session_log
@@ -0,0 +1,297 @@
+import asyncio
+import functools
+import threading
+import numpy as np
+from .audiogenerator import Audiogenerator
+from .midiprocessing import Midiprocessing
+from .audioanalyzer import Audioanalyzer
+from .dissonancereduction import Dissonancereduction
+
+
+class AsyncTuner:
+    """Tuner on an asyncio event loop. An alternative to the Tuner, which uses threads, locks and sleeps.
+
+    All state (the running notes of the audiogenerator, the fixed frequencies) lives on the event loop, so no locks are
+    needed. The midi messages and the peaks of the audioanalyzer arrive as async iterables, the delayed playback of
+    the midi messages is scheduled with loop.call_at and the optimizations run in an executor, so the loop stays
+    responsive while a chord is tuned. Every AsyncTuner is one session with its own Audiogenerator, several sessions
+    can run concurrently on one event loop, e.g. with asyncio.gather, and share one executor.
+
+    Example:
+
+    tuner = AsyncTuner()
+    tuner.audiogenerator.set_synth_def_with_dict(Audiogenerator.presets['piano'])
+    asyncio.run(tuner.run(tuner.midi_file_messages("midi_files/BWV_0227.mid")))
+
+    Attributes
+    ----------
+    sc : sc3nb.SC or None
+        sc3nb.SC object to communicate with SuperCollider.
+        If None is given the synthesizer runs silently. (Default value = None)
+    tuning_interval : float
+        The running tones are tuned at least every tuning_interval seconds, regardless whether a tuning is requested by
+        a midi message or new fixed frequencies. (Default value = 0.3)
+    audio_lag : float
+        Time (in seconds) between receiving a midi message and forwarding the message to SuperCollider.
+        This is the time the tuner has to optimize the tuning. (Default value = 0.3)
+    executor : concurrent.futures.Executor or None
+        The executor the optimizations run in. If None is given, the default executor of the event loop is used.
+        (Default value = None)
+    use_time_budget : bool
+        If true, every tuning gets a time budget of audio_lag minus the time that already passed since the note-on
+        message that requested it. (Default value = True)
+    audiogenerator : adaptivetuning.Audiogenerator
+        The audiogenerator used to play the tones.
+    dissonancereduction : adaptivetuning.Dissonancereduction
+        Provides the optimization algorithm to tune the tones.
+    fixed_freq : list of float
+        The fixed frequencies last received from the peaks stream.
+    fixed_amp : list of float
+        The amplitudes of the fixed frequencies.
+    """
+
+    def __init__(self, sc=None, tuning_interval=0.3, audio_lag=0.3, executor=None, use_time_budget=True):
+        """__init__ method
+
+        Parameters
+        ----------
+        sc : sc3nb.SC or None
+            sc3nb.SC object to communicate with SuperCollider.
+            If None is given the synthesizer runs silently. (Default value = None)
+        tuning_interval : float
+            The running tones are tuned at least every tuning_interval seconds. (Default value = 0.3)
+        audio_lag : float
+            Time (in seconds) between receiving a midi message and forwarding the message to SuperCollider.
+            (Default value = 0.3)
+        executor : concurrent.futures.Executor or None
+            The executor the optimizations run in. If None is given, the default executor of the event loop is used.
+            (Default value = None)
+        use_time_budget : bool
+            If true, every tuning gets a time budget of audio_lag minus the time that already passed since the
+            note-on message that requested it. (Default value = True)
+        """
+        self.tuning_interval = tuning_interval
+        self.audio_lag = audio_lag
+        self.executor = executor
+        self.use_time_budget = use_time_budget
+        self.audiogenerator = Audiogenerator(sc)
+        self.dissonancereduction = Dissonancereduction(relative_bounds=None, method='CG')
+        self.fixed_freq = []
+        self.fixed_amp = []
+        self._tuning_requested = None
+        self._request_time = None
+        self.reset_statistics()
+
+    @property
+    def statistics(self):
+        """dict : Number of tunings and played midi messages and the mean and largest lateness (in seconds) of the
+        playback compared to the time it was scheduled for."""
+        return {
+            'tunings': self.tunings,
+            'messages': self.messages,
+            'mean_lateness': self.total_lateness / self.messages if self.messages > 0 else 0.,
+            'max_lateness': self.max_lateness
+        }
+
+    def reset_statistics(self):
+        """Set the counters and the lateness statistics to 0."""
+        self.tunings = 0
+        self.messages = 0
+        self.total_lateness = 0.
+        self.max_lateness = 0.
+
+    @staticmethod
+    async def _stream(produce):
+        """Async iterable of the items a blocking producer passes to its callback.
+        The producer runs in its own thread and gets the callback and a threading.Event that stops it."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop_event = threading.Event()
+        end = object()
+
+        def run():
+            try:
+                produce(lambda *item: loop.call_soon_threadsafe(queue.put_nowait, item), stop_event)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, end)
+
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            while True:
+                item = await queue.get()
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop_event.set()
+
+    def midi_file_messages(self, midi_file):
+        """Async iterable of the messages of a midi file in real time.
+
+        Parameters
+        ----------
+        midi_file : str
+            Path to the midi file.
+
+        Returns
+        -------
+        messages : async iterable
+            Tuples ('note_on', pitch, amp), ('note_off', pitch) and ('stop',) at the end, see run.
+        """
+        def produce(put, stop_event):
+            midiprocessing = Midiprocessing(lambda pitch, amp: put('note_on', pitch, amp),
+                                            lambda pitch: put('note_off', pitch), lambda: put('stop'))
+            midiprocessing.play_file(midi_file, stop_event=stop_event)
+        return self._stream(produce)
+
+    def midi_port_messages(self, port_name=None):
+        """Async iterable of the messages of a midi port.
+
+        Parameters
+        ----------
+        port_name : str or None
+            Name of the midi port. If None is given, the first port found is used. (Default value = None)
+
+        Returns
+        -------
+        messages : async iterable
+            Tuples ('note_on', pitch, amp), ('note_off', pitch) and ('stop',), see run.
+        """
+        def produce(put, stop_event):
+            midiprocessing = Midiprocessing(lambda pitch, amp: put('note_on', pitch, amp),
+                                            lambda pitch: put('note_off', pitch), lambda: put('stop'),
+                                            port_name=port_name)
+            midiprocessing.play_port(stop_event=stop_event)
+        return self._stream(produce)
+
+    def audio_peaks(self, fixed_audio=True, audioanalyzer=None):
+        """Async iterable of the peaks the audioanalyzer finds in a wave file or in the recorded audio.
+
+        Parameters
+        ----------
+        fixed_audio : bool or str
+            Path to a wave file or True to record. (Default value = True)
+        audioanalyzer : adaptivetuning.Audioanalyzer or None
+            The audioanalyzer used, its result_callback is replaced. If None is given, a new one with default
+            parameters is used. (Default value = None)
+
+        Returns
+        -------
+        peaks : async iterable
+            Tuples (peaks_freq, peaks_amp).
+        """
+        if audioanalyzer is None:
+            audioanalyzer = Audioanalyzer(silent=False)
+
+        def produce(put, stop_event):
+            audioanalyzer.result_callback = put
+            if isinstance(fixed_audio, str):
+                audioanalyzer.analyze_file(fixed_audio, stop_event=stop_event)
+            else:
+                audioanalyzer.analyze_record(stop_event=stop_event)
+        return self._stream(produce)
+
+    async def run(self, midi_messages, peaks=None):
+        """Run a tuning session until the midi messages end.
+
+        Parameters
+        ----------
+        midi_messages : async iterable
+            Tuples ('note_on', pitch, amp), ('note_off', pitch) or ('stop',) (stop all notes), e.g. from
+            midi_file_messages or midi_port_messages.
+        peaks : async iterable or None
+            Tuples (peaks_freq, peaks_amp) of fixed frequencies and their amplitudes, e.g. from audio_peaks.
+            If None is given, there are no fixed frequencies. (Default value = None)
+        """
+        loop = asyncio.get_running_loop()
+        self._tuning_requested = asyncio.Event()
+        self._request_time = None
+        self.fixed_freq = []
+        self.fixed_amp = []
+        self._last_playback = loop.time()
+
+        tuning_task = asyncio.ensure_future(self._tune_loop())
+        peaks_task = None if peaks is None else asyncio.ensure_future(self._receive_peaks(peaks))
+        try:
+            async for message in midi_messages:
+                self._receive_midi(message)
+            # let the scheduled messages play
+            await asyncio.sleep(max(0, self._last_playback - loop.time()))
+        finally:
+            for task in (tuning_task, peaks_task):
+                if task is not None:
+                    task.cancel()
+            await asyncio.gather(*[task for task in (tuning_task, peaks_task) if task is not None],
+                                 return_exceptions=True)
+            self.audiogenerator.stop_all()
+
+    def _receive_midi(self, message):
+        """Register a midi message in the audiogenerator and schedule its playback in audio_lag seconds."""
+        loop = asyncio.get_running_loop()
+        due_time = loop.time() + self.audio_lag
+        if message[0] == 'note_on':
+            pitch, amp = message[1:]
+            self.audiogenerator.register_note_on(pitch, amp)
+            if self._request_time is None:
+                self._request_time = loop.time()
+            self._tuning_requested.set()
+            loop.call_at(due_time, self._play, due_time, self.audiogenerator.play_note_on, pitch)
+        elif message[0] == 'note_off':
+            self.audiogenerator.register_note_off(message[1])
+            loop.call_at(due_time, self._play, due_time, self.audiogenerator.play_note_off, message[1])
+        elif message[0] == 'stop':
+            self.audiogenerator.register_stop_all()
+            loop.call_at(due_time, self._play, due_time, self.audiogenerator.play_stop_all)
+        self._last_playback = due_time
+
+    def _play(self, due_time, play, *args):
+        """Pass a midi message to SuperCollider and record the lateness."""
+        lateness = asyncio.get_running_loop().time() - due_time
+        play(*args)
+        self.messages += 1
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+
+    async def _receive_peaks(self, peaks):
+        """Store the fixed frequencies and request a tuning if they changed."""
+        async for peaks_freq, peaks_amp in peaks:
+            if not (np.array_equal(peaks_freq, self.fixed_freq) and np.array_equal(peaks_amp, self.fixed_amp)):
+                self.fixed_freq = peaks_freq
+                self.fixed_amp = peaks_amp
+                self._tuning_requested.set()
+
+    async def _tune_loop(self):
+        """Tune the running notes when a tuning is requested, but at least every tuning_interval seconds."""
+        while True:
+            # asyncio.wait instead of asyncio.wait_for, which can swallow the cancellation at the end of run
+            # if the event is set at the same time
+            waiter = asyncio.ensure_future(self._tuning_requested.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.tuning_interval)
+            finally:
+                waiter.cancel()
+            self._tuning_requested.clear()
+            await self.tune_running_notes()
+
+    async def tune_running_notes(self):
+        """Tune the currently running complex tones of the audiogenerator together with the fixed frequencies in the
+        executor and pass the tuned frequencies to the audiogenerator."""
+        loop = asyncio.get_running_loop()
+        pitches, fundamentals_amp, partials_pos, partials_amp = self.audiogenerator.running_notes()
+        request_time = self._request_time if self._request_time is not None else loop.time()
+        self._request_time = None
+        if len(pitches) == 0:
+            return
+        fundamentals_freq = np.array([440 * 2**((pitch - 69) / 12) for pitch in pitches])
+        fundamentals_amp = np.array(fundamentals_amp)
+        time_budget = None
+        if self.use_time_budget:
+            time_budget = self.audio_lag - (loop.time() - request_time)
+
+        result = await loop.run_in_executor(self.executor, functools.partial(
+            self.dissonancereduction.tune, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp,
+            np.array(self.fixed_freq), np.array(self.fixed_amp), time_budget=time_budget
+        ))
+        self.tunings += 1
+        for pitch, frequency in zip(pitches, result['x']):
+            self.audiogenerator.note_change_freq(pitch, frequency)
@@ -870,7 +870,34 @@ class Audiogenerator:
             if self.synths[p] is not None:
                 self.synths[p].fast_release_and_free()
                 self.synths[p] = None
-    
+
+    def running_notes(self):
+        """Snapshot of the registered keys that are currently running.
+
+        Every key has the timbre it was registered with,
+        if all running keys have the same timbre, it is returned once (which is faster to tune).
+
+        Returns
+        -------
+        pitches : list of int
+            Midi pitches of the running keys.
+        amplitudes : list of float
+            Amplitudes of the running keys.
+        partials_pos : np.array or list of np.array
+            Relative positions of the partials, either of all keys or of every key.
+        partials_amp : np.array or list of np.array
+            Relative amplitudes of the partials, either of all keys or of every key.
+        """
+        pitches = [p for p in self.keys if self.keys[p] is not None and self.keys[p].currently_running]
+        amplitudes = [self.keys[p].amplitude for p in pitches]
+        partials_pos = [self.keys[p].partials_pos for p in pitches]
+        partials_amp = [self.keys[p].partials_amp for p in pitches]
+        if len(pitches) > 0 and all(np.array_equal(pos, partials_pos[0]) and np.array_equal(amp, partials_amp[0])
+                                    for pos, amp in zip(partials_pos, partials_amp)):
+            partials_pos = np.array(partials_pos[0])
+            partials_amp = np.array(partials_amp[0])
+        return pitches, amplitudes, partials_pos, partials_amp
+
     def __del__(self):
         """Stop all running synths on deletion."""
         self.stop_all()
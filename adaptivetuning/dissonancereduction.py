@@ -1,8 +1,15 @@
+import concurrent.futures
+import copy
+import time
 import numpy as np
 import scipy.optimize
+from .scale import Scale
+
+class _Interruption(Exception):
+    """Raised inside the objective function to stop an optimization early.
+    The argument is the message of the result, b'TIME BUDGET EXCEEDED' or b'STOPPED'."""
+    pass
 
-# todo
-# tune for sets of complex tones with different spectra
 
 class Dissonancereduction:
     """ Tuning algorithm class. Maps a set of notes to a set of frequencies.
@@ -24,10 +31,47 @@ class Dissonancereduction:
     max_iterations : int
         Maximal number of iteration of the optimization method.
         If None is given the method optimizes until it stops for some other reason. (Default value = None)
+    parametrization : str
+        Variables of the optimization. "frequency": the fundamental frequencies in Hz.
+        "cents": the deviations of the fundamental frequencies from the given ones in cents, which gives all variables
+        the same scale, no matter how high the tones are. The results are always given in Hz.
+        (Default value = "frequency")
+    decompose : bool
+        If true, tune splits the complex tones into groups that have no relevant pairs with each other
+        (e.g. a bass note far below a cluster of high notes) and optimizes every group on its own. (Default value = True)
+    executor : concurrent.futures.Executor or None
+        If not None, the groups of complex tones found by decompose and the starting points of tune_multistart are
+        optimized concurrently in this executor, e.g. a concurrent.futures.ProcessPoolExecutor.
+        The executor is not pickled with the object. (Default value = None)
+    kernel_tolerance : float or None
+        If not None, the dissonance curve h**2 * exp(-8 * h), its derivative and the critical bandwidth are not
+        calculated exactly but linearly interpolated in precomputed lookup tables. The interpolation error of the
+        dissonance curve and its derivative is at most kernel_tolerance times their maximal value, the relative error
+        of the critical bandwidths is at most kernel_tolerance. The Hessian is always calculated exactly.
+        If None is given, everything is calculated exactly. (Default value = None)
+    coarse_partials : list of int or None
+        If not None, tune optimizes in stages: first only with the coarse_partials[0] loudest partials of every
+        timbre, then with the coarse_partials[1] loudest partials starting from that result, and so on, and finally
+        with all partials. Stages that would use all partials anyway are skipped. The result contains the
+        evaluations of every stage in res.nfev_stages, res.nfev and res.nit are the totals.
+        If None is given, tune optimizes with all partials at once. (Default value = None)
+    compact_plans : bool
+        If true, evaluation plans are stored compactly: the index arrays in the smallest of int16, int32 and int64
+        that can hold them and the per-pair floats (critical bandwidths, volume factors, relative positions of the
+        partials) in float32, which takes less than half the memory of a plan (see plan_nbytes). The frequencies and
+        all sums are still calculated in float64, the float32 rounding changes the dissonance by about 1e-7 relative
+        to its value and the tuned frequencies typically by less than 1e-4 cents. But where the optimization is
+        close to a decision between two local minima, the rounding can make it end in the other one.
+        (Default value = False)
     """
+    
+    # methods of scipy.optimize.minimize that use the Hessian
+    hessian_methods = ('newton-cg', 'dogleg', 'trust-ncg', 'trust-krylov', 'trust-exact', 'trust-constr')
 
     def __init__(self, amplitude_threshold = 2e-5,
-                 method="L-BFGS-B", relative_bounds=(2**(-1/36), 2**(1/36)), max_iterations=None):
+                 method="L-BFGS-B", relative_bounds=(2**(-1/36), 2**(1/36)), max_iterations=None,
+                 parametrization="frequency", decompose=True, executor=None, kernel_tolerance=None,
+                 coarse_partials=None, compact_plans=False):
         """__init__ method
         
         Parameters
@@ -45,12 +89,44 @@ class Dissonancereduction:
         max_iterations : int
             Maximal number of iteration of the optimization method.
             If None is given the method optimizes until it stops for some other reason. (Default value = None)
+        parametrization : str
+            Variables of the optimization, "frequency" (in Hz) or "cents" (deviations from the given fundamental
+            frequencies). The results are always given in Hz. (Default value = "frequency")
+        decompose : bool
+            If true, groups of complex tones without relevant pairs between them are optimized independently.
+            (Default value = True)
+        executor : concurrent.futures.Executor or None
+            If not None, independent groups of complex tones and the starting points of tune_multistart are
+            optimized concurrently in this executor. (Default value = None)
+        kernel_tolerance : float or None
+            If not None, the dissonance curve, its derivative and the critical bandwidth are interpolated in lookup
+            tables with this (relative) error bound. If None is given, they are calculated exactly.
+            (Default value = None)
+        coarse_partials : list of int or None
+            If not None, tune optimizes with the given numbers of loudest partials one after the other before it
+            optimizes with all partials. (Default value = None)
+        compact_plans : bool
+            If true, evaluation plans use small integer types and float32. (Default value = False)
         """
+        if parametrization not in ("frequency", "cents"):
+            raise ValueError("parametrization has to be 'frequency' or 'cents', not {}".format(parametrization))
         self.method = method
+        self.parametrization = parametrization
         self.options = dict()
         self.relative_bounds = relative_bounds
         self.max_iterations = max_iterations
         self.amplitude_threshold = amplitude_threshold
+        self.decompose = decompose
+        self.executor = executor
+        self.kernel_tolerance = kernel_tolerance
+        self.coarse_partials = coarse_partials
+        self.compact_plans = compact_plans
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # executors can't be pickled, e.g. when the object itself is sent to a worker process
+        state['executor'] = None
+        return state
             
     @property
     def max_iterations(self):
@@ -80,13 +156,26 @@ class Dissonancereduction:
         if amplitude_threshold <= 0.:
             amplitude_threshold = 1e-10
         self._amp_threshold_log = np.log10(amplitude_threshold)
+    
+    @property
+    def kernel_tolerance(self):
+        """float or None : Error bound of the lookup tables for the dissonance curve, its derivative and the critical
+        bandwidth. If None, they are calculated exactly. (Default value = None)"""
+        return self._kernel_tolerance
+    
+    @kernel_tolerance.setter
+    def kernel_tolerance(self, kernel_tolerance):
+        self._kernel_tolerance = kernel_tolerance
+        self._kernel_tables = None if kernel_tolerance is None else self._make_kernel_tables(kernel_tolerance)
      
     def quasi_constants(self, fundamentals_freq, fundamentals_amp, partials_pos,
-                        partials_amp, fixed_freq, fixed_amp):
+                        partials_amp, fixed_freq, fixed_amp, tones=None):
         """Calculate quasi-constants for a set of complx tones and fixed frequencies to be tuned.
         Calculate values that will be practically constant during optimization
         as well as sorting out pairs of partials that will never be relevant during tuning.
         This is only technically valid if frequencies are not changed sinificantly more than 1/2 semitone.
+        Inaudible partials are sorted out first, the relevant pairs among the remaining ones are found with a sweep
+        over the sorted frequencies, only comparing frequencies that are at most about a critical bandwidth apart.
         
         Parameters
         ----------
@@ -94,18 +183,19 @@ class Dissonancereduction:
             Array of fundamental frequencies of the complex tones.
         fundamentals_amp : np.array
             Array of amplitudes of the complex tones.
-        partials_pos : np.array
-            Array of relative positions of the partials of the complex tones.
-            Assumes a single timbre for all complex tones, tuning complex tones with different timbres is currently
-            not supported.
-        partials_amp : np.array
-            Array of relative amplitudes of the partials of the complex tones.
-            Assumes a single timbre for all complex tones, tuning complex tones with different timbres is currently
-            not supported.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones (one timbre for all complex tones)
+            or a list with one such array per complex tone (every complex tone has its own timbre), see partials_layout.
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            complex tone, like partials_pos.
         fixed_freq : np.array
             Array of fixed frequencies, e.g. some other instrument to tune to or frequencies found in environmental noise.
         fixed_amp : np.array
             Array of amplitudes for the fixed frequencies.
+        tones : list of int
+            If not None, only pairs where at least one of the partials belongs to one of the complex tones with
+            these indices are returned. Used to add tones to existing quasi-constants. (Default value = None)
             
         Returns
         -------
@@ -121,71 +211,482 @@ class Dissonancereduction:
         if len(fundamentals_freq) == 0 or (len(fundamentals_freq) == 1 and len(fixed_freq) == 0):
             return np.array([]), np.array([]), np.array([])
         
-        # a row corresponds to a complex tone
-        frequencies = np.outer(fundamentals_freq, partials_pos)
-        amplitudes = np.outer(fundamentals_amp, partials_amp)
-
-        # all pairs of partials and their volumes
-        # including for every two partials only one pair
-        # a partial does not form a pair with itself
-        args = np.array([
-            [i, k, j, l,
-            frequencies[i,k],
-            frequencies[j,l],
-            amplitudes[i,k],
-            amplitudes[j,l]]
-            for (i,j) in [(i,j) for i in range(len(fundamentals_freq)) for j in range(i + 1, len(fundamentals_freq))]
-            for (k,l) in [(k,l) for k in range(len(partials_pos)) for l in range(len(partials_pos))]
-        ] + [[i, k, f, -1,
-            frequencies[i,k],
-            fixed_freq[f],
-            amplitudes[i,k],
-            fixed_amp[f]]
-            for i in range(len(fundamentals_freq))
-            for k in range(len(partials_pos))
-            for f in range(len(fixed_freq))
-        ])
-
-        ids = args[:,0:4]
-        p1s = args[:,4]
-        p2s = args[:,5]
-        v1s = args[:,6]
-        v2s = args[:,7]
+        fixed_freq = np.asarray(fixed_freq, dtype=float)
+        fixed_amp = np.asarray(fixed_amp, dtype=float)
+        nr_tones = len(fundamentals_freq)
+        selected_tones = None if tones is None else np.asarray(tones, dtype=int)
+        offsets, positions = self.partials_layout(nr_tones, partials_pos)
+        _, relative_amplitudes = self.partials_layout(nr_tones, partials_amp)
+        partial_tones = np.repeat(np.arange(nr_tones), np.diff(offsets))
 
-        # approximation by Zwicker and Terhardt
-        critical_bandwidths = 25 + 75 * (1 + 3.5e-07 * (p1s + p2s)**2)**0.69
-
-        # calculation of difference in CBW
-        hs = np.abs(p1s - p2s) / critical_bandwidths
+        # all partials and fixed frequencies in one list:
+        # partial k of tone i is stored as (i, k), fixed frequency f is stored as (-1, f)
+        frequencies = np.concatenate((np.asarray(fundamentals_freq, dtype=float)[partial_tones] * positions, fixed_freq))
+        amplitudes = np.concatenate((np.asarray(fundamentals_amp, dtype=float)[partial_tones] * relative_amplitudes,
+                                     fixed_amp))
+        tones = np.concatenate((partial_tones, -np.ones(len(fixed_freq), dtype=int)))
+        indices = np.concatenate((np.arange(len(positions)) - offsets[partial_tones], np.arange(len(fixed_freq))))
+        
+        # audibility prefilter: partials that are inaudible can not be part of a relevant pair
+        loudness = self.loudness(frequencies, amplitudes)
+        audible = loudness > 0.
+        frequencies, loudness, tones, indices = frequencies[audible], loudness[audible], tones[audible], indices[audible]
+        
+        # sorted sweep: partner candidates of a partial are the following partials up to the end of its window
+        order = np.argsort(frequencies, kind='stable')
+        frequencies, loudness, tones, indices = frequencies[order], loudness[order], tones[order], indices[order]
+        ends = np.searchsorted(frequencies, self._critical_band_upper_bound(frequencies), side='right')
+        counts = ends - np.arange(len(frequencies)) - 1
+        firsts = np.repeat(np.arange(len(frequencies)), counts)
+        seconds = firsts + 1 + np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
         
-        # sorting out irrelevant pairs and preventing errors when taking the log of v later
-        cond = np.where(np.logical_and(np.logical_and(hs < 1.46, v1s > 0), v2s > 0))
-        critical_bandwidths = critical_bandwidths[cond]
-        relevant_pairs = ids[cond].astype(int)
-        p1s = p1s[cond]
-        p2s = p2s[cond]
-        v1s = v1s[cond]
-        v2s = v2s[cond]
-        
-        # approx of auditory level / 20
-        # - much easier to calculate than the actual loudness or loudness level and still accurate enough
-        # for our purpose as a model of the human loudness perception.
-        # Since we are more interested in cutting partials that are outside the human hearing range
-        # than subtle differences inside the human hearing range we can drop the second summand of 
-        # $L_{pt}(f)$ (see my thesis), loosing the small bump between 2 and 5 kHz, to save even more computation time
-        v1s = np.log10(v1s) - self._amp_threshold_log - 45.71633305 * p1s**(-0.8) - 5e-17 * p1s**4
-        v2s = np.log10(v2s) - self._amp_threshold_log - 45.71633305 * p2s**(-0.8) - 5e-17 * p2s**4
-        
-        # sorting out more irrelevant pairs (pairs where at least one of the partials is inaudible)
-        cond = np.where(np.logical_and(v1s > 0., v2s > 0.))
+        # a partial does not form a pair with another partial of the same complex tone,
+        # two fixed frequencies do not form a pair
+        cond = np.logical_and(tones[firsts] != tones[seconds],
+                              np.logical_or(tones[firsts] >= 0, tones[seconds] >= 0))
+        if selected_tones is not None:
+            cond = np.logical_and(cond, np.logical_or(np.isin(tones[firsts], selected_tones),
+                                                      np.isin(tones[seconds], selected_tones)))
+        cond = np.where(cond)
+        firsts, seconds = firsts[cond], seconds[cond]
+        
+        # calculation of difference in CBW, sorting out irrelevant pairs
+        p1s = frequencies[firsts]
+        p2s = frequencies[seconds]
+        critical_bandwidths = self._critical_bandwidths(p1s + p2s)
+        hs = np.abs(p1s - p2s) / critical_bandwidths
+        cond = np.where(hs < 1.46)
+        firsts, seconds, critical_bandwidths = firsts[cond], seconds[cond], critical_bandwidths[cond]
         
         # aggregating the volume measures
-        volume_factors = np.minimum(v1s[cond], v2s[cond])
+        volume_factors = np.minimum(loudness[firsts], loudness[seconds])
+        
+        # in every pair the tone with the lower index comes first, fixed frequencies come last
+        swap = np.logical_or(tones[firsts] < 0, np.logical_and(tones[seconds] >= 0, tones[seconds] < tones[firsts]))
+        firsts, seconds = np.where(swap, seconds, firsts), np.where(swap, firsts, seconds)
+        is_fixed = tones[seconds] < 0
+        relevant_pairs = np.stack((tones[firsts], indices[firsts], np.where(is_fixed, indices[seconds], tones[seconds]),
+                                   np.where(is_fixed, -1, indices[seconds])), axis=-1)
+        
+        # pairs of two partials sorted by (i, j, k, l) followed by pairs with a fixed frequency sorted by (i, k, f)
+        i, k, j, l = relevant_pairs.T
+        order = np.lexsort((l, np.where(is_fixed, j, k), np.where(is_fixed, k, j), i, is_fixed))
         
-        return relevant_pairs[cond], critical_bandwidths[cond], volume_factors
+        return relevant_pairs[order], critical_bandwidths[order], volume_factors[order]
+    
+    @staticmethod
+    def partials_layout(nr_tones, partials):
+        """The partials of all complex tones in one flat array (like the compressed sparse row format).
+        The values of complex tone i are values[offsets[i]:offsets[i + 1]], so the partials of complex tones with
+        different timbres (different numbers of partials) can be processed without loops over the complex tones.
+        
+        Parameters
+        ----------
+        nr_tones : int
+            Number of complex tones.
+        partials : np.array or list of np.array
+            Relative positions (or amplitudes) of the partials, one array for all complex tones
+            or a list with one array per complex tone.
+            
+        Returns
+        -------
+        offsets : np.array
+            Start of the partials of every complex tone in values, followed by the total number of partials.
+        values : np.array
+            The relative positions (or amplitudes) of the partials of all complex tones one after the other.
+        """
+        if not Dissonancereduction.per_tone(partials):
+            partials = np.asarray(partials, dtype=float)
+            return np.arange(nr_tones + 1) * len(partials), np.tile(partials, nr_tones)
+        if len(partials) != nr_tones:
+            raise ValueError("there have to be partials for every complex tone, got {} for {} complex tones".format(
+                len(partials), nr_tones))
+        lengths = [len(p) for p in partials]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+        values = np.concatenate([np.asarray(p, dtype=float) for p in partials]) if nr_tones > 0 else np.array([])
+        return offsets, values
+    
+    @staticmethod
+    def per_tone(partials):
+        """True if partials is a list with one array per complex tone, False if it is a single array for all."""
+        return len(partials) > 0 and np.ndim(partials[0]) > 0
+    
+    @staticmethod
+    def _select_timbres(partials, tones):
+        """The partials (positions or amplitudes) of the given complex tones."""
+        if Dissonancereduction.per_tone(partials):
+            return [partials[t] for t in tones]
+        return partials
+    
+    def loudest_partials(self, partials_pos, partials_amp, nr_partials):
+        """The nr_partials partials with the highest relative amplitudes of every timbre.
+        
+        Parameters
+        ----------
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            complex tone.
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            complex tone.
+        nr_partials : int
+            Number of partials to keep per timbre.
+            
+        Returns
+        -------
+        partials_pos, partials_amp : np.array or list of np.array
+            The positions and amplitudes of the loudest partials (in their original order), in the same form as the
+            given ones.
+        """
+        def loudest(positions, amplitudes):
+            positions, amplitudes = np.asarray(positions, dtype=float), np.asarray(amplitudes, dtype=float)
+            selected = np.sort(np.argsort(- amplitudes, kind='stable')[:nr_partials])
+            return positions[selected], amplitudes[selected]
+        if not self.per_tone(partials_pos):
+            return loudest(partials_pos, partials_amp)
+        timbres = [loudest(positions, amplitudes) for positions, amplitudes in zip(partials_pos, partials_amp)]
+        return [timbre[0] for timbre in timbres], [timbre[1] for timbre in timbres]
+    
+    def loudness(self, frequencies, amplitudes):
+        """Approximation of the auditory level of simple tones.
+        Approximation of the auditory level / 20 - much easier to calculate than the actual loudness or loudness level
+        and still accurate enough for our purpose as a model of the human loudness perception.
+        Since we are more interested in cutting partials that are outside the human hearing range
+        than subtle differences inside the human hearing range we can drop the second summand of 
+        $L_{pt}(f)$ (see my thesis), loosing the small bump between 2 and 5 kHz, to save even more computation time.
+        
+        Parameters
+        ----------
+        frequencies : np.array
+            Frequencies of the simple tones.
+        amplitudes : np.array
+            Amplitudes of the simple tones.
+            
+        Returns
+        -------
+        loudness : np.array
+            The approximated auditory level / 20 of the simple tones. Inaudible simple tones have a loudness <= 0.
+            Simple tones with non-positive frequency or amplitude get a loudness of -inf.
+        """
+        p = np.asarray(frequencies, dtype=float)
+        # computed for all simple tones at once, non-positive frequencies or amplitudes give -inf or nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loudness = np.log10(amplitudes) - self._amp_threshold_log - 45.71633305 * p**(-0.8) - 5e-17 * p**4
+        loudness[np.isnan(loudness)] = -np.inf
+        return loudness
+    
+    def remove_tones(self, relevant_pairs, critical_bandwidths, volume_factors, tones):
+        """Remove complex tones from a set of quasi-constants.
+        All pairs the given complex tones are involved in are dropped and the remaining complex tones are renumbered,
+        so the result is the same as if the complex tones had never been passed to quasi_constants.
+        
+        Parameters
+        ----------
+        relevant_pairs : np.array
+            As calculated with quasi_constants.
+        critical_bandwidths : np.array
+            As calculated with quasi_constants.
+        volume_factors : np.array
+            As calculated with quasi_constants.
+        tones : list of int
+            Indices of the complex tones to remove.
+            
+        Returns
+        -------
+        See returns of quasi_constants
+        """
+        relevant_pairs = np.reshape(relevant_pairs, (-1, 4)).astype(int)
+        tones = np.unique(np.asarray(tones, dtype=int))
+        is_tone_pair = relevant_pairs[:,3] >= 0
+        cond = np.where(np.logical_not(np.logical_or(
+            np.isin(relevant_pairs[:,0], tones),
+            np.logical_and(is_tone_pair, np.isin(relevant_pairs[:,2], tones))
+        )))
+        relevant_pairs = relevant_pairs[cond]
+        is_tone_pair = is_tone_pair[cond]
+        # every index is lowered by the number of removed tones below it
+        relevant_pairs[:,0] -= np.searchsorted(tones, relevant_pairs[:,0])
+        relevant_pairs[:,2] -= np.where(is_tone_pair, np.searchsorted(tones, relevant_pairs[:,2]), 0)
+        return relevant_pairs, np.asarray(critical_bandwidths)[cond], np.asarray(volume_factors)[cond]
+    
+    def tone_components(self, nr_tones, relevant_pairs, tie_labels=None):
+        """Groups of complex tones that can be tuned independently.
+        The connected components of the graph with the complex tones as nodes and an edge between two complex tones
+        if some of their partials form a relevant pair. Pairs with fixed frequencies don't connect complex tones.
+        
+        Parameters
+        ----------
+        nr_tones : int
+            Number of complex tones.
+        relevant_pairs : np.array
+            As calculated with quasi_constants.
+        tie_labels : np.array
+            Tie group of every complex tone as calculated with tie_labels, tied complex tones are always in the same
+            component. If None is given, there are no ties. (Default value = None)
+            
+        Returns
+        -------
+        components : list of np.array
+            Sorted indices of the complex tones of every component, ordered by their lowest index.
+        """
+        relevant_pairs = np.reshape(relevant_pairs, (-1, 4)).astype(int)
+        tone_pairs = relevant_pairs[relevant_pairs[:,3] >= 0]
+        # reachable[a, b]: complex tones a and b are connected by a path of length at most 1, 2, 4, 8, ...
+        reachable = np.eye(nr_tones, dtype=bool)
+        reachable[tone_pairs[:,0], tone_pairs[:,2]] = True
+        reachable[tone_pairs[:,2], tone_pairs[:,0]] = True
+        if tie_labels is not None:
+            tie_labels = np.asarray(tie_labels)
+            reachable |= tie_labels[:,None] == tie_labels[None,:]
+        while True:
+            longer_paths = reachable @ reachable
+            if np.array_equal(longer_paths, reachable):
+                break
+            reachable = longer_paths
+        # every complex tone is labeled with the lowest index in its component
+        labels = np.argmax(reachable, axis=1)
+        order = np.argsort(labels, kind='stable')
+        return np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+    
+    def tie_labels(self, fundamentals_freq, tie_groups):
+        """Tie group of every complex tone.
+        Tied complex tones are not tuned independently, they are all multiplied by the same factor, so their intervals
+        (e.g. octave doublings) stay as they are given and the optimization has one variable per tie group.
+        
+        Parameters
+        ----------
+        fundamentals_freq : np.array
+            Array of fundamental frequencies of the complex tones.
+        tie_groups : str or list or None
+            "pitch_class": complex tones are tied if their fundamental frequencies are (rounded to equal tempered
+            semitones) the same pitch class, e.g. all Cs of a chord.
+            A list of lists of indices of complex tones: every list is a tie group, complex tones that are in no list
+            are not tied to any other.
+            None: no ties.
+            
+        Returns
+        -------
+        labels : np.array or None
+            For every complex tone the index of its tie group, numbered in the order of the lowest complex tone of
+            every group. None if there are no ties.
+        """
+        nr_tones = len(fundamentals_freq)
+        if tie_groups is None:
+            return None
+        if isinstance(tie_groups, str):
+            if tie_groups != "pitch_class":
+                raise ValueError("tie_groups has to be 'pitch_class', a list of groups or None, not {}".format(
+                    tie_groups))
+            groups = np.mod(np.round(12 * np.log2(np.asarray(fundamentals_freq, dtype=float) / 440)), 12)
+        else:
+            # complex tones without a group get a group of their own
+            groups = np.arange(nr_tones) + len(tie_groups)
+            for g, tones in enumerate(tie_groups):
+                tones = np.asarray(tones, dtype=int)
+                if np.any(groups[tones] < len(tie_groups)):
+                    raise ValueError("tie groups have to be disjoint")
+                groups[tones] = g
+        # number the groups in the order of their lowest complex tone
+        _, first_tones, labels = np.unique(groups, return_index=True, return_inverse=True)
+        return np.argsort(np.argsort(first_tones))[labels]
+    
+    def _critical_bandwidths(self, sums):
+        """Critical bandwidths of pairs of frequencies, given the sums of the frequencies of the pairs.
+        Approximation by Zwicker and Terhardt at the mean frequency of the pair, interpolated in the lookup table
+        if kernel_tolerance is not None."""
+        if self._kernel_tables is None:
+            return 25 + 75 * (1 + 3.5e-07 * sums**2)**0.69
+        tables = self._kernel_tables
+        positions = np.minimum(sums * tables['bandwidth_scale'], len(tables['bandwidth']) - 1)
+        indices = np.minimum(positions.astype(np.intp), len(tables['bandwidth']) - 2)
+        critical_bandwidths = np.take(tables['bandwidth'], indices) \
+                              + (positions - indices) * np.take(tables['bandwidth_slope'], indices)
+        # outside the table (above the hearing range)
+        beyond = np.where(sums > tables['bandwidth_max_sum'])
+        critical_bandwidths[beyond] = 25 + 75 * (1 + 3.5e-07 * sums[beyond]**2)**0.69
+        return critical_bandwidths
+    
+    def _interpolated_kernel(self, hs):
+        """hs**2 * exp(-8 * hs) and its derivative, linearly interpolated in the lookup tables."""
+        tables = self._kernel_tables
+        # beyond the end of the table both are smaller than the tolerance, the last entry is used
+        positions = np.minimum(hs * tables['scale'], len(tables['dissonance']) - 1)
+        indices = np.minimum(positions.astype(np.intp), len(tables['dissonance']) - 2)
+        fractions = positions - indices
+        ds = np.take(tables['dissonance'], indices) + fractions * np.take(tables['dissonance_slope'], indices)
+        ddhs = np.take(tables['derivative'], indices) + fractions * np.take(tables['derivative_slope'], indices)
+        return ds, ddhs
+    
+    @staticmethod
+    def _make_kernel_tables(tolerance):
+        """Lookup tables for _interpolated_kernel and _critical_bandwidths with the given error bound.
+        The error of linear interpolation with step size s is at most s**2 / 8 * max|f''|."""
+        d = lambda h: h**2 * np.exp(- 8 * h)
+        dd = lambda h: 2 * h * np.exp(- 8 * h) * (1 - 4 * h)
+        # maxima of the absolute values of d and its first three derivatives for h >= 0
+        # (at h = 1/4, h = (2 - sqrt(2)) / 8, h = 0 and h = 0)
+        d_max, dd_max, d2_max, d3_max = d(0.25), abs(dd((2 - np.sqrt(2)) / 8)), 2., 48.
+        step = np.sqrt(8 * tolerance * min(d_max / d2_max, dd_max / d3_max))
+        # end of the table: from here on (where both are decreasing) d and d' are smaller than the tolerance
+        h_max = 0.5
+        while d(h_max) > tolerance * d_max or abs(dd(h_max)) > tolerance * dd_max:
+            h_max += 0.01
+        hs = np.arange(int(np.ceil(h_max / step)) + 2) * step
+        
+        # the critical bandwidth is at least 100 Hz, its second derivative is largest at 0
+        bandwidth = lambda sums: 25 + 75 * (1 + 3.5e-07 * sums**2)**0.69
+        bandwidth_step = np.sqrt(8 * tolerance * 100 / (75 * 1.38 * 3.5e-07))
+        # sums of two audible frequencies
+        bandwidth_max_sum = 50000.
+        sums = np.arange(int(np.ceil(bandwidth_max_sum / bandwidth_step)) + 2) * bandwidth_step
+        
+        tables = {
+            'scale': 1 / step,
+            'dissonance': d(hs),
+            'derivative': dd(hs),
+            'bandwidth_scale': 1 / bandwidth_step,
+            'bandwidth_max_sum': bandwidth_max_sum,
+            'bandwidth': bandwidth(sums)
+        }
+        for name in ['dissonance', 'derivative', 'bandwidth']:
+            tables[name + '_slope'] = np.append(np.diff(tables[name]), 0.)
+        return tables
+    
+    @staticmethod
+    def _critical_band_upper_bound(frequencies):
+        """Upper bound for the frequencies that can form a relevant pair with the given frequencies.
+        A pair of frequencies p <= q is relevant if q - p < 1.46 * cbw(p + q). The left hand side grows faster than
+        the right hand side (as long as p + q is below ~970 kHz), so q is bounded by the fixed point of
+        u = p + 1.46 * cbw(p + u), which we approach from above.
+        """
+        cbw = lambda s: 25 + 75 * (1 + 3.5e-07 * s**2)**0.69
+        upper_bounds = 4 * frequencies + 1000
+        for _ in range(6):
+            upper_bounds = frequencies + 1.46 * cbw(frequencies + upper_bounds)
+        # make sure we did not overshoot the fixed point due to rounding errors
+        upper_bounds = upper_bounds * (1 + 1e-9) + 1e-9
+        # if an upper bound can not be guaranteed, the window extends to the highest frequency
+        uncertain = np.logical_or(upper_bounds - frequencies < 1.46 * cbw(frequencies + upper_bounds),
+                                  len(frequencies) > 0 and 2 * frequencies[-1] > 9e5)
+        return np.where(uncertain, np.inf, upper_bounds)
+    
+    def evaluation_plan(self, nr_tones, partials_pos, critical_bandwidths, volume_factors, relevant_pairs,
+                        compact=None):
+        """Precomputes the index arrays used by dissonance_and_gradient.
+        The frequencies of the partials of all complex tones and the fixed frequencies are stored in one flat array
+        np.concatenate((np.outer(fundamentals_freq, partials_pos).ravel(), fixed_freq)) (with one timbre for all
+        complex tones) or np.concatenate((fundamentals_freq[partial_tones] * values, fixed_freq)) (with the
+        partials_layout of different timbres), so that the frequencies of all relevant pairs can be gathered with two
+        np.take calls.
+        The plan only depends on the quasi-constants, so it has to be computed only once per optimization.
+        
+        Parameters
+        ----------
+        nr_tones : int
+            Number of complex tones.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            complex tone.
+        critical_bandwidths : np.array
+            The critical bandwidths at the mean frequency of every relevant pair. As calculated with quasi_constants.
+        volume_factors : np.array
+            The volume_factor of every relevant pair. As calculated with quasi_constants.
+        relevant_pairs : np.array
+            If [i, k, j, l] in relevant_pairs, then the dissonance of partial k of tone i and partial l of tone 
+            j will be relevant to the calculation of the total dissonance. As calculated with quasi_constants.
+        compact : bool or None
+            If true, the index arrays are stored in the smallest integer type that can hold them and the per-pair
+            floats in float32. If None is given, self.compact_plans is used. (Default value = None)
+            
+        Returns
+        -------
+        plan : dict
+            'nr_tones': number of complex tones,
+            'nr_tone_pairs': number of pairs of two partials, they come first, the pairs of a partial and a fixed
+            frequency come after them,
+            'index1', 'index2': positions of the first and second frequency of every pair in the flat array,
+            'tone1', 'r1s': complex tone and relative position of the first partial of every pair,
+            'tone2', 'r2s': complex tone and relative position of the second partial of every pair of two partials,
+            'critical_bandwidths', 'volume_factors': the quasi-constants in the order of the plan,
+            'partials_pos', 'partial_tones': the relative positions of the partials (one array for all complex tones)
+            and None, or the values of the partials_layout and the complex tone of every value.
+        """
+        if compact is None:
+            compact = self.compact_plans
+        relevant_pairs = np.reshape(relevant_pairs, (-1, 4)).astype(int)
+        offsets, positions = self.partials_layout(nr_tones, partials_pos)
+        
+        # pairs of two partials first, pairs of a partial and a fixed frequency second
+        order = np.argsort(relevant_pairs[:,3] < 0, kind='stable')
+        relevant_pairs = relevant_pairs[order]
+        is_tone_pair = relevant_pairs[:,3] >= 0
+        i, k, j, l = relevant_pairs.T
+        
+        nr_tone_pairs = np.count_nonzero(is_tone_pair)
+        # partial k of tone i is at offsets[i] + k, fixed frequency f after all partials
+        index1 = offsets[i] + k
+        index2 = offsets[-1] + j
+        index2[:nr_tone_pairs] = offsets[j[:nr_tone_pairs]] + l[:nr_tone_pairs]
+        
+        per_tone = self.per_tone(partials_pos)
+        plan = {
+            'nr_tones': nr_tones,
+            'nr_tone_pairs': nr_tone_pairs,
+            'index1': index1,
+            'index2': index2,
+            'tone1': i,
+            'tone2': j[:nr_tone_pairs],
+            'r1s': positions[index1],
+            'r2s': positions[index2[:nr_tone_pairs]],
+            'critical_bandwidths': np.asarray(critical_bandwidths, dtype=float)[order],
+            'volume_factors': np.asarray(volume_factors, dtype=float)[order],
+            'partials_pos': positions if per_tone else np.asarray(partials_pos, dtype=float),
+            'partial_tones': np.repeat(np.arange(nr_tones), np.diff(offsets)) if per_tone else None
+        }
+        if compact:
+            # the largest index is the last fixed frequency
+            index_type = self._index_type(offsets[-1] + max(np.max(j, initial=0) + 1, nr_tones))
+            for key in ('index1', 'index2', 'tone1', 'tone2', 'partial_tones'):
+                if plan[key] is not None:
+                    plan[key] = plan[key].astype(index_type)
+            for key in ('r1s', 'r2s', 'critical_bandwidths', 'volume_factors'):
+                plan[key] = plan[key].astype(np.float32)
+        return plan
+    
+    @staticmethod
+    def _index_type(size):
+        """The smallest of int16, int32 and int64 that can hold the indices 0, ..., size - 1."""
+        for index_type in (np.int16, np.int32):
+            if size <= np.iinfo(index_type).max + 1:
+                return index_type
+        return np.int64
+    
+    @staticmethod
+    def plan_nbytes(plan):
+        """The memory used by the arrays of an evaluation plan.
+        
+        Parameters
+        ----------
+        plan : dict
+            Evaluation plan as calculated with evaluation_plan.
+            
+        Returns
+        -------
+        nbytes : int
+            Total number of bytes of the arrays in the plan.
+        """
+        return sum(value.nbytes for value in plan.values() if isinstance(value, np.ndarray))
+    
+    @staticmethod
+    def _frequencies(fundamentals_freq, fixed_freq, plan):
+        """The flat array of the frequencies of all partials followed by the fixed frequencies, see evaluation_plan."""
+        if plan['partial_tones'] is None:
+            # a row of the outer product corresponds to a complex tone
+            return np.concatenate((np.outer(fundamentals_freq, plan['partials_pos']).ravel(), fixed_freq))
+        return np.concatenate((np.take(fundamentals_freq, plan['partial_tones']) * plan['partials_pos'], fixed_freq))
     
     def dissonance_and_gradient(self, fundamentals_freq, partials_pos, fixed_freq,
-                                critical_bandwidths, volume_factors, relevant_pairs):
+                                critical_bandwidths, volume_factors, relevant_pairs, plan=None):
         """Calculates the dissonance and its (corrected) gradient.
         Calculates the dissonance of the complex tones together with the fixed frequencies
         and its gradient with respect to the fundamental frequencies of the complex tones.
@@ -195,10 +696,9 @@ class Dissonancereduction:
         ----------
         fundamentals_freq : np.array
             Array of fundamental frequencies of the complex tones.
-        partials_pos : np.array
-            Array of relative positions of the partials of the complex tones.
-            Assumes a single timbre for all complex tones, tuning complex tones with different timbres is currently
-            not supported.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            complex tone.
         fixed_freq : np.array
             Array of fixed frequencies, e.g. some other instrument to tune to or frequencies found in environmental noise.
         critical_bandwidths : np.array
@@ -208,6 +708,9 @@ class Dissonancereduction:
         relevant_pairs : np.array
             If [i, k, j, l] in relevant_pairs, then the dissonance of partial k of tone i and partial l of tone 
             j will be relevant to the calculation of the total dissonance. As calculated with quasi_constants.
+        plan : dict
+            Evaluation plan as calculated with evaluation_plan. If given, critical_bandwidths, volume_factors and
+            relevant_pairs are ignored, if None the plan is calculated on the fly. (Default value = None)
             
         Returns
         -------
@@ -216,59 +719,128 @@ class Dissonancereduction:
         gradient : np.array
             Its gradient with respect to the fundamental frequencies of the complex tones.
         """
-
-        # a row corresponds to a complex tone
-        positions = np.outer(fundamentals_freq, partials_pos)
-
-        # all relevant pairs of frequencies of partials
-        args = np.array([
-            [positions[i,k], positions[j,l]] if l >= 0 else [positions[i,k], fixed_freq[j]]
-            for (i, k, j, l) in relevant_pairs
-        ])
-        try:
-            p1s = args[:,0]
-            p2s = args[:,1]
-        except IndexError:
+        if plan is None:
+            plan = self.evaluation_plan(len(fundamentals_freq), partials_pos,
+                                        critical_bandwidths, volume_factors, relevant_pairs)
+        
+        if len(plan['index1']) == 0:
             # no relevant pairs
             return 0, np.zeros(len(fundamentals_freq))
+        
+        # frequencies of all partials followed by the fixed frequencies
+        frequencies = self._frequencies(fundamentals_freq, fixed_freq, plan)
+
+        # all relevant pairs of frequencies
+        p1s = np.take(frequencies, plan['index1'])
+        p2s = np.take(frequencies, plan['index2'])
+        critical_bandwidths = plan['critical_bandwidths']
+        volume_factors = plan['volume_factors']
 
         # differences between frequencies in critical bandwidth
         hs = np.abs(p1s - p2s) / critical_bandwidths
 
-        # dissonances (roughness / beating) for pairs of simple tones
-        ds = hs**2 * np.exp(- 8 * hs)
+        if self._kernel_tables is None:
+            # dissonances (roughness / beating) for pairs of simple tones
+            ds = hs**2 * np.exp(- 8 * hs)
+            # calculate gradients:
+            dhdcs = volume_factors \
+                    * 2 * hs * np.exp(- 8 * hs) * (1 - 4 * hs) \
+                    * np.where(p1s > p2s, 1., -1.) / critical_bandwidths
+        else:
+            # the same from the lookup tables
+            ds, ddhs = self._interpolated_kernel(hs)
+            dhdcs = volume_factors * ddhs * np.where(p1s > p2s, 1., -1.) / critical_bandwidths
 
         total_dissonance = np.sum(ds * volume_factors)
 
-        # calculate gradients:
+        # gradients with respect to fundamental of the first and the second partial of the pair
+        # (0.5 * (p2s / p1s - 1) + 1) is the correction factor to prevent the "higher is better" behavior
+        # p2/p1 is the interval from the perspective of p1
+        simple_grads1 = dhdcs * plan['r1s'] * (0.5 * (p2s / p1s - 1) + 1)
+        # p1/p2 is the interval from the perspective of p2, fixed frequencies have no gradient
+        n = plan['nr_tone_pairs']
+        simple_grads2 = dhdcs[:n] * plan['r2s'] * (0.5 * (p1s[:n] / p2s[:n] - 1) + 1)
+
+        # sum all simple gradients where complex tone i is involved (scatter-add, linear in the number of pairs)
+        gradient = np.bincount(plan['tone1'], weights=simple_grads1, minlength=plan['nr_tones']) \
+                   - np.bincount(plan['tone2'], weights=simple_grads2, minlength=plan['nr_tones'])
+
+        return total_dissonance, gradient
+
+    def dissonance_hessian(self, fundamentals_freq, partials_pos, fixed_freq,
+                           critical_bandwidths, volume_factors, relevant_pairs, plan=None):
+        """Calculates the Hessian belonging to the (corrected) gradient.
+        The Hessian is the Jacobian of the corrected gradient calculated by dissonance_and_gradient, symmetrized.
+        Every relevant pair only contributes to the four entries of the complex tones it belongs to,
+        so the Hessian is as sparse as the graph of complex tones that have relevant pairs.
+
+        Parameters
+        ----------
+        See parameters of dissonance_and_gradient
+
+        Returns
+        -------
+        hessian : np.array
+            Symmetric matrix of second derivatives with respect to the fundamental frequencies of the complex tones.
+        """
+        if plan is None:
+            plan = self.evaluation_plan(len(fundamentals_freq), partials_pos,
+                                        critical_bandwidths, volume_factors, relevant_pairs)
+        nr_tones = plan['nr_tones']
+
+        if len(plan['index1']) == 0:
+            # no relevant pairs
+            return np.zeros((nr_tones, nr_tones))
+
+        frequencies = self._frequencies(fundamentals_freq, fixed_freq, plan)
+        p1s = np.take(frequencies, plan['index1'])
+        p2s = np.take(frequencies, plan['index2'])
+        critical_bandwidths = plan['critical_bandwidths']
+        volume_factors = plan['volume_factors']
+        r1s = plan['r1s']
+
+        hs = np.abs(p1s - p2s) / critical_bandwidths
+
+        # first and second derivative of the dissonance of a pair with respect to p1
         dhdcs = volume_factors \
                 * 2 * hs * np.exp(- 8 * hs) * (1 - 4 * hs) \
-                * np.where(p1s > p2s, np.ones(len(p1s)), -1 * np.ones(len(p1s))) / critical_bandwidths
+                * np.where(p1s > p2s, 1., -1.) / critical_bandwidths
+        d2hdcs = volume_factors * np.exp(- 8 * hs) * (2 - 32 * hs + 64 * hs**2) / critical_bandwidths**2
 
-        # positions of the partials of the relevant pairs relative to their fundamental,
-        # partials_pos should be a np.array
-        try:
-            r1s = partials_pos[relevant_pairs[:,1]]
-            r2s = np.where(relevant_pairs[:,3] >= 0, partials_pos[relevant_pairs[:,3]], 0.)
-        except TypeError:
-            partials_pos = np.array(partials_pos)
-            r1s = partials_pos[relevant_pairs[:,1]]
-            r2s = np.where(relevant_pairs[:,3] >= 0, partials_pos[relevant_pairs[:,3]], 0.)
+        # simple_grads1 = dhdcs * r1 * corrections1, see dissonance_and_gradient
+        corrections1 = 0.5 * (p2s / p1s - 1) + 1
+        dg1dx1 = r1s**2 * (d2hdcs * corrections1 - 0.5 * dhdcs * p2s / p1s**2)
 
-        # gradients with respect to fundamental of the first and the second partial of the pair
-        # (0.5 * (p2s / p1s - 1) + 1) is the correction factor to prevent the "higher is better" behavior
-        simple_grads1 = dhdcs * r1s * (0.5 * (p2s / p1s - 1) + 1)  # p2/p1 is the interval from the perspective of p1
-        simple_grads2 = dhdcs * r2s * (0.5 * (p1s / p2s - 1) + 1)  # p1/p2 is the interval from the perspective of p2
-    
+        # pairs of two partials also depend on the second fundamental
+        n = plan['nr_tone_pairs']
+        tone1, tone2 = plan['tone1'][:n], plan['tone2']
+        p1s, p2s, dhdcs, d2hdcs, r1s, r2s = p1s[:n], p2s[:n], dhdcs[:n], d2hdcs[:n], r1s[:n], plan['r2s']
+        corrections1 = corrections1[:n]
+        corrections2 = 0.5 * (p1s / p2s - 1) + 1
+        dg1dx2 = r1s * r2s * (- d2hdcs * corrections1 + 0.5 * dhdcs / p1s)
+        dg2dx1 = r1s * r2s * (d2hdcs * corrections2 + 0.5 * dhdcs / p2s)
+        dg2dx2 = r2s**2 * (- d2hdcs * corrections2 - 0.5 * dhdcs * p1s / p2s**2)
 
-        # sum all simple gradients where complex tone i is involved
-        gradient = np.array([np.sum(simple_grads1[relevant_pairs[:,0] == i]) 
-                             - np.sum(simple_grads2[relevant_pairs[:,2] == i])
-                    for i in range(len(fundamentals_freq))])
+        # the gradient is sum(simple_grads1) over tone1 - sum(simple_grads2) over tone2
+        rows = np.concatenate((plan['tone1'], tone1, tone2, tone2))
+        columns = np.concatenate((plan['tone1'], tone2, tone1, tone2))
+        entries = np.concatenate((dg1dx1, dg1dx2, - dg2dx1, - dg2dx2))
+        jacobian = np.bincount(rows * nr_tones + columns, weights=entries,
+                               minlength=nr_tones**2).reshape(nr_tones, nr_tones)
 
-        return total_dissonance, gradient
+        return 0.5 * (jacobian + jacobian.T)
+
+    def _pair_dissonances(self, fundamentals_freq, partials_pos, fixed_freq, plan):
+        """The dissonance of every relevant pair (in the order of the evaluation plan), weighted by its volume factor."""
+        frequencies = self._frequencies(fundamentals_freq, fixed_freq, plan)
+        hs = np.abs(np.take(frequencies, plan['index1']) - np.take(frequencies, plan['index2'])) \
+             / plan['critical_bandwidths']
+        if self._kernel_tables is not None:
+            return self._interpolated_kernel(hs)[0] * plan['volume_factors']
+        return hs**2 * np.exp(- 8 * hs) * plan['volume_factors']
         
-    def tune(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[]):
+    def tune(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[],
+             initial_freq=None, quasi_constants=None, time_budget=None, tie_groups=None, should_stop=None):
         """Tune a set of complex tones.
         Tune a set of complex tones to minimize the dissonance it produces together with a set of fixed frequencies.
         
@@ -278,26 +850,49 @@ class Dissonancereduction:
             Array of fundamental frequencies of the complex tones.
         fundamentals_amp : np.array
             Array of amplitudes of the complex tones.
-        partials_pos : np.array
-            Array of relative positions of the partials of the complex tones.
-            Assumes a single timbre for all complex tones, tuning complex tones with different timbres is currently
-            not supported.
-        partials_amp : np.array
-            Array of relative amplitudes of the partials of the complex tones.
-            Assumes a single timbre for all complex tones, tuning complex tones with different timbres is currently
-            not supported.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones (one timbre for all complex tones)
+            or a list with one such array per complex tone (every complex tone has its own timbre).
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            complex tone, like partials_pos.
         fixed_freq : np.array
             Array of fixed frequencies, e.g. some other instrument to tune to or frequencies found in environmental noise.
             (Default value = [])
         fixed_amp : np.array
             Array of amplitudes for the fixed frequencies. (Default value = [])
+        initial_freq : np.array
+            Fundamental frequencies to start the optimization from, e.g. the result of the last tuning (warm start).
+            The bounds are still relative to fundamentals_freq.
+            If None is given, the optimization starts from fundamentals_freq. (Default value = None)
+        quasi_constants : tuple
+            (relevant_pairs, critical_bandwidths, volume_factors) as calculated with quasi_constants,
+            if they are already known. If None is given, they are calculated. (Default value = None)
+        time_budget : float
+            Wall-clock time (in seconds) the tuning may take. When it is used up, the optimization is stopped and
+            the best frequencies found so far are returned with res.success = False and
+            res.message = b'TIME BUDGET EXCEEDED'. If None is given, there is no time limit. (Default value = None)
+        tie_groups : str or list or None
+            Complex tones that move together, see tie_labels. Tied complex tones keep their intervals, the optimization
+            has only one variable per tie group. If None is given, every complex tone is tuned on its own.
+            (Default value = None)
+        should_stop : callable or None
+            Function without arguments that is called before every evaluation of the dissonance. If it returns true,
+            e.g. because the chord changed and the result is not needed anymore, the optimization is stopped and the
+            best frequencies found so far are returned with res.success = False and res.message = b'STOPPED'.
+            Groups of independent complex tones that are optimized in an executor other than a
+            concurrent.futures.ThreadPoolExecutor are not stopped, it is not sent to other processes.
+            If None is given, the optimization is not stopped.
+            (Default value = None)
             
         Returns
         -------
         res : scipy.optimize.optimize.OptimizeResult
             Result of the optimization, see scipy.optimize.optimize.OptimizeResult.
-            res.x contains the tuned fundamental frequencies.
+            res.x contains the tuned fundamental frequencies, res.success whether the optimization converged.
         """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        
         # If there are no fundamentals, dissonance is 0
         # If there is only one fundamental and no fixed frequencies, dissonance is 0
         if len(fundamentals_freq) == 0:
@@ -314,28 +909,438 @@ class Dissonancereduction:
             }
             return res
         
-        relevant_pairs, critical_bandwidths, volume_factors = self.quasi_constants(
-            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+        if self.coarse_partials is None:
+            return self._tune(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                              initial_freq, quasi_constants, deadline, tie_groups, should_stop)
+        
+        # coarse-to-fine: every stage starts from the result of the stage with fewer partials
+        nfev_stages, nit = [], 0
+        for nr_partials in self.coarse_partials:
+            coarse_pos, coarse_amp = self.loudest_partials(partials_pos, partials_amp, nr_partials)
+            if len(self.partials_layout(len(fundamentals_freq), coarse_pos)[1]) \
+                    == len(self.partials_layout(len(fundamentals_freq), partials_pos)[1]):
+                # not coarser than the full timbre
+                continue
+            res = self._tune(fundamentals_freq, fundamentals_amp, coarse_pos, coarse_amp, fixed_freq, fixed_amp,
+                             initial_freq, None, deadline, tie_groups, should_stop)
+            initial_freq = res['x']
+            nfev_stages.append(res['nfev'])
+            nit += res['nit']
+        res = self._tune(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                         initial_freq, quasi_constants, deadline, tie_groups, should_stop)
+        nfev_stages.append(res['nfev'])
+        res['nfev'] = sum(nfev_stages)
+        res['nit'] += nit
+        res['nfev_stages'] = nfev_stages
+        return res
+    
+    def _tune(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+              initial_freq, quasi_constants, deadline, tie_groups, should_stop=None):
+        """A single optimization of tune with the given timbres."""
+        if quasi_constants is None:
+            quasi_constants = self.quasi_constants(
+                fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+            )
+        relevant_pairs, critical_bandwidths, volume_factors = quasi_constants
+        
+        if initial_freq is None:
+            initial_freq = fundamentals_freq
+        fundamentals_freq = np.asarray(fundamentals_freq, dtype=float)
+        initial_freq = np.asarray(initial_freq, dtype=float)
+        fixed_freq = np.asarray(fixed_freq, dtype=float)
+        tie_labels = self.tie_labels(fundamentals_freq, tie_groups)
+        
+        if self.decompose:
+            components = self.tone_components(len(fundamentals_freq), relevant_pairs, tie_labels)
+            if len(components) > 1:
+                return self._tune_components(components, fundamentals_freq, initial_freq, partials_pos, fixed_freq,
+                                             quasi_constants, deadline, tie_labels, should_stop)
+        
+        return self._tune_quasi_constants(fundamentals_freq, initial_freq, partials_pos, fixed_freq,
+                                          quasi_constants, deadline, tie_labels, should_stop)
+    
+    def _tune_quasi_constants(self, fundamentals_freq, initial_freq, partials_pos, fixed_freq, quasi_constants,
+                              deadline=None, tie_labels=None, should_stop=None):
+        """The optimization of tune once the quasi-constants are known."""
+        relevant_pairs, critical_bandwidths, volume_factors = quasi_constants
+        
+        if len(relevant_pairs) == 0:
+            # nothing to optimize, dissonance is 0
+            return scipy.optimize.OptimizeResult(
+                fun=0,
+                jac=np.zeros(len(fundamentals_freq)),
+                message=b'NO RELEVANT PAIRS',
+                nfev=0,
+                nit=0,
+                status=0,
+                success=True,
+                x=np.array(initial_freq, dtype=float)
+            )
+        
+        # everything but the frequencies is constant during the optimization
+        plan = self.evaluation_plan(len(fundamentals_freq), partials_pos,
+                                    critical_bandwidths, volume_factors, relevant_pairs)
+        
+        objective = lambda fs: self.dissonance_and_gradient(
+            fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan
+        )
+        hessian = lambda fs: self.dissonance_hessian(
+            fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan
         )
+        
+        if tie_labels is not None and len(np.unique(tie_labels)) < len(fundamentals_freq):
+            return self._minimize_tied(objective, hessian, initial_freq, fundamentals_freq, tie_labels, deadline,
+                                       should_stop)
+        
+        res = self._minimize(objective, hessian, initial_freq, fundamentals_freq, deadline, should_stop=should_stop)
 
-        if self.relative_bounds is None:
-            bounds = None
+        return res
+    
+    def _minimize_tied(self, objective, hessian, x0, reference, tie_labels, deadline=None, should_stop=None):
+        """_minimize with one variable per tie group.
+        The variable of a group is the frequency of its lowest complex tone (the representative), every other complex
+        tone of the group is the representative times its ratio to the representative in reference,
+        so fs = T @ ys with T[i, g] = reference[i] / reference[representative of g] if i is in g, else 0.
+        The gradient is T.T @ gradient (the gradient summed per group), the Hessian T.T @ hessian @ T.
+        The starting point is x0 of the representatives, res.x and res.jac are given for all complex tones.
+        """
+        x0 = np.asarray(x0, dtype=float)
+        reference = np.asarray(reference, dtype=float)
+        _, representatives, labels = np.unique(tie_labels, return_index=True, return_inverse=True)
+        nr_groups = len(representatives)
+        ratios = reference / reference[representatives][labels]
+        ties = np.zeros((len(reference), nr_groups))
+        ties[np.arange(len(reference)), labels] = ratios
+        
+        to_freq = lambda ys: ys[labels] * ratios
+        def tied_objective(ys):
+            dissonance, gradient = objective(to_freq(ys))
+            return dissonance, np.bincount(labels, weights=gradient * ratios, minlength=nr_groups)
+        tied_hessian = lambda ys: ties.T @ hessian(to_freq(ys)) @ ties
+        
+        res = self._minimize(tied_objective, tied_hessian, x0[representatives], reference[representatives], deadline,
+                             should_stop=should_stop)
+        res['x'] = to_freq(res['x'])
+        res['fun'], res['jac'] = objective(res['x'])
+        res['nr_tie_groups'] = nr_groups
+        return res
+    
+    def _tune_components(self, components, fundamentals_freq, initial_freq, partials_pos, fixed_freq,
+                         quasi_constants, deadline=None, tie_labels=None, should_stop=None):
+        """Tune every group of independent complex tones on its own (in the executor, if there is one)
+        and put the results together in the original order.
+        nfev is the total number of evaluations, nit the largest number of iterations of all groups."""
+        if self.executor is not None and not isinstance(self.executor, concurrent.futures.ThreadPoolExecutor):
+            # should_stop can only be asked in this process (it is usually a bound method of an object with locks)
+            should_stop = None
+        arguments = []
+        for tones in components:
+            others = np.setdiff1d(np.arange(len(fundamentals_freq)), tones, assume_unique=True)
+            arguments.append((fundamentals_freq[tones], initial_freq[tones], self._select_timbres(partials_pos, tones),
+                              fixed_freq, self.remove_tones(*quasi_constants, others), deadline,
+                              None if tie_labels is None else tie_labels[tones], should_stop))
+        if self.executor is None:
+            results = [self._tune_quasi_constants(*args) for args in arguments]
         else:
-            bounds = [(f * self.relative_bounds[0], f * self.relative_bounds[1]) for f in fundamentals_freq]
-        
-        res = scipy.optimize.minimize(
-            lambda fs: self.dissonance_and_gradient(
-                fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs
-            ),
-            fundamentals_freq,
-            method=self.method,
-            bounds=bounds,
-            options=self.options,
-            jac=True
+            futures = [self.executor.submit(self._tune_quasi_constants, *args) for args in arguments]
+            results = [future.result() for future in futures]
+        
+        x = np.array(initial_freq, dtype=float)
+        jac = np.zeros(len(fundamentals_freq))
+        for tones, res in zip(components, results):
+            x[tones] = res['x']
+            jac[tones] = res['jac']
+        failed = [res for res in results if not res['success']]
+        return scipy.optimize.OptimizeResult(
+            fun=sum(res['fun'] for res in results),
+            jac=jac,
+            message=failed[0]['message'] if failed else results[0]['message'],
+            nfev=sum(res['nfev'] for res in results),
+            nit=max(res['nit'] for res in results),
+            status=failed[0]['status'] if failed else 0,
+            success=len(failed) == 0,
+            x=x,
+            nr_components=len(components)
         )
-
+    
+    def tune_multistart(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[],
+                        fixed_amp=[], tunings=('Natural (JI)',), nr_random=4, seed=None, tie_groups=None):
+        """Tune a set of complex tones from several starting points and return the best result.
+        tune only finds a local minimum near its starting point, which is not always a good one (e.g. for clusters).
+        The starting points are the given fundamental frequencies (usually 12TET), the given tunings with every pitch
+        class of the chord as tonic and random points within the bounds. The quasi-constants are calculated once,
+        the optimizations run concurrently in the executor if there is one. Use a
+        concurrent.futures.ProcessPoolExecutor as executor and keep it for all chords, so the worker processes are
+        started only once.
+        
+        Parameters
+        ----------
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp, tie_groups
+            See parameters of tune
+        tunings : list of str
+            Names of tunings in Scale.tunings_in_cents (cents of the 12 pitch classes above the tonic) that are used
+            as starting points. Every pitch class of the chord (rounded to 12TET) is used as tonic once, the starting
+            points are clipped to the bounds. (Default value = ('Natural (JI)',))
+        nr_random : int
+            Number of starting points drawn uniformly (in cents) within the bounds, or within 1/3 semitone up and down
+            if relative_bounds is None. (Default value = 4)
+        seed : int
+            Seed for the random starting points. (Default value = None)
+            
+        Returns
+        -------
+        res : scipy.optimize.optimize.OptimizeResult
+            The result of tune with the lowest dissonance. In addition res.fun_starts and res.nfev_starts contain the
+            dissonance and the number of evaluations of every starting point, res.best_start the index of the best.
+        """
+        fundamentals_freq = np.asarray(fundamentals_freq, dtype=float)
+        quasi_constants = self.quasi_constants(
+            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+        )
+        
+        # starting points in cents relative to fundamentals_freq
+        relative_bounds = (2**(-1/36), 2**(1/36)) if self.relative_bounds is None else self.relative_bounds
+        lower, upper = 1200 * np.log2(relative_bounds)
+        semitones = np.round(12 * np.log2(fundamentals_freq / 440)).astype(int)
+        starts = [np.zeros(len(fundamentals_freq))]
+        for tuning in tunings:
+            deviations = np.array(Scale.tunings_in_cents[tuning]) - 100 * np.arange(12)
+            for tonic in np.unique(np.mod(semitones, 12)):
+                starts.append(np.clip(deviations[np.mod(semitones - tonic, 12)] - deviations[0], lower, upper))
+        rng = np.random.default_rng(seed)
+        starts += [rng.uniform(lower, upper, len(fundamentals_freq)) for _ in range(nr_random)]
+        
+        # the copy has no executor, so the starts don't wait for each other in the same executor
+        worker = copy.copy(self)
+        arguments = [(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                      fundamentals_freq * 2**(cents / 1200), quasi_constants, None, tie_groups) for cents in starts]
+        if self.executor is None:
+            results = [worker.tune(*args) for args in arguments]
+        else:
+            futures = [self.executor.submit(worker.tune, *args) for args in arguments]
+            results = [future.result() for future in futures]
+        
+        funs = [res['fun'] for res in results]
+        best = int(np.argmin(funs))
+        res = results[best]
+        res['fun_starts'] = np.array(funs)
+        res['nfev_starts'] = np.array([r['nfev'] for r in results])
+        res['best_start'] = best
+        return res
+    
+    def tune_batch(self, chords, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[], ftol=2.2e-09, gtol=1e-5):
+        """Tune many independent sets of complex tones at once.
+        All chords are stacked into a single block-diagonal problem: the fundamentals of all chords form one
+        optimization variable and the relevant pairs of every chord only refer to its own tones and fixed frequencies.
+        So there is only one optimization with one vectorized objective and gradient instead of one per chord,
+        which pays off for offline work with many small chords.
+        
+        Parameters
+        ----------
+        chords : list
+            List of chords, every chord is a tuple (fundamentals_freq, fundamentals_amp) or
+            (fundamentals_freq, fundamentals_amp, fixed_freq, fixed_amp). If a chord does not provide its own fixed
+            frequencies, the shared fixed_freq and fixed_amp are used.
+        partials_pos : np.array
+            Array of relative positions of the partials of the complex tones.
+            Assumes a single timbre for all complex tones of all chords.
+        partials_amp : np.array
+            Array of relative amplitudes of the partials of the complex tones.
+            Assumes a single timbre for all complex tones of all chords.
+        fixed_freq : np.array
+            Array of fixed frequencies shared by all chords that do not provide their own. (Default value = [])
+        fixed_amp : np.array
+            Array of amplitudes for the shared fixed frequencies. (Default value = [])
+        ftol : float
+            A chord counts as converged if its dissonance changed by less than ftol * max(|dissonance|, 1)
+            in the last iteration of the joint optimization... (Default value = 2.2e-09, like L-BFGS-B)
+        gtol : float
+            ...or if the largest component of its projected gradient is smaller than gtol.
+            (Default value = 1e-5, like L-BFGS-B)
+            
+        Returns
+        -------
+        results : list of dict
+            One result per chord, in the order of chords. Every result has the same keys as the result of tune:
+            'x' contains the tuned fundamental frequencies, 'fun' and 'jac' the dissonance and gradient of the chord,
+            'success' whether the chord converged, 'nit' and 'nfev' are the counts of the joint optimization.
+        """
+        for chord in chords:
+            if len(chord) not in (2, 4):
+                raise ValueError("a chord has to be (fundamentals_freq, fundamentals_amp) or "
+                                 "(fundamentals_freq, fundamentals_amp, fixed_freq, fixed_amp), got a tuple of "
+                                 "length {}".format(len(chord)))
+        chords = [(np.asarray(chord[0], dtype=float), np.asarray(chord[1], dtype=float),
+                   np.asarray(chord[2] if len(chord) > 2 else fixed_freq, dtype=float),
+                   np.asarray(chord[3] if len(chord) > 3 else fixed_amp, dtype=float))
+                  for chord in chords]
+        if len(chords) == 0:
+            return []
+        
+        # stack the quasi-constants of all chords, shifting the indices of tones and fixed frequencies
+        tone_offsets = np.cumsum([0] + [len(chord[0]) for chord in chords])
+        fixed_offsets = np.cumsum([0] + [len(chord[2]) for chord in chords])
+        relevant_pairs, critical_bandwidths, volume_factors = [], [], []
+        for c, chord in enumerate(chords):
+            pairs, bandwidths, factors = self.quasi_constants(chord[0], chord[1], partials_pos, partials_amp,
+                                                              chord[2], chord[3])
+            pairs = np.reshape(pairs, (-1, 4)).astype(int)
+            pairs[:,0] += tone_offsets[c]
+            pairs[:,2] += np.where(pairs[:,3] >= 0, tone_offsets[c], fixed_offsets[c])
+            relevant_pairs.append(pairs)
+            critical_bandwidths.append(bandwidths)
+            volume_factors.append(factors)
+        relevant_pairs = np.concatenate(relevant_pairs)
+        critical_bandwidths = np.concatenate(critical_bandwidths)
+        volume_factors = np.concatenate(volume_factors)
+        
+        fundamentals_freq = np.concatenate([chord[0] for chord in chords])
+        fixed_freq = np.concatenate([chord[2] for chord in chords])
+        plan = self.evaluation_plan(len(fundamentals_freq), partials_pos,
+                                    critical_bandwidths, volume_factors, relevant_pairs)
+        chord_of_tone = np.repeat(np.arange(len(chords)), np.diff(tone_offsets))
+        chord_of_pair = chord_of_tone[plan['tone1']]
+        chord_dissonances = lambda fs: np.bincount(
+            chord_of_pair, weights=self._pair_dissonances(fs, partials_pos, fixed_freq, plan), minlength=len(chords)
+        )
+        
+        # the dissonance of every chord after every iteration to judge the convergence of the single chords
+        history = [chord_dissonances(fundamentals_freq)]
+        
+        if len(fundamentals_freq) == 0:
+            res = {'x': fundamentals_freq, 'success': True, 'message': b'NO OPTIMIZATION VARIABLE',
+                   'status': 0, 'nit': 0, 'nfev': 0}
+        else:
+            res = self._minimize(
+                lambda fs: self.dissonance_and_gradient(
+                    fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan
+                ),
+                lambda fs: self.dissonance_hessian(
+                    fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan
+                ),
+                fundamentals_freq,
+                fundamentals_freq,
+                callback=lambda fs: history.append(chord_dissonances(fs))
+            )
+        
+        dissonances = chord_dissonances(res['x'])
+        _, gradient = self.dissonance_and_gradient(
+            res['x'], partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan
+        )
+        last_change = np.abs(history[-1] - history[-2]) if len(history) > 1 else np.zeros(len(chords))
+        # gradient components that point out of the bounds don't count
+        projected_gradient = gradient
+        bounds = self._bounds(fundamentals_freq)
+        if bounds is not None and len(fundamentals_freq) > 0:
+            lower, upper = np.array(bounds).T
+            projected_gradient = np.where(np.logical_or(np.logical_and(res['x'] <= lower, gradient > 0),
+                                                        np.logical_and(res['x'] >= upper, gradient < 0)),
+                                          0., gradient)
+        largest_gradient = np.zeros(len(chords))
+        np.maximum.at(largest_gradient, chord_of_tone, np.abs(projected_gradient))
+        converged = np.logical_or(last_change <= ftol * np.maximum(np.abs(dissonances), 1), largest_gradient < gtol)
+        
+        results = []
+        for c in range(len(chords)):
+            tones = slice(tone_offsets[c], tone_offsets[c + 1])
+            results.append({
+                  'fun': dissonances[c],
+                  'jac': gradient[tones],
+              'message': res['message'] if converged[c] else b'CHORD DID NOT CONVERGE',
+                 'nfev': res['nfev'],
+                  'nit': res['nit'],
+               'status': res['status'] if converged[c] else 1,
+              'success': bool(converged[c]),
+                    'x': res['x'][tones]
+            })
+        return results
+    
+    def _minimize(self, objective, hessian, x0, reference, deadline=None, callback=None, should_stop=None):
+        """scipy.optimize.minimize with the settings of this object that can be interrupted.
+        objective and hessian are functions of the fundamental frequencies, the bounds are relative to reference.
+        If parametrization is "cents", the optimization runs over the deviations from reference in cents,
+        the result is converted back to Hz.
+        Every evaluation of the objective is tracked, if the optimization is interrupted because the deadline
+        (in time.monotonic time) passed or should_stop returned true, the best evaluated point is returned.
+        """
+        reference = np.asarray(reference, dtype=float)
+        bounds = self._bounds(reference)
+        if self.parametrization == "cents":
+            # f = reference * 2**(c / 1200), df/dc = f * scale
+            scale = np.log(2) / 1200
+            to_freq = lambda cs: reference * 2**(cs / 1200)
+            to_jac = lambda fs, jac: jac / (fs * scale)
+            x0 = 1200 * np.log2(np.asarray(x0, dtype=float) / reference)
+            if bounds is not None:
+                bounds = [tuple(1200 * np.log2(self.relative_bounds))] * len(reference)
+            def parametrized_objective(cs):
+                fs = to_freq(cs)
+                fun, jac = objective(fs)
+                return fun, jac * fs * scale
+            def parametrized_hessian(cs):
+                fs = to_freq(cs)
+                _, jac = objective(fs)
+                return np.outer(fs, fs) * scale**2 * hessian(fs) + np.diag(jac * fs * scale**2)
+        else:
+            to_freq = lambda fs: fs
+            to_jac = lambda fs, jac: jac
+            parametrized_objective = objective
+            parametrized_hessian = lambda fs: hessian(fs)
+        
+        best = {'fun': np.inf, 'jac': None, 'x': np.array(x0, dtype=float), 'nfev': 0, 'nit': 0}
+        
+        def tracked_objective(x):
+            if best['nfev'] > 0:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise _Interruption(b'TIME BUDGET EXCEEDED')
+                if should_stop is not None and should_stop():
+                    raise _Interruption(b'STOPPED')
+            fun, jac = parametrized_objective(x)
+            best['nfev'] += 1
+            if fun < best['fun']:
+                best['fun'], best['jac'], best['x'] = fun, jac, np.array(x, dtype=float)
+            return fun, jac
+        
+        def count_iterations(*args):
+            best['nit'] += 1
+            if callback is not None:
+                callback(to_freq(np.asarray(args[0])))
+        
+        try:
+            res = scipy.optimize.minimize(
+                tracked_objective,
+                x0,
+                method=self.method,
+                bounds=bounds,
+                options=self.options,
+                jac=True,
+                hess=parametrized_hessian if self.method.lower() in self.hessian_methods else None,
+                callback=count_iterations
+            )
+        except _Interruption as interruption:
+            res = scipy.optimize.OptimizeResult(
+                fun=best['fun'],
+                jac=best['jac'],
+                message=interruption.args[0],
+                nfev=best['nfev'],
+                nit=best['nit'],
+                status=-1,
+                success=False,
+                x=best['x']
+            )
+        if 'nit' not in res:
+            res['nit'] = best['nit']
+        res['x'] = to_freq(np.asarray(res['x']))
+        if res['jac'] is not None:
+            res['jac'] = to_jac(res['x'], np.asarray(res['jac']))
         return res
     
+    def _bounds(self, fundamentals_freq):
+        """Bounds for the optimization of the given fundamental frequencies according to relative_bounds."""
+        if self.relative_bounds is None:
+            return None
+        return [(f * self.relative_bounds[0], f * self.relative_bounds[1]) for f in fundamentals_freq]
+    
     def single_dissonance_and_gradient(self, fundamentals_freq, fundamentals_amp, 
                                        partials_pos, partials_amp, fixed_freq=[], fixed_amp=[]):
         """Calculates the dissonance and its (corrected) gradient.
@@ -362,4 +1367,109 @@ class Dissonancereduction:
                 fundamentals_freq, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs
         )
         return dissonance, gradient
-        
\ No newline at end of file
+    
+    def dissonance_many(self, candidates, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[],
+                        reference_freq=None, gradient=True, chunk_size=None):
+        """Calculates the dissonance and its (corrected) gradient for many candidate tunings of the same complex tones.
+        The quasi-constants are calculated once for reference_freq and all candidates are evaluated with them
+        in one vectorized pass (per chunk of candidates), e.g. to compare a tuning with 12TET and just intonation.
+        Like during tune, this is only technically valid if the candidates differ from reference_freq by significantly
+        less than 1/2 semitone.
+        
+        Parameters
+        ----------
+        candidates : np.array
+            Matrix of fundamental frequencies, every row is a candidate tuning of the complex tones.
+        fundamentals_amp : np.array
+            Array of amplitudes of the complex tones.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            complex tone.
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            complex tone.
+        fixed_freq : np.array
+            Array of fixed frequencies, e.g. some other instrument to tune to or frequencies found in environmental noise.
+            (Default value = [])
+        fixed_amp : np.array
+            Array of amplitudes for the fixed frequencies. (Default value = [])
+        reference_freq : np.array
+            Fundamental frequencies the quasi-constants are calculated for.
+            If None is given, the first candidate is used. (Default value = None)
+        gradient : bool
+            If false, only the dissonances are calculated. (Default value = True)
+        chunk_size : int
+            Number of candidates evaluated at once, limits the memory used.
+            If None is given, chunks of about 2**14 pairs of frequencies are used, small enough to stay in the cache.
+            (Default value = None)
+            
+        Returns
+        -------
+        dissonances : np.array
+            The total dissonance of every candidate together with the fixed frequencies.
+        gradients : np.array or None
+            Matrix of the gradients with respect to the fundamental frequencies of every candidate,
+            None if gradient is false.
+        """
+        candidates = np.asarray(candidates, dtype=float)
+        if candidates.ndim == 1:
+            candidates = candidates[np.newaxis, :]
+        nr_candidates, nr_tones = candidates.shape
+        fixed_freq = np.asarray(fixed_freq, dtype=float)
+        dissonances = np.zeros(nr_candidates)
+        gradients = np.zeros((nr_candidates, nr_tones)) if gradient else None
+        if nr_candidates == 0:
+            return dissonances, gradients
+        
+        if reference_freq is None:
+            reference_freq = candidates[0]
+        relevant_pairs, critical_bandwidths, volume_factors = self.quasi_constants(
+            reference_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+        )
+        if len(relevant_pairs) == 0:
+            return dissonances, gradients
+        plan = self.evaluation_plan(nr_tones, partials_pos, critical_bandwidths, volume_factors, relevant_pairs)
+        critical_bandwidths = plan['critical_bandwidths']
+        volume_factors = plan['volume_factors']
+        n = plan['nr_tone_pairs']
+        if chunk_size is None:
+            chunk_size = max(1, 2**14 // len(plan['index1']))
+        
+        for start in range(0, nr_candidates, chunk_size):
+            fundamentals = candidates[start:start + chunk_size]
+            rows = len(fundamentals)
+            # one row of frequencies (partials followed by the fixed frequencies) per candidate
+            if plan['partial_tones'] is None:
+                partials = (fundamentals[:, :, np.newaxis] * plan['partials_pos']).reshape(rows, -1)
+            else:
+                partials = np.take(fundamentals, plan['partial_tones'], axis=1) * plan['partials_pos']
+            frequencies = np.concatenate((partials, np.broadcast_to(fixed_freq, (rows, len(fixed_freq)))), axis=1)
+            p1s = np.take(frequencies, plan['index1'], axis=1)
+            p2s = np.take(frequencies, plan['index2'], axis=1)
+            hs = np.abs(p1s - p2s) / critical_bandwidths
+            
+            if self._kernel_tables is None:
+                exps = np.exp(- 8 * hs)
+                ds = hs**2 * exps
+            else:
+                ds, ddhs = self._interpolated_kernel(hs)
+            dissonances[start:start + rows] = ds @ volume_factors
+            if not gradient:
+                continue
+            
+            # see dissonance_and_gradient
+            if self._kernel_tables is None:
+                ddhs = 2 * hs * exps * (1 - 4 * hs)
+            dhdcs = volume_factors * ddhs * np.where(p1s > p2s, 1., -1.) / critical_bandwidths
+            simple_grads1 = dhdcs * plan['r1s'] * (0.5 * (p2s / p1s - 1) + 1)
+            simple_grads2 = dhdcs[:, :n] * plan['r2s'] * (0.5 * (p1s[:, :n] / p2s[:, :n] - 1) + 1)
+            # scatter-add into one block of nr_tones entries per candidate
+            offsets = np.arange(rows)[:, np.newaxis] * nr_tones
+            gradients[start:start + rows] = (
+                np.bincount((offsets + plan['tone1']).ravel(), weights=simple_grads1.ravel(),
+                            minlength=rows * nr_tones)
+                - np.bincount((offsets + plan['tone2']).ravel(), weights=simple_grads2.ravel(),
+                              minlength=rows * nr_tones)
+            ).reshape(rows, nr_tones)
+        
+        return dissonances, gradients
@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Scheduler:
+    """Scheduler class. Calls functions at given times in one thread.
+    The calls wait in a heap of (due time, sequence number, function, arguments) entries, ordered by the monotonic
+    clock time.monotonic. The thread sleeps until the earliest entry is due or a new entry is scheduled, so one thread
+    serves any number of pending calls. Calls with the same due time are made in the order they were scheduled.
+
+    Attributes
+    ----------
+    queue_depth : int
+        Number of calls that wait to be made.
+    calls : int
+        Number of calls made since the last reset_statistics.
+    errors : int
+        Number of calls that raised an exception. The traceback is printed and the scheduler goes on.
+    max_queue_depth : int
+        Largest queue_depth since the last reset_statistics.
+    total_lateness : float
+        Sum of the time (in seconds) between the due times and the actual times of all calls.
+    max_lateness : float
+        Largest time (in seconds) between the due time and the actual time of a call.
+    """
+
+    def __init__(self):
+        """__init__ method"""
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.reset_statistics()
+
+    @property
+    def queue_depth(self):
+        """int : Number of calls that wait to be made."""
+        with self._condition:
+            return len(self._queue)
+
+    @property
+    def statistics(self):
+        """dict : Number of calls and errors, the current and the largest queue depth and the mean and largest
+        lateness (in seconds) of the calls."""
+        with self._condition:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_queue_depth,
+                'mean_lateness': self.total_lateness / self.calls if self.calls > 0 else 0.,
+                'max_lateness': self.max_lateness
+            }
+
+    def reset_statistics(self):
+        """Set the counters and the lateness statistics to 0."""
+        self.calls = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.total_lateness = 0.
+        self.max_lateness = 0.
+
+    def schedule(self, delay, function, *args):
+        """Call function(*args) in delay seconds.
+
+        Parameters
+        ----------
+        delay : float
+            Time (in seconds) from now until the call.
+        function : callable
+            The function to call.
+        *args
+            The arguments of the call.
+        """
+        self.schedule_at(time.monotonic() + delay, function, *args)
+
+    def schedule_at(self, due_time, function, *args):
+        """Call function(*args) at the given time.
+
+        Parameters
+        ----------
+        due_time : float
+            Time of the call as given by time.monotonic. Calls that are already due are made as soon as possible.
+        function : callable
+            The function to call.
+        *args
+            The arguments of the call.
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (due_time, next(self._sequence), function, args))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            # wake the thread up, the new call could be due earlier than the one it waits for
+            self._condition.notify()
+
+    def start(self):
+        """Start the scheduler thread. Calls scheduled before are made when they are due."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    def stop(self, cancel=False):
+        """Stop the scheduler thread and wait for it to return.
+
+        Parameters
+        ----------
+        cancel : bool
+            If true, calls that wait in the queue are dropped. If false, the thread makes them when they are due
+            before it returns. (Default value = False)
+        """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            if cancel:
+                self._queue.clear()
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """The scheduler thread: make every call when it is due, until stop is called and the queue is empty."""
+        while True:
+            with self._condition:
+                while True:
+                    if len(self._queue) == 0:
+                        if not self._running:
+                            return
+                        self._condition.wait()
+                        continue
+                    wait_time = self._queue[0][0] - time.monotonic()
+                    if wait_time <= 0:
+                        break
+                    self._condition.wait(wait_time)
+                due_time, _, function, args = heapq.heappop(self._queue)
+
+            # call without holding the lock, so the function itself can schedule new calls
+            lateness = time.monotonic() - due_time
+            try:
+                function(*args)
+            except Exception:
+                traceback.print_exc()
+                with self._condition:
+                    self.errors += 1
+            with self._condition:
+                self.calls += 1
+                self.total_lateness += lateness
+                self.max_lateness = max(self.max_lateness, lateness)
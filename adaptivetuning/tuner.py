@@ -1,3 +1,4 @@
+import collections
 import numpy as np
 import matplotlib.pyplot as plt
 import threading
@@ -8,6 +9,9 @@ from .audiogenerator import Audiogenerator
 from .midiprocessing import Midiprocessing
 from .audioanalyzer import Audioanalyzer
 from .dissonancereduction import Dissonancereduction
+from .tuningcache import Tuningcache
+from .scheduler import Scheduler
+from .tuningprocess import TuningProcess, Superseded
 
 
 def plot_session_log(session_log, save_to_file=False):
@@ -39,32 +43,18 @@ def plot_session_log(session_log, save_to_file=False):
     else:
         fixed_times, fixed_freqs = (), ()
 
-    tuned_diss = [dissonancereduction.single_dissonance_and_gradient(
-        session_log['tunings'][t]['tuned_fundamentals'],
-        session_log['tunings'][t]['fundamentals_amp'],
-        session_log['tunings'][t]['partials_pos'],
-        session_log['tunings'][t]['partials_amp'],
-        session_log['tunings'][t]['fixed_freq'],
-        session_log['tunings'][t]['partials_amp']
-    )[0] for t in times]
+    def dissonances(tuning):
+        # tuned, 12TET and JI version of the same chord in one pass, with the quasi-constants of 12TET like the tuner
+        et_fundamentals = scale_et[tuning['pitches']]
+        return dissonancereduction.dissonance_many(
+            [tuning['tuned_fundamentals'], et_fundamentals, scale_ji[tuning['pitches']]],
+            tuning['fundamentals_amp'], tuning['partials_pos'], tuning['partials_amp'],
+            tuning['fixed_freq'], tuning['fixed_amp'],
+            reference_freq=et_fundamentals, gradient=False
+        )[0].tolist()
 
-    et_diss = [dissonancereduction.single_dissonance_and_gradient(
-        scale_et[session_log['tunings'][t]['pitches']],
-        session_log['tunings'][t]['fundamentals_amp'],
-        session_log['tunings'][t]['partials_pos'],
-        session_log['tunings'][t]['partials_amp'],
-        session_log['tunings'][t]['fixed_freq'],
-        session_log['tunings'][t]['partials_amp']
-    )[0] for t in times]
-    
-    ji_diss = [dissonancereduction.single_dissonance_and_gradient(
-        scale_ji[session_log['tunings'][t]['pitches']],
-        session_log['tunings'][t]['fundamentals_amp'],
-        session_log['tunings'][t]['partials_pos'],
-        session_log['tunings'][t]['partials_amp'],
-        session_log['tunings'][t]['fixed_freq'],
-        session_log['tunings'][t]['partials_amp']
-    )[0] for t in times]
+    tuned_diss, et_diss, ji_diss = (list(diss) for diss in zip(*[dissonances(session_log['tunings'][t])
+                                                                 for t in times]))
     
     fig, axs = plt.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
     # Remove horizontal space between axes
@@ -97,7 +87,7 @@ def plot_session_log(session_log, save_to_file=False):
 
         ax1.set_yticks(scale_et[yticks_pitches])
         ax1.set_yticklabels([Scale.pitch_to_pitchname(p) for p in yticks_pitches])
-        ax1.set_yticks([], 'minor')
+        ax1.set_yticks([], minor=True)
 
     ax2.set_yticks([0])
 
@@ -117,7 +107,6 @@ def plot_session_log(session_log, save_to_file=False):
 
 
 # todo
-# tuning for different timbres
 # More controll via keyboard during tuning session, e.g. select different scales.
 
 class Tuner:
@@ -146,7 +135,7 @@ class Tuner:
         If None is given the synthesizer runs silently. (Default value = None)
     tuning_interval : float
         The tuner will tune all currently running tones at least every tuning_interval seconds, regardles whether a tuning is
-        requested by a midi handler. (Default value = 0.3)
+        requested by a midi message or new fixed frequencies. (Default value = 0.3)
     audio_lag : float
         Time (in seconds) between receiving a midi message and forwarding the message to SuperCollider.
         This is the time the tuner has to optimize the tuning. (Default value = 0.3)
@@ -154,6 +143,10 @@ class Tuner:
         If true all tuning results are stored in self.session_log.
     session_log : dict
         A dictionary with the tuning results from the last tuning session. (Default value = False)
+    warm_start : bool
+        If true, every tuning starts from the result of the last tuning for the notes that are still running
+        and the quasi-constants of the last tuning are patched instead of recalculated if only notes were added
+        or released. If false, every tuning starts from 12TET. (Default value = True)
     midiprocessing : adaptivetuning.Midiprocessing
         The Midiprocessing object used to read from a midi file oder midi port.
     audioanalyzer : adaptivetuning.Audioanalyzer
@@ -164,50 +157,72 @@ class Tuner:
         A list of the amplitudes of the fixed frequencies last found by the audioanalyzer.
     audiogenerator : adaptivetuning.Audiogenerator
         The audiogenerator used to play the tones of the midi processor.
+    scheduler : adaptivetuning.Scheduler
+        The scheduler thread that passes the midi messages to the audiogenerator audio_lag seconds after they arrived.
+        Its queue depth and lateness statistics are stored in the session log.
     dissonancereduction : adaptivetuning.Dissonancereduction
         Provides the optimization algorithm to tune the tones.
+    use_time_budget : bool
+        If true, every tuning gets a time budget of audio_lag minus the time that already passed since the note-on
+        message that requested it, so the tuning is finished before the note sounds. If the budget is used up, the best
+        tuning found so far is used. (Default value = True)
+    tuning_cache : adaptivetuning.Tuningcache or None
+        If not None, chords are tuned through this cache (from 12TET, warm_start is ignored).
+        Use use_tuning_cache to set up a cache for dissonancereduction. Its statistics are stored in the session log.
+        (Default value = None)
+    partial_retuning : bool
+        If true, only the notes that started since the last tuning are optimized, see partial_tune. The notes that
+        are held keep their frequencies and are treated as fixed frequencies. All running notes are tuned together
+        at most every full_retuning_interval seconds. (Default value = False)
+    full_retuning_interval : float
+        Time (in seconds) between two tunings of all running notes if partial_retuning is true. (Default value = 1)
+    adaptive_degradation : bool
+        If true, the tuning problem is shrunk when the tunings take too long, see update_degradation_level and
+        shrink_problem. (Default value = True)
+    degradation_thresholds : pair of floats
+        If the mean latency (time from the note-on message to the finished tuning) of the last latency_window tunings
+        is above degradation_thresholds[1] * audio_lag (or the last tuning took longer than audio_lag), the next
+        degradation level is used, if it is below degradation_thresholds[0] * audio_lag, the previous one.
+        (Default value = (0.25, 0.75))
+    latency_window : int
+        Number of recent tunings whose latencies are taken into account. (Default value = 8)
+    degradation_level : int
+        Index of the entry of degradation_levels that is currently used, 0 is full quality. Read only.
+    use_tuning_process : bool
+        If true, the optimizations run in the persistent worker process of tuning_process (started by start), so they
+        don't hold the global interpreter lock of the process with the midi and audio threads. If a newer tuning is
+        requested before the result arrived, the result is discarded and the newer chord is tuned. The Tuningcache
+        still tunes in this process. (Default value = False)
+    tuning_process : adaptivetuning.TuningProcess
+        Hosts the optimizer if use_tuning_process is true. Its statistics are stored in the session log.
+    preemptive_tuning : bool
+        If true, an optimization is stopped as soon as a newer tuning is requested (every request gets a new
+        generation number, see request_tuning) and the newer chord is tuned right away instead of after the
+        optimization of the outdated one. With warm_start, the next tuning starts from the frequencies the stopped
+        optimization reached. In the tuning process, the worker stops when a newer request arrives, see
+        TuningProcess.preemptive. The Tuningcache and groups of independent complex tones that are optimized in a
+        process executor of dissonancereduction are not preempted. Preemption helps small chords but not reliably
+        large ones, see benchmark_preemptive_tuning. (Default value = False)
+    preemption_limit : int
+        Largest number of tunings in a row that are stopped or abandoned, the next one runs to the end even if newer
+        tunings are requested. Otherwise no tuning finishes while notes arrive faster than a tuning takes.
+        (Default value = 1)
+    preempted_tunings : int
+        Number of tunings of the last session that were stopped or abandoned because a newer tuning was requested
+        (not counting the tuning stopped when the session stops). It is stored in the session log.
     """
     
-    class LockedBool:
-        """A bool protected by a threading.Lock
-        
-        Attributes
-        ----------
-        lock : threading.lock
-            The Lock.
-        val : bool
-            The bool.
-        """
-        def __init__(self):
-            self.lock = threading.Lock()
-            self.val = False
-        
-        def set(self, val=True):
-            self.lock.acquire()
-            self.val = val
-            self.lock.release()
-        
-        def is_set(self):
-            self.lock.acquire()
-            if self.val:
-                self.lock.release()
-                return True
-            else:
-                self.lock.release()
-                return False
-        
-        def check_true_set_false(self):
-            """If val is true, set val to False and return true, if val is false just return false."""
-            self.lock.acquire()
-            if self.val:
-                self.val = False
-                self.lock.release()
-                return True
-            else:
-                self.lock.release()
-                return False
+    # the tuning problem at every degradation level: at most max_voices of the loudest voices are tuned (the others
+    # keep their frequencies), only the max_partials loudest partials of every timbre and the max_fixed loudest
+    # fixed frequencies are taken into account, None means no limit
+    degradation_levels = (
+        {'max_voices': None, 'max_partials': None, 'max_fixed': None},
+        {'max_voices': None, 'max_partials': 8, 'max_fixed': 20},
+        {'max_voices': 12, 'max_partials': 5, 'max_fixed': 10},
+        {'max_voices': 6, 'max_partials': 3, 'max_fixed': 4}
+    )
     
-    def __init__(self, sc=None, tuning_interval=0.3, audio_lag=0.3, safe_session_log=False):
+    def __init__(self, sc=None, tuning_interval=0.3, audio_lag=0.3, safe_session_log=False, warm_start=True):
         """__init__ method
         
         Parameters
@@ -225,6 +240,10 @@ class Tuner:
             If true all tuning results are stored in self.session_log.
         session_log : dict
             A dictionary with the tuning results from the last tuning session. (Default value = False)
+        warm_start : bool
+            If true, every tuning starts from the result of the last tuning for the notes that are still running
+            and the quasi-constants of the last tuning are patched instead of recalculated if only notes were added
+            or released. If false, every tuning starts from 12TET. (Default value = True)
         """
         # tuner will tune immediately on every note-on message but at least every tuning_interval seconds
         self.tuning_interval = tuning_interval
@@ -232,12 +251,26 @@ class Tuner:
         self.audio_lag = audio_lag
         self.safe_session_log = safe_session_log
         self.session_log = dict()
+        self.warm_start = warm_start
+        # last tuning result and quasi-constants, see incremental_tune
+        self._tuning_state = None
         
         self._stop_signal = threading.Event()
         self._stop_signal.set()
         self._stop_tuning_signal = threading.Event()
         self._stop_tuning_signal.set()
-        self._tuning_requested = Tuner.LockedBool()
+        # the tuner thread waits on this condition for _tuning_requested, the stop signal or the next regular tuning
+        self._tuning_condition = threading.Condition()
+        self._tuning_requested = False
+        # generation number of the last tuning request and of the tuning that is running (None if none is running)
+        self._tuning_generation = 0
+        self._running_generation = None
+        # set while stop waits for the threads, the running optimization is stopped then
+        self._stopping = False
+        # set if the last optimization was stopped because a newer tuning was requested, see tuning_outdated
+        self._preempted = False
+        self._preemptions_in_row = 0
+        self.preempted_tunings = 0
         self._midi_lock = threading.Lock()
         self._audio_lock = threading.Lock()
         
@@ -246,7 +279,8 @@ class Tuner:
             note_off_callback=self.midi_note_off_callback,
             stop_callback=self.midi_stop_callbackack
         )
-        self._midi_handler_threads = dict()
+        # plays the midi messages audio_lag seconds after they arrived
+        self.scheduler = Scheduler()
         
         self.audioanalyzer = Audioanalyzer(result_callback=self.audio_analyzer_callback, silent=False)
         self.fixed_freq = []
@@ -255,7 +289,39 @@ class Tuner:
         self.audiogenerator = Audiogenerator(sc)
         
         self.dissonancereduction = Dissonancereduction(relative_bounds=None, method='CG')
+        self.use_time_budget = True
+        self.tuning_cache = None
+        # time (time.monotonic) of the oldest note-on message that waits for a tuning
+        self._tuning_request_time = None
+        self.partial_retuning = False
+        self.full_retuning_interval = 1
+        # frequencies of the running notes after the last tuning and time (time.monotonic) of the last full tuning
+        self._tuned_freq = dict()
+        self._full_tuning_time = None
+        self.adaptive_degradation = True
+        self.degradation_thresholds = (0.25, 0.75)
+        # latencies of the last latency_window tunings, see update_degradation_level
+        self._latencies = collections.deque()
+        self.latency_window = 8
+        self._degradation_level = 0
+        self.use_tuning_process = False
+        self.tuning_process = TuningProcess(self.dissonancereduction)
+        self.preemptive_tuning = False
+        self.preemption_limit = 1
 
+    def use_tuning_cache(self, max_size=4096, file_name=None):
+        """Tune through a Tuningcache from now on.
+        
+        Parameters
+        ----------
+        max_size : int
+            Maximal number of cached tuning results. (Default value = 4096)
+        file_name : str or None
+            If not None, the cache is read from this file (if it exists) and written to it when the session stops,
+            so the cache survives between sessions. (Default value = None)
+        """
+        self.tuning_cache = Tuningcache(self.dissonancereduction, max_size=max_size, file_name=file_name)
+    
     def test_amplitude_threshold(self):
         """Plays reference tone to adjust the amplitude threshold to your speakers.
         Play reference tone (sine 1khz) at dissonancereduction.amplitude_threshold for two second,
@@ -267,157 +333,491 @@ class Tuner:
     
     def tune_loop(self):
         """The tuner thread used dissonancereduction to tune the currently running complex tones of the audiogenerator
-        in regular intervals or immediately if midiprocessing received a note-on message.
-        Also taking into account fixed frequencies found by the audioanalyzer.
-        The tuned frequencies are passed to the audiogenerator.
+        in regular intervals or immediately if midiprocessing received a note-on message or the audioanalyzer found
+        new fixed frequencies.
+        The thread sleeps on a condition variable until a tuning is requested (see request_tuning) or the next regular
+        tuning is due, tuning_interval seconds (on the monotonic clock) after the start of the last tuning.
         """
-        timer = self.tuning_interval
-        while not self._stop_signal.is_set():
-            timer -= 0.01
+        next_tuning = time.monotonic() + self.tuning_interval
+        while True:
+            with self._tuning_condition:
+                while not self._tuning_requested and not self._stop_signal.is_set():
+                    remaining = next_tuning - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._tuning_condition.wait(remaining)
+                if self._stop_signal.is_set():
+                    return
+                self._tuning_requested = False
+            # the interval includes the time of the tuning itself
+            next_tuning = time.monotonic() + self.tuning_interval
             
-            if (timer <= 0 or self._tuning_requested.check_true_set_false()) \
-                and (not self._stop_tuning_signal.is_set()):
-                # get running synth
-                pitches = []
-                fundamentals_freq = []
-                fundamentals_amp = []
-                #partials_pos = []
-                #partials_amp = []
-                self._midi_lock.acquire()
-                for pitch in self.audiogenerator.keys:
-                    if self.audiogenerator.keys[pitch] is not None \
-                            and self.audiogenerator.keys[pitch].currently_running:
-                        pitches.append(pitch)
-                        #fundamentals_freq.append(self.audiogenerator.keys[pitch].frequency)  ## immer vom letzten Ergebnis
-                        fundamentals_freq.append(440 * 2**((pitch - 69) / 12))  ## immer von 12TET aus tunen
-                        fundamentals_amp.append(self.audiogenerator.keys[pitch].amplitude)
-                        #partials_pos.append(self.audiogenerator.keys[pitch].partials_pos)
-                        #partials_amp.append(self.audiogenerator.keys[pitch].partials_amp)
-                
-                # currently dissonancereduction.tune assumes all complex tones to have the same timbre
-                partials_pos = self.audiogenerator.partials_pos
-                partials_amp = self.audiogenerator.partials_amp
-                    
-                self._midi_lock.release()
-                
-                if len(pitches) == 0:  # nothing to tune
-                    timer = self.tuning_interval
-                    continue
+            if not self._stop_tuning_signal.is_set():
+                self.tune_running_notes()
+    
+    def request_tuning(self):
+        """Wake the tuner thread up to tune the running notes immediately.
+        Every request gets a new generation number, a running optimization of an older generation is stopped if
+        preemptive_tuning is true."""
+        with self._tuning_condition:
+            self._tuning_generation += 1
+            self._tuning_requested = True
+            self._tuning_condition.notify()
+    
+    def tune_running_notes(self):
+        """Tune the currently running complex tones of the audiogenerator together with the fixed frequencies found
+        by the audioanalyzer and pass the tuned frequencies to the audiogenerator. Called by the tuner thread.
+        """
+        # get running synth
+        self._midi_lock.acquire()
+        pitches, fundamentals_amp, partials_pos, partials_amp = self.audiogenerator.running_notes()
+        #fundamentals_freq = [self.audiogenerator.keys[p].frequency for p in pitches]  ## immer vom letzten Ergebnis
+        fundamentals_freq = [440 * 2**((pitch - 69) / 12) for pitch in pitches]  ## immer von 12TET aus tunen
+        request_time = note_on_time = self._tuning_request_time
+        self._tuning_request_time = None
+        generation = self._tuning_generation
+            
+        self._midi_lock.release()
+        
+        if len(pitches) == 0:  # nothing to tune
+            return
 
-                # get fixed freqs
-                self._audio_lock.acquire()
-                fixed_freq = self.fixed_freq
-                fixed_amp = self.fixed_amp
-                self._audio_lock.release()
+        # get fixed freqs
+        self._audio_lock.acquire()
+        fixed_freq = self.fixed_freq
+        fixed_amp = self.fixed_amp
+        self._audio_lock.release()
 
-                # tune
-                tuned_fundamentals = self.dissonancereduction.tune(
-                    np.array(fundamentals_freq), np.array(fundamentals_amp),
-                    np.array(partials_pos), np.array(partials_amp),
-                    np.array(fixed_freq), np.array(fixed_amp)
-                )['x']
-                
-                if not self._stop_tuning_signal.is_set():
-                    if self.safe_session_log:
-                        self.session_log['tunings'][time.time() - self._start_time] = {
-                            'pitches': pitches,
-                            'fundamentals_freq': fundamentals_freq,
-                            'fundamentals_amp': fundamentals_amp,
-                            'partials_pos': partials_pos,
-                            'partials_amp': partials_amp,
-                            'fixed_freq': fixed_freq,
-                            'fixed_amp': fixed_amp,
-                            'tuned_fundamentals': tuned_fundamentals
-                        }
+        # the tuning should be done before the requesting note sounds
+        if request_time is None:
+            # regular tuning without a note-on message
+            request_time = time.monotonic()
+        time_budget = None
+        if self.use_time_budget:
+            time_budget = self.audio_lag - (time.monotonic() - request_time)
 
-                    # update running synth (if running change freq)
-                    self._midi_lock.acquire()
-                    for i in range(len(pitches)):
-                        pitch = pitches[i]
-                        frequency = tuned_fundamentals[i]
-                        self.audiogenerator.note_change_freq(pitch, frequency)
+        # under load only a smaller problem is optimized, voices that are left out keep their frequencies
+        voices, shrunk_pos, shrunk_amp, shrunk_fixed_freq, shrunk_fixed_amp = self.shrink_problem(
+            np.array(fundamentals_amp), partials_pos, partials_amp, np.array(fixed_freq), np.array(fixed_amp)
+        )
+        tuned_fundamentals = np.array([self._tuned_freq.get(p, f) for p, f in zip(pitches, fundamentals_freq)])
+        
+        # tune
+        full_tuning = not self.partial_retuning or self._full_tuning_time is None \
+                      or time.monotonic() - self._full_tuning_time >= self.full_retuning_interval
+        tuned_pitches = [pitches[i] for i in voices]
+        self._preempted = False
+        self._running_generation = generation
+        try:
+            if not full_tuning:
+                tuned_fundamentals[voices] = self.partial_tune(
+                    tuned_pitches, np.array(fundamentals_amp)[voices], shrunk_pos, shrunk_amp,
+                    shrunk_fixed_freq, shrunk_fixed_amp, time_budget=time_budget
+                )
+            elif self.tuning_cache is not None:
+                tuned_fundamentals[voices] = self.tuning_cache.tune(
+                    np.array(fundamentals_freq)[voices], np.array(fundamentals_amp)[voices],
+                    shrunk_pos, shrunk_amp,
+                    shrunk_fixed_freq, shrunk_fixed_amp, time_budget=time_budget
+                )['x']
+            elif self.warm_start:
+                tuned_fundamentals[voices] = self.incremental_tune(
+                    tuned_pitches, np.array(fundamentals_amp)[voices], shrunk_pos, shrunk_amp,
+                    shrunk_fixed_freq, shrunk_fixed_amp, time_budget=time_budget
+                )
+            else:
+                tuned_fundamentals[voices] = self.optimize(
+                    np.array(fundamentals_freq)[voices], np.array(fundamentals_amp)[voices],
+                    shrunk_pos, shrunk_amp,
+                    shrunk_fixed_freq, shrunk_fixed_amp, time_budget=time_budget
+                )['x']
+        except Superseded:
+            self._preempted = True
+        finally:
+            self._running_generation = None
+        if self._preempted:
+            if self._stopping:
+                return
+            # a newer tuning was requested during the optimization, the tuner thread starts it right away
+            # and it also has to be done before the notes that requested this one sound
+            self.preempted_tunings += 1
+            self._preemptions_in_row += 1
+            if note_on_time is not None:
+                self._midi_lock.acquire()
+                if self._tuning_request_time is None or note_on_time < self._tuning_request_time:
+                    self._tuning_request_time = note_on_time
+                self._midi_lock.release()
+            return
+        self._preemptions_in_row = 0
+        if full_tuning:
+            self._full_tuning_time = time.monotonic()
+        self._tuned_freq = dict(zip(pitches, tuned_fundamentals))
+        latency = time.monotonic() - request_time
+        degradation_level = self._degradation_level
+        self.update_degradation_level(latency)
+        
+        if not self._stop_tuning_signal.is_set():
+            if self.safe_session_log:
+                self.session_log['tunings'][time.time() - self._start_time] = {
+                    'pitches': pitches,
+                    'fundamentals_freq': fundamentals_freq,
+                    'fundamentals_amp': fundamentals_amp,
+                    'partials_pos': partials_pos,
+                    'partials_amp': partials_amp,
+                    'fixed_freq': fixed_freq,
+                    'fixed_amp': fixed_amp,
+                    'tuned_fundamentals': tuned_fundamentals,
+                    'degradation_level': degradation_level,
+                    'latency': latency,
+                    'requested_by_note_on': note_on_time is not None
+                }
 
-                    # for synth in synths: change freq
-                    self._midi_lock.release()
+            # update running synth (if running change freq)
+            self._midi_lock.acquire()
+            for i in range(len(pitches)):
+                pitch = pitches[i]
+                frequency = tuned_fundamentals[i]
+                self.audiogenerator.note_change_freq(pitch, frequency)
 
-                # set timer to tuning interval
-                timer = self.tuning_interval
-            else:
-                time.sleep(0.01)
+            # for synth in synths: change freq
+            self._midi_lock.release()
     
-    def midi_note_on_callback(self, pitch, amp):
-        """Callback for midiprocessing, starts a handler thread."""
-        midi_handler_thread = threading.Thread(target=self.midi_note_on_handler, args=(pitch, amp))
-        midi_handler_thread.start()
-        self._midi_handler_threads[midi_handler_thread.ident] = midi_handler_thread
-        self.del_dead_handlers()
+    @property
+    def degradation_level(self):
+        """int : Index of the entry of degradation_levels that is currently used, 0 is full quality."""
+        return self._degradation_level
     
-    def midi_note_on_handler(self, pitch, amp):
-        """The midi handler thread registers its message in the audiogenerator, requests a tuning from the tuner thread,
-        waits for audio_lag seconds and passes the message to SuperCollider"""
-        self._midi_lock.acquire()
-        self.audiogenerator.register_note_on(pitch, amp)
-        self._midi_lock.release()
+    @property
+    def latency_window(self):
+        """int : Number of recent tunings whose latencies are taken into account."""
+        return self._latencies.maxlen
+    
+    @latency_window.setter
+    def latency_window(self, latency_window):
+        # the most recent latencies that fit into the new window are kept
+        self._latencies = collections.deque(self._latencies, maxlen=latency_window)
+    
+    def update_degradation_level(self, latency):
+        """Registers the latency of a tuning and moves to the next or previous degradation level if necessary.
+        After every change of the level, the latencies are collected from scratch. A better level is only used again
+        after latency_window fast tunings.
         
-        self._tuning_requested.set()
+        Parameters
+        ----------
+        latency : float
+            Time (in seconds) from the note-on message (or the start of a regular tuning) to the finished tuning.
+        """
+        if not self.adaptive_degradation:
+            self._degradation_level = 0
+            return
+        self._latencies.append(latency)
+        pressure = np.mean(self._latencies) / self.audio_lag
+        lower, upper = self.degradation_thresholds
+        if (pressure > upper or latency > self.audio_lag) and self._degradation_level < len(self.degradation_levels) - 1:
+            self._degradation_level += 1
+            self._latencies.clear()
+        elif pressure < lower and self._degradation_level > 0 and len(self._latencies) == self._latencies.maxlen:
+            self._degradation_level -= 1
+            self._latencies.clear()
+    
+    def shrink_problem(self, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp, level=None):
+        """The tuning problem at a degradation level.
         
-        time.sleep(self.audio_lag)
+        Parameters
+        ----------
+        fundamentals_amp : np.array
+            Array of amplitudes of the complex tones.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            complex tone.
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            complex tone.
+        fixed_freq : np.array
+            Array of fixed frequencies.
+        fixed_amp : np.array
+            Array of amplitudes for the fixed frequencies.
+        level : int
+            Index of the entry of degradation_levels. If None is given, the current degradation_level is used.
+            (Default value = None)
+            
+        Returns
+        -------
+        voices : np.array
+            Sorted indices of the complex tones that are tuned.
+        partials_pos, partials_amp, fixed_freq, fixed_amp : np.array or list of np.array
+            The shrunk timbres (of the tuned complex tones) and fixed frequencies.
+        """
+        limits = self.degradation_levels[self.degradation_level if level is None else level]
+        fundamentals_amp = np.asarray(fundamentals_amp, dtype=float)
+        fixed_freq = np.asarray(fixed_freq, dtype=float)
+        fixed_amp = np.asarray(fixed_amp, dtype=float)
+        loudest = lambda amplitudes, limit: np.sort(np.argsort(- amplitudes, kind='stable')[:limit])
         
+        voices = np.arange(len(fundamentals_amp))
+        if limits['max_voices'] is not None and len(voices) > limits['max_voices']:
+            voices = loudest(fundamentals_amp, limits['max_voices'])
+            if self.dissonancereduction.per_tone(partials_pos):
+                partials_pos = [partials_pos[i] for i in voices]
+                partials_amp = [partials_amp[i] for i in voices]
+        if limits['max_partials'] is not None:
+            partials_pos, partials_amp = self.dissonancereduction.loudest_partials(
+                partials_pos, partials_amp, limits['max_partials'])
+        if limits['max_fixed'] is not None and len(fixed_freq) > limits['max_fixed']:
+            selected = loudest(fixed_amp, limits['max_fixed'])
+            fixed_freq, fixed_amp = fixed_freq[selected], fixed_amp[selected]
+        return voices, partials_pos, partials_amp, fixed_freq, fixed_amp
+    
+    def optimize(self, *args, **kwargs):
+        """Dissonancereduction.tune, in the tuning process if use_tuning_process is true.
+        There the wait for the result is abandoned with Superseded when a newer tuning is requested or the session
+        stops. In this process, the optimization is stopped in that case if preemptive_tuning is true, the result
+        holds the best frequencies found so far and _preempted is set.
+        
+        Parameters
+        ----------
+        See parameters of Dissonancereduction.tune
+        
+        Returns
+        -------
+        res : scipy.optimize.optimize.OptimizeResult
+            The result of Dissonancereduction.tune.
+        """
+        if not self.use_tuning_process:
+            if not self.preemptive_tuning:
+                return self.dissonancereduction.tune(*args, **kwargs)
+            res = self.dissonancereduction.tune(*args, should_stop=self.tuning_outdated, **kwargs)
+            if res['message'] == b'STOPPED':
+                self._preempted = True
+            return res
+        self.tuning_process.dissonancereduction = self.dissonancereduction
+        return self.tuning_process.tune(
+            *args, superseded=self.tuning_outdated, **kwargs
+        )
+    
+    def tuning_outdated(self):
+        """True if tune_running_notes is running and a tuning was requested after it started (and the tunings before
+        it were not stopped preemption_limit times in a row) or the session stops. Calls of optimize outside
+        tune_running_notes are never outdated."""
+        if self._running_generation is None:
+            return False
+        if self._stopping:
+            return True
+        return self._tuning_generation != self._running_generation \
+               and self._preemptions_in_row < self.preemption_limit
+    
+    def incremental_tune(self, pitches, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                         time_budget=None):
+        """Tune the given pitches, reusing as much as possible from the last call.
+        The optimization starts from the last result for pitches that were already tuned last time and from 12TET
+        for new pitches. If the timbre and the fixed frequencies did not change, the quasi-constants of the last
+        call are patched: the pairs of released pitches are removed and only the pairs of new pitches are calculated.
+        The quasi-constants are always calculated relative to 12TET, so the result is the same as tuning from 12TET
+        with a different starting point.
+        
+        Parameters
+        ----------
+        pitches : list of int
+            Midi pitches of the complex tones.
+        fundamentals_amp : np.array
+            Array of amplitudes of the complex tones.
+        partials_pos : np.array or list of np.array
+            Array of relative positions of the partials of the complex tones or a list with one such array per
+            pitch, see Dissonancereduction.tune.
+        partials_amp : np.array or list of np.array
+            Array of relative amplitudes of the partials of the complex tones or a list with one such array per
+            pitch.
+        fixed_freq : np.array
+            Array of fixed frequencies.
+        fixed_amp : np.array
+            Array of amplitudes for the fixed frequencies.
+        time_budget : float
+            Time (in seconds) the tuning may take, see Dissonancereduction.tune. (Default value = None)
+            
+        Returns
+        -------
+        tuned_fundamentals : np.array
+            The tuned fundamental frequencies in the order of pitches.
+        """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        remaining = lambda: None if deadline is None else deadline - time.monotonic()
+        amplitudes = dict(zip(pitches, fundamentals_amp))
+        per_tone = self.dissonancereduction.per_tone(partials_pos)
+        if per_tone:
+            timbres = dict(zip(pitches, zip(partials_pos, partials_amp)))
+        else:
+            timbres = {p: (partials_pos, partials_amp) for p in pitches}
+        state = self._tuning_state
+        same_timbre = lambda p: np.array_equal(timbres[p][0], state['timbres'][p][0]) \
+                                and np.array_equal(timbres[p][1], state['timbres'][p][1])
+        
+        if state is not None \
+                and np.array_equal(state['fixed_freq'], fixed_freq) \
+                and np.array_equal(state['fixed_amp'], fixed_amp):
+            # keep the tones of the last tuning that are still running with the same amplitude and timbre
+            kept = [p for p in state['pitches']
+                    if p in amplitudes and amplitudes[p] == state['amplitudes'][p] and same_timbre(p)]
+            removed = [i for i, p in enumerate(state['pitches']) if p not in kept]
+            quasi_constants = self.dissonancereduction.remove_tones(*state['quasi_constants'], removed)
+        else:
+            kept = []
+            quasi_constants = None
+        order = kept + [p for p in pitches if p not in kept]
+        
+        fundamentals_freq = 440 * 2**((np.array(order) - 69) / 12)
+        order_amp = np.array([amplitudes[p] for p in order])
+        if per_tone:
+            partials_pos = [timbres[p][0] for p in order]
+            partials_amp = [timbres[p][1] for p in order]
+        if quasi_constants is None:
+            quasi_constants = self.dissonancereduction.quasi_constants(
+                fundamentals_freq, order_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+            )
+        elif len(order) > len(kept):
+            # add the pairs of the new tones
+            new_quasi_constants = self.dissonancereduction.quasi_constants(
+                fundamentals_freq, order_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                tones=range(len(kept), len(order))
+            )
+            quasi_constants = (
+                np.concatenate((np.reshape(quasi_constants[0], (-1, 4)),
+                                np.reshape(new_quasi_constants[0], (-1, 4)))).astype(int),
+                np.concatenate((quasi_constants[1], new_quasi_constants[1])),
+                np.concatenate((quasi_constants[2], new_quasi_constants[2]))
+            )
+        
+        # the quasi-constants are only valid up to 1/2 semitone around 12TET, especially without bounds
+        # the optimization can run off, so tones that ran off last time start from 12TET again
+        def in_range(freqs):
+            # negative or nan frequencies are out of range, without a warning for the log of them
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.abs(np.log2(freqs / fundamentals_freq)) <= 1 / 24
+        initial_freq = fundamentals_freq.copy()
+        if state is not None:
+            for i, p in enumerate(order):
+                if p in state['tuned']:
+                    initial_freq[i] = state['tuned'][p]
+            initial_freq = np.where(in_range(initial_freq), initial_freq, fundamentals_freq)
+        
+        tuned = self.optimize(
+            fundamentals_freq, order_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+            initial_freq=initial_freq, quasi_constants=quasi_constants, time_budget=remaining()
+        )['x']
+        if not self._preempted and not np.all(in_range(tuned)) \
+                and not np.array_equal(initial_freq, fundamentals_freq):
+            # if the optimization ran off from a warm start, try again from 12TET
+            tuned = self.optimize(
+                fundamentals_freq, order_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                quasi_constants=quasi_constants, time_budget=remaining()
+            )['x']
+        
+        self._tuning_state = {
+            'pitches': order,
+            'amplitudes': amplitudes,
+            'tuned': dict(zip(order, tuned)),
+            'timbres': timbres,
+            'fixed_freq': fixed_freq,
+            'fixed_amp': fixed_amp,
+            'quasi_constants': quasi_constants
+        }
+        return np.array([self._tuning_state['tuned'][p] for p in pitches])
+    
+    def partial_tune(self, pitches, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                     time_budget=None):
+        """Tune only the pitches that were not tuned last time.
+        The pitches that were already tuned keep their frequencies, their partials are added to the fixed frequencies,
+        so the optimization has only as many variables as new notes started. If there are no new pitches, nothing is
+        optimized and if there are no held pitches, all pitches are tuned from 12TET.
+        
+        Parameters
+        ----------
+        See parameters of incremental_tune
+            
+        Returns
+        -------
+        tuned_fundamentals : np.array
+            The tuned fundamental frequencies in the order of pitches.
+        """
+        held = [i for i, p in enumerate(pitches) if p in self._tuned_freq]
+        new = [i for i, p in enumerate(pitches) if p not in self._tuned_freq]
+        tuned_fundamentals = np.array([self._tuned_freq.get(p, 440 * 2**((p - 69) / 12)) for p in pitches])
+        if len(new) == 0:
+            return tuned_fundamentals
+        
+        fundamentals_amp = np.asarray(fundamentals_amp, dtype=float)
+        timbres = lambda partials, tones: [partials[i] for i in tones] \
+                                          if self.dissonancereduction.per_tone(partials) else partials
+        offsets, held_pos = self.dissonancereduction.partials_layout(len(held), timbres(partials_pos, held))
+        _, held_amp = self.dissonancereduction.partials_layout(len(held), timbres(partials_amp, held))
+        held_tones = np.repeat(held, np.diff(offsets)).astype(int)
+        fixed_freq = np.concatenate((fixed_freq, tuned_fundamentals[held_tones] * held_pos))
+        fixed_amp = np.concatenate((fixed_amp, fundamentals_amp[held_tones] * held_amp))
+        tuned_fundamentals[new] = self.optimize(
+            tuned_fundamentals[new], fundamentals_amp[new], timbres(partials_pos, new), timbres(partials_amp, new),
+            fixed_freq, fixed_amp, time_budget=time_budget
+        )['x']
+        if self._tuning_state is not None:
+            # the next full tuning starts from the frequencies that are sounding now
+            self._tuning_state['tuned'].update(zip(pitches, tuned_fundamentals))
+        return tuned_fundamentals
+    
+    def midi_note_on_callback(self, pitch, amp):
+        """Callback for midiprocessing, registers the message in the audiogenerator, requests a tuning from the tuner
+        thread and schedules passing the message to SuperCollider in audio_lag seconds."""
         self._midi_lock.acquire()
-        self.audiogenerator.play_note_on(pitch)
+        self.audiogenerator.register_note_on(pitch, amp)
+        if self._tuning_request_time is None:
+            self._tuning_request_time = time.monotonic()
+        # the new generation is requested before the lock is released, so a tuning that already includes the note
+        # (tune_running_notes reads the notes and the generation under this lock) is not preempted by it
+        self.request_tuning()
         self._midi_lock.release()
+        
+        self.scheduler.schedule(self.audio_lag, self.play_midi_message, self.audiogenerator.play_note_on, pitch)
     
     def midi_note_off_callback(self, pitch):
-        """Callback for midiprocessing, starts a handler thread."""
-        midi_handler_thread = threading.Thread(target=self.midi_note_off_handler, args=(pitch,))
-        midi_handler_thread.start()
-        self._midi_handler_threads[midi_handler_thread.ident] = midi_handler_thread
-        self.del_dead_handlers()
-    
-    def midi_note_off_handler(self, pitch):
-        """The midi handler thread registers its message in the audiogenerator, requests a tuning from the tuner thread,
-        waits for audio_lag seconds and passes the message to SuperCollider"""
+        """Callback for midiprocessing, registers the message in the audiogenerator and schedules passing the message
+        to SuperCollider in audio_lag seconds."""
         self._midi_lock.acquire()
         self.audiogenerator.register_note_off(pitch)
         self._midi_lock.release()
         
-        time.sleep(self.audio_lag)
-        
-        self._midi_lock.acquire()
-        self.audiogenerator.play_note_off(pitch)
-        self._midi_lock.release()
+        self.scheduler.schedule(self.audio_lag, self.play_midi_message, self.audiogenerator.play_note_off, pitch)
     
     def midi_stop_callbackack(self):
-        """Callback for midiprocessing, starts a handler thread."""
-        midi_handler_thread = threading.Thread(target=self.midi_stop_handler)
-        midi_handler_thread.start()
-        self._midi_handler_threads[midi_handler_thread.ident] = midi_handler_thread
-        self.del_dead_handlers()
-    
-    def midi_stop_handler(self):
-        """The midi handler thread registers its message in the audiogenerator, requests a tuning from the tuner thread,
-        waits for audio_lag seconds and passes the message to SuperCollider"""
+        """Callback for midiprocessing, registers the message in the audiogenerator and schedules passing the message
+        to SuperCollider in audio_lag seconds."""
         self._midi_lock.acquire()
         self.audiogenerator.register_stop_all()
         self._midi_lock.release()
         
-        time.sleep(self.audio_lag)
+        self.scheduler.schedule(self.audio_lag, self.play_midi_message, self.audiogenerator.play_stop_all)
+    
+    def play_midi_message(self, play, *args):
+        """Called by the scheduler thread, passes a message to SuperCollider.
         
+        Parameters
+        ----------
+        play : callable
+            Audiogenerator.play_note_on, Audiogenerator.play_note_off or Audiogenerator.play_stop_all.
+        *args
+            The arguments of play.
+        """
         self._midi_lock.acquire()
-        self.audiogenerator.play_stop_all()
+        play(*args)
         self._midi_lock.release()
     
     def audio_analyzer_callback(self, peaks_freq, peaks_amp):
-        """Callback for audioanalyzer, stores the fixed frequencies and theit amplitudes."""
+        """Callback for audioanalyzer, stores the fixed frequencies and theit amplitudes and requests a tuning from the
+        tuner thread if they changed."""
         self._audio_lock.acquire()
+        changed = not (np.array_equal(peaks_freq, self.fixed_freq) and np.array_equal(peaks_amp, self.fixed_amp))
         self.fixed_freq = peaks_freq
         self.fixed_amp = peaks_amp
         self._audio_lock.release()
-    
-    def del_dead_handlers(self):
-        """Delete midi handler threads that returned and don't need to be stored anymore"""
-        for k in [k for k in self._midi_handler_threads if not self._midi_handler_threads[k].is_alive()]:
-            del self._midi_handler_threads[k]
+        
+        if changed:
+            self.request_tuning()
     
     def start(self, midi_file=None, fixed_audio=False):
         """Starts a tuning session.
@@ -471,8 +871,24 @@ class Tuner:
             self._start_time = time.time()
         self.fixed_freq = []
         self.fixed_amp = []
+        self._tuning_state = None
+        self._tuned_freq = dict()
+        self._full_tuning_time = None
+        self._degradation_level = 0
+        self._latencies.clear()
+        self._preemptions_in_row = 0
+        self.preempted_tunings = 0
+        self._stopping = False
+        self.scheduler.reset_statistics()
+        if self.use_tuning_process:
+            # before the threads start, the worker process may be forked
+            self.tuning_process.dissonancereduction = self.dissonancereduction
+            self.tuning_process.preemptive = self.preemptive_tuning
+            self.tuning_process.reset_statistics()
+            self.tuning_process.start()
         
         #start threads
+        self.scheduler.start()
         self._tuner_thread.start()
         self._midi_thread.start()
         if self._audio_thread is not None:
@@ -486,7 +902,7 @@ class Tuner:
             
             if inp == 'a':
                 self._stop_tuning_signal.clear()
-                self._tuning_requested.set()
+                self.request_tuning()
                 
             if inp == 'et':
                 self._stop_tuning_signal.set()
@@ -505,18 +921,34 @@ class Tuner:
     def stop(self):
         """Stop a tuning session: Stops all threads and waits for them to return."""
         if not self._stop_signal.is_set():
+            self._stopping = True
             self._stop_signal.set()
+            # wake the tuner thread up
+            with self._tuning_condition:
+                self._tuning_condition.notify()
 
             # join threads
             self._tuner_thread.join()
             self._midi_thread.join()
             if self._audio_thread is not None:
                 self._audio_thread.join()
-            for t in self._midi_handler_threads:
-                self._midi_handler_threads[t].join()
-            self.del_dead_handlers()
+            # play the midi messages that are still waiting
+            self.scheduler.stop()
+            self.tuning_process.stop()
+            self._stopping = False
 
             self.audiogenerator.stop_all()
+            
+            if self.safe_session_log:
+                self.session_log['scheduler'] = self.scheduler.statistics
+                self.session_log['preempted_tunings'] = self.preempted_tunings
+                if self.use_tuning_process:
+                    self.session_log['tuning_process'] = self.tuning_process.statistics
+            if self.tuning_cache is not None:
+                if self.safe_session_log:
+                    self.session_log['tuning_cache'] = self.tuning_cache.statistics
+                if self.tuning_cache.file_name is not None:
+                    self.tuning_cache.save()
     
     def init_session_log(self):
         """Start a fresh session log."""
@@ -526,10 +958,19 @@ class Tuner:
                 # Tuner parameters
                 'tuning_interval': self.tuning_interval,
                 'audio_lag': self.audio_lag,
+                'partial_retuning': self.partial_retuning,
+                'full_retuning_interval': self.full_retuning_interval,
+                'adaptive_degradation': self.adaptive_degradation,
+                'degradation_thresholds': self.degradation_thresholds,
+                'use_tuning_process': self.use_tuning_process,
+                'preemptive_tuning': self.preemptive_tuning,
+                'preemption_limit': self.preemption_limit,
                 # Dissonancereduction parameters
                 'method': self.dissonancereduction.method,
+                'parametrization': self.dissonancereduction.parametrization,
                 'relative_bounds': self.dissonancereduction.relative_bounds,
-                'max_iterations': self.dissonancereduction.max_iterations
+                'max_iterations': self.dissonancereduction.max_iterations,
+                'coarse_partials': self.dissonancereduction.coarse_partials
             },
             'tunings': dict()
         }
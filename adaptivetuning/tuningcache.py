@@ -0,0 +1,229 @@
+import os
+import pickle
+import collections
+import numpy as np
+from .dissonancereduction import Dissonancereduction
+
+
+class Tuningcache:
+    """Tuning cache class. Memoization layer in front of Dissonancereduction.tune.
+    Music repeats the same simultaneities constantly, so the tuning results are stored under a signature of the chord:
+    the sorted fundamental frequencies (in cents), their quantized amplitudes, the timbre,
+    a quantized fingerprint of the fixed frequencies and the parameters of the Dissonancereduction.
+    The cache is bounded, the least recently used result is evicted first.
+    The tuned frequencies are stored relative to the given frequencies, so a hit is also valid for slightly
+    different input frequencies that fall into the same quantization steps.
+
+    Attributes
+    ----------
+    dissonancereduction : adaptivetuning.Dissonancereduction
+        The Dissonancereduction used to tune chords that are not in the cache.
+        If None is given, a new Dissonancereduction with default parameters is used. (Default value = None)
+    max_size : int
+        Maximal number of cached tuning results. (Default value = 4096)
+    pitch_resolution : float
+        Resolution (in cents) of the fundamental frequencies in the signature. (Default value = 1)
+    amplitude_resolution : float
+        Resolution (in dB) of the amplitudes of the fundamentals and of the fixed frequencies in the signature.
+        (Default value = 3)
+    fixed_resolution : float
+        Resolution (in cents) of the fixed frequencies in the signature. (Default value = 5)
+    file_name : str or None
+        If not None, the cache is read from this file on construction (if it exists) and written to it by save.
+        (Default value = None)
+    hits : int
+        Number of calls of tune that were answered from the cache.
+    misses : int
+        Number of calls of tune that had to be optimized.
+    evictions : int
+        Number of results that were dropped because the cache was full.
+    """
+
+    def __init__(self, dissonancereduction=None, max_size=4096, pitch_resolution=1, amplitude_resolution=3,
+                 fixed_resolution=5, file_name=None):
+        """__init__ method
+
+        Parameters
+        ----------
+        dissonancereduction : adaptivetuning.Dissonancereduction
+            The Dissonancereduction used to tune chords that are not in the cache.
+            If None is given, a new Dissonancereduction with default parameters is used. (Default value = None)
+        max_size : int
+            Maximal number of cached tuning results. (Default value = 4096)
+        pitch_resolution : float
+            Resolution (in cents) of the fundamental frequencies in the signature. (Default value = 1)
+        amplitude_resolution : float
+            Resolution (in dB) of the amplitudes of the fundamentals and of the fixed frequencies in the signature.
+            (Default value = 3)
+        fixed_resolution : float
+            Resolution (in cents) of the fixed frequencies in the signature. (Default value = 5)
+        file_name : str or None
+            If not None, the cache is read from this file on construction (if it exists) and written to it by save.
+            (Default value = None)
+        """
+        if dissonancereduction is None:
+            dissonancereduction = Dissonancereduction()
+        self.dissonancereduction = dissonancereduction
+        self.max_size = max_size
+        self.pitch_resolution = pitch_resolution
+        self.amplitude_resolution = amplitude_resolution
+        self.fixed_resolution = fixed_resolution
+        self.file_name = file_name
+        self._results = collections.OrderedDict()
+        self.reset_statistics()
+        if file_name is not None and os.path.exists(file_name):
+            self.load(file_name)
+
+    def __len__(self):
+        return len(self._results)
+
+    @property
+    def statistics(self):
+        """dict : Number of hits, misses and evictions, the hit rate and the current size of the cache."""
+        calls = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / calls if calls > 0 else 0.,
+            'size': len(self._results)
+        }
+
+    def reset_statistics(self):
+        """Set the hit, miss and eviction counters to 0."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        """Remove all cached results. The counters are not changed."""
+        self._results.clear()
+
+    def signature(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[]):
+        """The key under which the tuning result of a chord is stored.
+
+        Parameters
+        ----------
+        See parameters of Dissonancereduction.tune
+
+        Returns
+        -------
+        signature : tuple
+            Hashable signature of the chord. Chords with the same signature get the same tuning.
+        """
+        fundamentals_freq = np.asarray(fundamentals_freq, dtype=float)
+        order = np.argsort(fundamentals_freq, kind='stable')
+        fixed_freq = np.asarray(fixed_freq, dtype=float)
+        fixed_order = np.argsort(fixed_freq, kind='stable')
+        to_steps = lambda values, resolution: tuple(np.round(values / resolution).astype(int).tolist())
+        cents = lambda freqs: 1200 * np.log2(freqs / 440)
+        decibel = lambda amps: 20 * np.log10(np.maximum(amps, 1e-12))
+        dissonancereduction = self.dissonancereduction
+        timbre = lambda partials: tuple(np.round(np.asarray(partials, dtype=float), 6).tolist())
+        if dissonancereduction.per_tone(partials_pos):
+            # the timbres of the complex tones in the sorted order
+            timbres = (tuple(timbre(partials_pos[i]) for i in order), tuple(timbre(partials_amp[i]) for i in order))
+        else:
+            timbres = (timbre(partials_pos), timbre(partials_amp))
+        return (
+            to_steps(cents(fundamentals_freq[order]), self.pitch_resolution),
+            to_steps(decibel(np.asarray(fundamentals_amp, dtype=float)[order]), self.amplitude_resolution),
+            # timbre
+            timbres[0],
+            timbres[1],
+            # fixed frequencies
+            to_steps(cents(fixed_freq[fixed_order]), self.fixed_resolution),
+            to_steps(decibel(np.asarray(fixed_amp, dtype=float)[fixed_order]), self.amplitude_resolution),
+            # parameters of the optimization
+            (dissonancereduction.method,
+             dissonancereduction.parametrization,
+             None if dissonancereduction.relative_bounds is None else tuple(dissonancereduction.relative_bounds),
+             dissonancereduction.max_iterations,
+             dissonancereduction.kernel_tolerance,
+             None if dissonancereduction.coarse_partials is None else tuple(dissonancereduction.coarse_partials),
+             dissonancereduction.compact_plans,
+             dissonancereduction.decompose,
+             round(float(np.log10(dissonancereduction.amplitude_threshold)), 6))
+        )
+
+    def tune(self, fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq=[], fixed_amp=[],
+             time_budget=None):
+        """Tune a set of complex tones, using the cached result if the chord has been tuned before.
+        Results of optimizations that were stopped because the time budget was used up are not stored.
+
+        Parameters
+        ----------
+        See parameters of Dissonancereduction.tune
+
+        Returns
+        -------
+        res : dict or scipy.optimize.optimize.OptimizeResult
+            On a miss the result of Dissonancereduction.tune. On a hit a dict with the same keys,
+            with nfev = nit = 0 and message = b'CACHE HIT'. res['x'] contains the tuned fundamental frequencies.
+        """
+        fundamentals_freq = np.asarray(fundamentals_freq, dtype=float)
+        signature = self.signature(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp,
+                                   fixed_freq, fixed_amp)
+        order = np.argsort(fundamentals_freq, kind='stable')
+
+        if signature in self._results:
+            self.hits += 1
+            self._results.move_to_end(signature)
+            ratios, fun, success = self._results[signature]
+            x = np.empty(len(fundamentals_freq))
+            x[order] = fundamentals_freq[order] * ratios
+            return {
+                  'fun': fun,
+             'hess_inv': None,
+                  'jac': None,
+              'message': b'CACHE HIT',
+                 'nfev': 0,
+                  'nit': 0,
+               'status': 0,
+              'success': success,
+                    'x': x
+            }
+
+        self.misses += 1
+        res = self.dissonancereduction.tune(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp,
+                                            fixed_freq, fixed_amp, time_budget=time_budget)
+        if res['message'] == b'TIME BUDGET EXCEEDED':
+            return res
+        ratios = np.asarray(res['x'])[order] / fundamentals_freq[order]
+        self._results[signature] = (ratios, res['fun'], res['success'])
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+            self.evictions += 1
+        return res
+
+    def save(self, file_name=None):
+        """Writes the cached results to a file.
+
+        Parameters
+        ----------
+        file_name : str
+            If None, the cache is written to self.file_name. (Default value = None)
+        """
+        if file_name is None:
+            file_name = self.file_name
+        with open(file_name, "wb") as file:
+            pickle.dump(list(self._results.items()), file)
+
+    def load(self, file_name=None):
+        """Reads cached results from a file written by save. They are added to the current cache as the most recently
+        used results (in the order they were stored).
+
+        Parameters
+        ----------
+        file_name : str
+            If None, the cache is read from self.file_name. (Default value = None)
+        """
+        if file_name is None:
+            file_name = self.file_name
+        with open(file_name, "rb") as file:
+            for signature, result in pickle.load(file):
+                self._results[signature] = result
+                self._results.move_to_end(signature)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,182 @@
+import multiprocessing
+import pickle
+
+
+class Superseded(Exception):
+    """Raised by TuningProcess.tune if a newer tuning was requested before the result arrived."""
+    pass
+
+
+def _serve(connection, preemptive=False):
+    """The worker process: tune the requests from the pipe one after the other and send back the results.
+    Requests that wait while a newer one arrives are skipped. If preemptive is true, an optimization is stopped as
+    soon as a newer request (or the stop message) arrives."""
+    dissonancereduction = None
+    while True:
+        request = connection.recv()
+        skipped = 0
+        # only the newest of the waiting requests is tuned
+        while request is not None and connection.poll():
+            newer = connection.recv()
+            if newer is not None and newer[1] is None:
+                # keep the parameters of the skipped request
+                newer = (newer[0], request[1], newer[2], newer[3])
+            request = newer
+            skipped += 1
+        if request is None:
+            return
+        generation, state, args, kwargs = request
+        if state is not None:
+            dissonancereduction = pickle.loads(state)
+        try:
+            if preemptive:
+                # the partial result is stale, it is sent back anyway so every request gets an answer
+                kwargs['should_stop'] = connection.poll
+            result = dissonancereduction.tune(*args, **kwargs)
+        except Exception as exception:
+            result = exception
+        connection.send((generation, result, skipped))
+
+
+class TuningProcess:
+    """Tuning process class. Runs Dissonancereduction.tune in a persistent worker process.
+    The optimization is Python code that holds the global interpreter lock most of the time, so in the process of the
+    Tuner it delays the midi and audio threads. In the worker process it does not: the calling thread waits for the
+    result in the pipe, which releases the lock.
+    Every request gets a generation number. If several requests wait in the pipe, the worker only tunes the newest,
+    results of older generations are discarded when they arrive. The Dissonancereduction is sent to the worker only
+    when its parameters changed.
+    If preemptive is true, the worker stops an optimization when a newer request arrives, see the should_stop
+    parameter of Dissonancereduction.tune, so the newest chord is tuned without waiting for an outdated one.
+
+    Attributes
+    ----------
+    dissonancereduction : adaptivetuning.Dissonancereduction
+        The Dissonancereduction whose tune method runs in the worker process.
+    preemptive : bool
+        If true, the worker stops an optimization when a newer request arrives. Takes effect when the worker process
+        starts. (Default value = True)
+    generation : int
+        Generation number of the last request.
+    requests : int
+        Number of calls of tune.
+    skipped : int
+        Number of requests the worker skipped because a newer request was waiting.
+    stale : int
+        Number of results that arrived after a newer request was sent and were discarded.
+    superseded : int
+        Number of calls of tune that raised Superseded.
+    """
+
+    def __init__(self, dissonancereduction, context=None, preemptive=True):
+        """__init__ method
+
+        Parameters
+        ----------
+        dissonancereduction : adaptivetuning.Dissonancereduction
+            The Dissonancereduction whose tune method runs in the worker process.
+        context : multiprocessing context or None
+            Context used to start the worker process, e.g. multiprocessing.get_context('spawn').
+            If None is given, the default context is used. (Default value = None)
+        preemptive : bool
+            If true, the worker stops an optimization when a newer request arrives. (Default value = True)
+        """
+        self.dissonancereduction = dissonancereduction
+        self.context = multiprocessing if context is None else context
+        self.preemptive = preemptive
+        self._connection = None
+        self._process = None
+        self._sent_state = None
+        self.generation = 0
+        self.reset_statistics()
+
+    @property
+    def statistics(self):
+        """dict : Number of requests, skipped requests, stale results and superseded calls."""
+        return {
+            'requests': self.requests,
+            'skipped': self.skipped,
+            'stale': self.stale,
+            'superseded': self.superseded
+        }
+
+    def reset_statistics(self):
+        """Set the counters to 0."""
+        self.requests = 0
+        self.skipped = 0
+        self.stale = 0
+        self.superseded = 0
+
+    @property
+    def running(self):
+        """bool : True if the worker process is running."""
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Start the worker process."""
+        if self.running:
+            return
+        self._connection, worker_connection = self.context.Pipe()
+        self._process = self.context.Process(target=_serve, args=(worker_connection, self.preemptive), daemon=True)
+        self._process.start()
+        worker_connection.close()
+        self._sent_state = None
+
+    def stop(self):
+        """Stop the worker process after the current optimization and wait for it to return."""
+        if self._process is None:
+            return
+        try:
+            self._connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join()
+        self._connection.close()
+        self._connection = None
+        self._process = None
+
+    def tune(self, *args, superseded=None, poll_interval=0.005, **kwargs):
+        """Dissonancereduction.tune in the worker process.
+
+        Parameters
+        ----------
+        *args, **kwargs
+            See parameters of Dissonancereduction.tune
+        superseded : callable or None
+            Called before the wait and every poll_interval seconds while the result has not arrived. If it returns
+            true, the wait is abandoned and Superseded is raised, the result of this request will be discarded when
+            it arrives.
+            If None is given, tune waits for the result. (Default value = None)
+        poll_interval : float
+            Time (in seconds) between two calls of superseded. (Default value = 0.005)
+
+        Returns
+        -------
+        res : scipy.optimize.optimize.OptimizeResult
+            The result of Dissonancereduction.tune.
+        """
+        if not self.running:
+            self.start()
+        state = pickle.dumps(self.dissonancereduction)
+        if state == self._sent_state:
+            state = None
+        else:
+            self._sent_state = state
+        self.generation += 1
+        self.requests += 1
+        generation = self.generation
+        self._connection.send((generation, state, args, kwargs))
+
+        while True:
+            if superseded is not None and superseded():
+                self.superseded += 1
+                raise Superseded()
+            if self._connection.poll(None if superseded is None else poll_interval):
+                result_generation, result, skipped = self._connection.recv()
+                self.skipped += skipped
+                if result_generation != generation:
+                    self.stale += 1
+                    continue
+                if isinstance(result, Exception):
+                    raise result
+                return result
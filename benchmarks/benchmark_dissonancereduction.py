@@ -0,0 +1,859 @@
+"""Benchmarks for the Dissonancereduction class.
+
+Run from the repository root:
+
+    python benchmarks/benchmark_dissonancereduction.py
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+import timeit
+import warnings
+import mido
+import numpy as np
+from adaptivetuning import AsyncTuner
+from adaptivetuning import Audiogenerator
+from adaptivetuning import Dissonancereduction
+from adaptivetuning import Scheduler
+from adaptivetuning import Tuner
+from adaptivetuning import Tuningcache
+
+
+MIDI_FILE = os.path.join(os.path.dirname(__file__), '..', 'examples', 'midi_files', 'BWV_0227.mid')
+
+
+def random_problem(nr_notes, nr_partials, nr_fixed, seed=0):
+    """Random chord from the middle register with a piano-like timbre and random fixed frequencies.
+
+    Parameters
+    ----------
+    nr_notes : int
+        Number of complex tones.
+    nr_partials : int
+        Number of (harmonic) partials per complex tone.
+    nr_fixed : int
+        Number of fixed frequencies.
+    seed : int
+        Seed of the random number generator. (Default value = 0)
+
+    Returns
+    -------
+    fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp : np.array
+        Arguments for Dissonancereduction.quasi_constants and Dissonancereduction.tune.
+    """
+    rng = np.random.default_rng(seed)
+    pitches = rng.choice(np.arange(36, 96), nr_notes, replace=False)
+    fundamentals_freq = 440 * 2**((pitches - 69) / 12)
+    fundamentals_amp = rng.uniform(0.3, 1, nr_notes)
+    partials_pos = np.arange(1, nr_partials + 1)
+    partials_amp = 0.88**np.arange(nr_partials)
+    fixed_freq = rng.uniform(50, 4000, nr_fixed)
+    fixed_amp = rng.uniform(0.01, 0.5, nr_fixed)
+    return fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp
+
+
+def midi_chords(file_name=MIDI_FILE):
+    """All simultaneities of a midi file: the sounding pitches and velocities after every group of note-on messages.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the midi file. (Default value = MIDI_FILE, BWV 227 from the examples)
+
+    Returns
+    -------
+    chords : list
+        List of tuples (fundamentals_freq, fundamentals_amp) in 12TET.
+    """
+    chords = []
+    sounding = dict()
+    changed = False
+    for msg in mido.MidiFile(file_name):
+        if msg.time > 0 and changed and len(sounding) > 0:
+            pitches = sorted(sounding)
+            chords.append((440 * 2**((np.array(pitches) - 69) / 12), np.array([sounding[p] for p in pitches])))
+            changed = False
+        if msg.type == 'note_on' and msg.velocity > 0:
+            sounding[msg.note] = msg.velocity / 127
+            changed = True
+        elif msg.type == 'note_off' or msg.type == 'note_on':
+            sounding.pop(msg.note, None)
+    return chords
+
+
+def time_it(function, repeat=5):
+    """Best time in seconds of a single call of function, out of repeat runs."""
+    number, _ = timeit.Timer(function).autorange()
+    return min(timeit.Timer(function).repeat(repeat=repeat, number=number)) / number
+
+
+def benchmark_quasi_constants(sizes=((2, 12, 0), (4, 12, 10), (10, 12, 10), (20, 12, 10), (10, 24, 10),
+                                     (10, 12, 50), (30, 24, 20))):
+    """Scaling of Dissonancereduction.quasi_constants in notes x partials x fixed frequencies."""
+    dissonancereduction = Dissonancereduction()
+    print("quasi_constants")
+    print("{:>6} {:>9} {:>6} {:>10} {:>12}".format('notes', 'partials', 'fixed', 'pairs', 'time (ms)'))
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        problem = random_problem(nr_notes, nr_partials, nr_fixed)
+        nr_pairs = len(dissonancereduction.quasi_constants(*problem)[0])
+        t = time_it(lambda: dissonancereduction.quasi_constants(*problem))
+        print("{:>6} {:>9} {:>6} {:>10} {:>12.3f}".format(nr_notes, nr_partials, nr_fixed, nr_pairs, t * 1e3))
+
+
+def benchmark_dissonance_and_gradient(sizes=((4, 12, 10), (10, 12, 10), (20, 12, 10), (30, 24, 20))):
+    """Time of a single evaluation of Dissonancereduction.dissonance_and_gradient with a precomputed evaluation plan,
+    i.e. the cost of one objective evaluation during Dissonancereduction.tune."""
+    dissonancereduction = Dissonancereduction()
+    print("dissonance_and_gradient")
+    print("{:>6} {:>9} {:>6} {:>10} {:>12}".format('notes', 'partials', 'fixed', 'pairs', 'time (us)'))
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp = \
+            random_problem(nr_notes, nr_partials, nr_fixed)
+        relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp)
+        plan = dissonancereduction.evaluation_plan(nr_notes, partials_pos,
+                                                   critical_bandwidths, volume_factors, relevant_pairs)
+        t = time_it(lambda: dissonancereduction.dissonance_and_gradient(
+            fundamentals_freq, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan))
+        print("{:>6} {:>9} {:>6} {:>10} {:>12.1f}".format(nr_notes, nr_partials, nr_fixed,
+                                                          len(relevant_pairs), t * 1e6))
+
+
+def benchmark_dissonance_many(nr_candidates=1000, sizes=((4, 12, 10), (10, 12, 10), (30, 24, 20))):
+    """Time per candidate of scoring many candidate tunings of the same chord with
+    Dissonancereduction.single_dissonance_and_gradient (quasi-constants for every candidate),
+    Dissonancereduction.dissonance_and_gradient (shared evaluation plan) and Dissonancereduction.dissonance_many."""
+    dissonancereduction = Dissonancereduction()
+    rng = np.random.default_rng(0)
+    print("dissonance_many ({} candidates)".format(nr_candidates))
+    print("{:>6} {:>9} {:>6} {:>12} {:>12} {:>12} {:>14}".format(
+        'notes', 'partials', 'fixed', 'single (us)', 'plan (us)', 'many (us)', 'no grad (us)'))
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp = \
+            random_problem(nr_notes, nr_partials, nr_fixed)
+        candidates = fundamentals_freq * 2**(rng.uniform(-20, 20, (nr_candidates, nr_notes)) / 1200)
+        relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp)
+        plan = dissonancereduction.evaluation_plan(nr_notes, partials_pos,
+                                                   critical_bandwidths, volume_factors, relevant_pairs)
+        t_single = time_it(lambda: [dissonancereduction.single_dissonance_and_gradient(
+            candidate, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp)
+            for candidate in candidates[:100]], repeat=3) / 100
+        t_plan = time_it(lambda: [dissonancereduction.dissonance_and_gradient(
+            candidate, partials_pos, fixed_freq, None, None, None, plan) for candidate in candidates], repeat=3)
+        t_many = time_it(lambda: dissonancereduction.dissonance_many(
+            candidates, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+            reference_freq=fundamentals_freq), repeat=3)
+        t_no_gradient = time_it(lambda: dissonancereduction.dissonance_many(
+            candidates, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+            reference_freq=fundamentals_freq, gradient=False), repeat=3)
+        print("{:>6} {:>9} {:>6} {:>12.1f} {:>12.1f} {:>12.1f} {:>14.1f}".format(
+            nr_notes, nr_partials, nr_fixed, t_single * 1e6, t_plan / nr_candidates * 1e6,
+            t_many / nr_candidates * 1e6, t_no_gradient / nr_candidates * 1e6))
+
+
+def benchmark_kernel_tables(tolerances=(1e-3, 1e-4, 1e-6), sizes=((4, 12, 10), (10, 12, 10), (30, 24, 20))):
+    """Evaluations per second of Dissonancereduction.dissonance_and_gradient and time of
+    Dissonancereduction.quasi_constants with the exact kernel and with lookup tables of different tolerances,
+    and the relative error of the dissonance and the gradient compared to the exact kernel."""
+    exact = Dissonancereduction()
+    print("kernel tables")
+    print("{:>10} {:>6} {:>9} {:>6} {:>12} {:>10} {:>12} {:>12}".format(
+        'tolerance', 'notes', 'partials', 'fixed', 'evals/second', 'qc (ms)', 'error fun', 'error jac'))
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp = \
+            random_problem(nr_notes, nr_partials, nr_fixed)
+        relevant_pairs, critical_bandwidths, volume_factors = exact.quasi_constants(
+            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp)
+        plan = exact.evaluation_plan(nr_notes, partials_pos, critical_bandwidths, volume_factors, relevant_pairs)
+        exact_fun, exact_jac = exact.dissonance_and_gradient(fundamentals_freq, partials_pos, fixed_freq,
+                                                             None, None, None, plan)
+        for tolerance in (None,) + tuple(tolerances):
+            dissonancereduction = Dissonancereduction(kernel_tolerance=tolerance)
+            t = time_it(lambda: dissonancereduction.dissonance_and_gradient(fundamentals_freq, partials_pos,
+                                                                            fixed_freq, None, None, None, plan))
+            t_qc = time_it(lambda: dissonancereduction.quasi_constants(
+                fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp))
+            fun, jac = dissonancereduction.dissonance_and_gradient(fundamentals_freq, partials_pos, fixed_freq,
+                                                                   None, None, None, plan)
+            print("{:>10} {:>6} {:>9} {:>6} {:>12.0f} {:>10.3f} {:>12.2e} {:>12.2e}".format(
+                str(tolerance), nr_notes, nr_partials, nr_fixed, 1 / t, t_qc * 1e3, abs(fun / exact_fun - 1),
+                np.max(np.abs(jac - exact_jac)) / np.max(np.abs(exact_jac))))
+
+
+def benchmark_compact_plans(sizes=((4, 12, 10), (10, 12, 10), (30, 24, 20)), nr_chords=100):
+    """Memory of an evaluation plan and evaluations per second of Dissonancereduction.dissonance_and_gradient with
+    the default and with compact plans, and the deviation of the tuned frequencies of midi chords."""
+    print("compact plans")
+    print("{:>6} {:>9} {:>6} {:>10} {:>14} {:>14} {:>12} {:>12}".format(
+        'notes', 'partials', 'fixed', 'pairs', 'plan (bytes)', 'compact', 'evals/second', 'compact'))
+    dissonancereduction = Dissonancereduction()
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp = \
+            random_problem(nr_notes, nr_partials, nr_fixed)
+        quasi_constants = dissonancereduction.quasi_constants(
+            fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp)
+        plans = [dissonancereduction.evaluation_plan(nr_notes, partials_pos, *quasi_constants[1:],
+                                                     quasi_constants[0], compact=compact)
+                 for compact in (False, True)]
+        rates = [1 / time_it(lambda: dissonancereduction.dissonance_and_gradient(
+                     fundamentals_freq, partials_pos, fixed_freq, None, None, None, plan)) for plan in plans]
+        print("{:>6} {:>9} {:>6} {:>10} {:>14} {:>14} {:>12.0f} {:>12.0f}".format(
+            nr_notes, nr_partials, nr_fixed, len(quasi_constants[0]), dissonancereduction.plan_nbytes(plans[0]),
+            dissonancereduction.plan_nbytes(plans[1]), *rates))
+    
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    compact = Dissonancereduction(compact_plans=True)
+    deviations, dissonances = [], []
+    for fundamentals_freq, fundamentals_amp in midi_chords()[:nr_chords]:
+        result = dissonancereduction.tune(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp)
+        compact_result = compact.tune(fundamentals_freq, fundamentals_amp, partials_pos, partials_amp)
+        deviations.append(np.max(np.abs(1200 * np.log2(compact_result['x'] / result['x']))))
+        dissonances.append(abs(compact_result['fun'] / result['fun'] - 1) if result['fun'] > 0 else 0)
+    print("tune with compact plans ({} midi chords): deviation (cents) median {:.1e}, max {:.1e}, "
+          "chords > 0.01 cents: {}, relative dissonance difference max {:.1e}".format(
+              len(deviations), np.median(deviations), np.max(deviations), np.sum(np.array(deviations) > 0.01),
+              np.max(dissonances)))
+
+
+def benchmark_timbres(sizes=((4, 12, 10), (10, 12, 10), (30, 24, 20))):
+    """Time of Dissonancereduction.quasi_constants, one evaluation of Dissonancereduction.dissonance_and_gradient
+    (with a precomputed evaluation plan) and Dissonancereduction.tune with one timbre for all complex tones,
+    with the same timbre given for every complex tone (the per-tone layout) and with a mixed ensemble where every
+    second complex tone has a pad timbre with a third of the partials."""
+    dissonancereduction = Dissonancereduction()
+    print("timbres")
+    print("{:>6} {:>9} {:>6} {:>10} {:>10} {:>22} {:>10} {:>10}".format(
+        'notes', 'partials', 'fixed', 'timbre', 'pairs', 'quasi_constants (us)', 'eval (us)', 'tune (ms)'))
+    for nr_notes, nr_partials, nr_fixed in sizes:
+        fundamentals_freq, fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp = \
+            random_problem(nr_notes, nr_partials, nr_fixed)
+        pad_pos, pad_amp = partials_pos[:nr_partials // 3], (3 / 5)**np.arange(nr_partials // 3)
+        timbres = (('uniform', partials_pos, partials_amp),
+                   ('per tone', [partials_pos] * nr_notes, [partials_amp] * nr_notes),
+                   ('mixed', [pad_pos if i % 2 else partials_pos for i in range(nr_notes)],
+                    [pad_amp if i % 2 else partials_amp for i in range(nr_notes)]))
+        for name, pos, amp in timbres:
+            arguments = (fundamentals_freq, fundamentals_amp, pos, amp, fixed_freq, fixed_amp)
+            relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(*arguments)
+            plan = dissonancereduction.evaluation_plan(nr_notes, pos, critical_bandwidths, volume_factors,
+                                                       relevant_pairs)
+            t_quasi_constants = time_it(lambda: dissonancereduction.quasi_constants(*arguments))
+            t_evaluation = time_it(lambda: dissonancereduction.dissonance_and_gradient(
+                fundamentals_freq, pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs, plan))
+            t_tune = time_it(lambda: dissonancereduction.tune(*arguments), repeat=3)
+            print("{:>6} {:>9} {:>6} {:>10} {:>10} {:>22.1f} {:>10.1f} {:>10.2f}".format(
+                nr_notes, nr_partials, nr_fixed, name, len(relevant_pairs), t_quasi_constants * 1e6,
+                t_evaluation * 1e6, t_tune * 1e3))
+
+
+def benchmark_methods(nr_chords=500, configurations=(('CG', 'frequency', False), ('CG', 'cents', False),
+                                                    ('L-BFGS-B', 'frequency', True), ('L-BFGS-B', 'cents', True),
+                                                    ('Newton-CG', 'cents', False), ('trust-ncg', 'cents', False),
+                                                    ('trust-krylov', 'cents', False), ('trust-exact', 'cents', False))):
+    """Iterations, evaluations of the objective and time per chord of Dissonancereduction.tune with different
+    optimization methods and parametrizations on the first chords of a midi file with the piano timbre.
+    Bounded configurations use the default relative_bounds, the others are unbounded (like in the Tuner),
+    'max dev' is the largest deviation of a tuned fundamental from 12TET in cents."""
+    chords = midi_chords()[:nr_chords]
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    print("methods ({} chords)".format(len(chords)))
+    print("{:>14} {:>10} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+        'method', 'variables', 'nit', 'nfev', 'time (ms)', 'converged', 'dissonance', 'max dev'))
+    for method, parametrization, bounded in configurations:
+        dissonancereduction = Dissonancereduction(method=method, parametrization=parametrization)
+        if not bounded:
+            dissonancereduction.relative_bounds = None
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results = [dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp) for chord in chords]
+        duration = time.perf_counter() - start
+        deviation = max(np.max(np.abs(1200 * np.log2(np.abs(r['x']) / chord[0]))) for r, chord in zip(results, chords))
+        print("{:>14} {:>10} {:>8.1f} {:>8.1f} {:>10.2f} {:>10.2f} {:>10.4f} {:>10.1f}".format(
+            method, parametrization, np.mean([r['nit'] for r in results]), np.mean([r['nfev'] for r in results]),
+            duration / len(chords) * 1e3, np.mean([r['success'] for r in results]),
+            np.mean([r['fun'] for r in results]), deviation))
+
+
+def benchmark_coarse_partials(nr_chords=300, schedules=(None, (3,), (5,), (3, 6)), methods=('L-BFGS-B', 'CG')):
+    """Time, evaluations (of all stages) and dissonance per chord of Dissonancereduction.tune optimizing with all
+    partials at once and with coarse-to-fine schedules (coarse_partials) on the chords of a midi file, with the pad
+    timbre (11 partials) and with 24 harmonic partials. CG runs without bounds like in the Tuner."""
+    chords = [chord for chord in midi_chords() if len(chord[0]) > 1][:nr_chords]
+    timbres = (('pad', np.array(Audiogenerator.presets['pad']['partials_pos']),
+                np.array(Audiogenerator.presets['pad']['partials_amp'])),
+               ('24 harmonics', np.arange(1, 25), 0.88**np.arange(24)))
+    print("coarse-to-fine ({} chords)".format(len(chords)))
+    print("{:>14} {:>10} {:>10} {:>10} {:>8} {:>10}".format('timbre', 'method', 'schedule', 'time (ms)', 'nfev',
+                                                            'dissonance'))
+    for name, partials_pos, partials_amp in timbres:
+        for method in methods:
+            for schedule in schedules:
+                dissonancereduction = Dissonancereduction(method=method, coarse_partials=schedule)
+                if method == 'CG':
+                    dissonancereduction.relative_bounds = None
+                start = time.perf_counter()
+                results = [dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp) for chord in chords]
+                elapsed = time.perf_counter() - start
+                print("{:>14} {:>10} {:>10} {:>10.2f} {:>8.1f} {:>10.4f}".format(
+                    name, method, str(schedule), elapsed / len(chords) * 1e3, np.mean([r['nfev'] for r in results]),
+                    np.mean([r['fun'] for r in results])))
+
+
+def benchmark_decomposition(nr_chords=50, clusters=((26, 38, 4), (84, 100, 8))):
+    """Time and evaluations per chord of Dissonancereduction.tune with and without decomposition into independent
+    groups of complex tones, solved one after the other or concurrently, on wide voicings with the piano timbre.
+    Every chord consists of a random choice of (lowest pitch, highest pitch, number of notes) per cluster."""
+    rng = np.random.default_rng(0)
+    chords = []
+    for _ in range(nr_chords):
+        pitches = np.concatenate([rng.choice(np.arange(low, high), nr_notes, replace=False)
+                                  for low, high, nr_notes in clusters])
+        chords.append((440 * 2**((pitches - 69) / 12), rng.uniform(0.3, 1, len(pitches))))
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    dissonancereduction = Dissonancereduction()
+    nr_components = [len(dissonancereduction.tone_components(
+        len(chord[0]), dissonancereduction.quasi_constants(chord[0], chord[1], partials_pos, partials_amp, [], [])[0]
+    )) for chord in chords]
+    print("decomposition ({} chords with {} notes, {:.1f} components on average)".format(
+        len(chords), len(chords[0][0]), np.mean(nr_components)))
+    print("{:>22} {:>10} {:>8} {:>10}".format('', 'time (ms)', 'nfev', 'dissonance'))
+    with concurrent.futures.ThreadPoolExecutor(4) as threads, concurrent.futures.ProcessPoolExecutor(4) as processes:
+        for name, decompose, executor in (('joint', False, None), ('components', True, None),
+                                          ('components, threads', True, threads),
+                                          ('components, processes', True, processes)):
+            dissonancereduction = Dissonancereduction(decompose=decompose, executor=executor)
+            dissonancereduction.tune(chords[0][0], chords[0][1], partials_pos, partials_amp)  # start the workers
+            start = time.perf_counter()
+            results = [dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp) for chord in chords]
+            print("{:>22} {:>10.2f} {:>8.1f} {:>10.4f}".format(
+                name, (time.perf_counter() - start) / len(chords) * 1e3, np.mean([r['nfev'] for r in results]),
+                np.mean([r['fun'] for r in results])))
+
+
+def benchmark_multistart(nr_chords=40, nr_workers=4, clusters=((55, 67, 6),)):
+    """Time and dissonance per chord of Dissonancereduction.tune and Dissonancereduction.tune_multistart on random
+    clusters with the piano timbre: sequentially, in a process pool that is kept for all chords and in a new process
+    pool for every chord (only a few chords, to show the start-up costs)."""
+    rng = np.random.default_rng(0)
+    chords = []
+    for _ in range(nr_chords):
+        pitches = np.concatenate([rng.choice(np.arange(low, high), nr_notes, replace=False)
+                                  for low, high, nr_notes in clusters])
+        chords.append((440 * 2**((pitches - 69) / 12), rng.uniform(0.3, 1, len(pitches))))
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    print("multistart ({} clusters of {} notes, {} workers)".format(nr_chords, len(chords[0][0]), nr_workers))
+    print("{:>26} {:>10} {:>8} {:>12}".format('', 'time (ms)', 'starts', 'dissonance'))
+    
+    def run(name, tune, chords):
+        start = time.perf_counter()
+        results = [tune(chord) for chord in chords]
+        print("{:>26} {:>10.2f} {:>8.1f} {:>12.4f}".format(
+            name, (time.perf_counter() - start) / len(chords) * 1e3,
+            np.mean([len(r.get('fun_starts', [0])) for r in results]), np.mean([r['fun'] for r in results])))
+    
+    dissonancereduction = Dissonancereduction()
+    run('tune', lambda chord: dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp), chords)
+    multistart = lambda chord: dissonancereduction.tune_multistart(chord[0], chord[1], partials_pos, partials_amp,
+                                                                   seed=0)
+    run('multistart, sequential', multistart, chords)
+    with concurrent.futures.ProcessPoolExecutor(nr_workers) as executor:
+        dissonancereduction.executor = executor
+        multistart(chords[0])  # start the workers
+        run('multistart, kept pool', multistart, chords)
+    
+    def new_pool(chord):
+        with concurrent.futures.ProcessPoolExecutor(nr_workers) as executor:
+            dissonancereduction.executor = executor
+            return multistart(chord)
+    run('multistart, pool per chord', new_pool, chords[:5])
+
+
+def benchmark_tie_groups(nr_chords=200, methods=('L-BFGS-B', 'trust-ncg')):
+    """Time, evaluations and iterations per chord of Dissonancereduction.tune with every complex tone as a variable
+    and with one variable per pitch class (tie_groups="pitch_class") with the piano timbre, on the chords of a midi
+    file and on voicings that double 4 random pitch classes in 3 octaves."""
+    rng = np.random.default_rng(0)
+    doubled = []
+    for _ in range(nr_chords):
+        pitch_classes = rng.choice(12, 4, replace=False)
+        pitches = np.sort(np.concatenate([pitch_classes + octave for octave in (48, 60, 72)]))
+        doubled.append((440 * 2**((pitches - 69) / 12), rng.uniform(0.3, 1, len(pitches))))
+    chord_sets = (('midi file', [chord for chord in midi_chords() if len(chord[0]) > 1][:nr_chords]),
+                  ('doubled', doubled))
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    for name, chords in chord_sets:
+        nr_tie_groups = [len(np.unique(Dissonancereduction().tie_labels(chord[0], "pitch_class")))
+                         for chord in chords]
+        print("tie groups, {} ({} chords, {:.2f} notes and {:.2f} pitch classes on average)".format(
+            name, len(chords), np.mean([len(chord[0]) for chord in chords]), np.mean(nr_tie_groups)))
+        print("{:>10} {:>12} {:>10} {:>8} {:>8} {:>10}".format('method', 'tie groups', 'time (ms)', 'nfev', 'nit',
+                                                                'dissonance'))
+        for method in methods:
+            # trust-ncg doesn't support bounds
+            dissonancereduction = Dissonancereduction(method=method, parametrization='cents')
+            if method == 'trust-ncg':
+                dissonancereduction.relative_bounds = None
+            for tie_groups in (None, "pitch_class"):
+                start = time.perf_counter()
+                results = [dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp,
+                                                    tie_groups=tie_groups) for chord in chords]
+                elapsed = time.perf_counter() - start
+                print("{:>10} {:>12} {:>10.2f} {:>8.1f} {:>8.1f} {:>10.4f}".format(
+                    method, str(tie_groups), elapsed / len(chords) * 1e3, np.mean([r['nfev'] for r in results]),
+                    np.mean([r['nit'] for r in results]), np.mean([r['fun'] for r in results])))
+
+
+def benchmark_partial_retuning(full_retuning_every=(1, 4, 16)):
+    """Time and number of optimization variables per chord of tuning the chords of a midi file one after the other with
+    the Tuner settings, once tuning all running notes every time and once with Tuner.partial_tune (only the notes that
+    started are optimized, the held notes are fixed frequencies) and a full tuning of all notes every few chords."""
+    chords = midi_chords()
+    tuner = Tuner()
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    pitches = [np.round(12 * np.log2(chord[0] / 440) + 69).astype(int).tolist() for chord in chords]
+    print("partial retuning ({} chords, {:.2f} notes on average)".format(
+        len(chords), np.mean([len(chord[0]) for chord in chords])))
+    print("{:>22} {:>10} {:>10} {:>12}".format('full tuning every', 'time (ms)', 'variables', 'dissonance'))
+    for every in full_retuning_every:
+        tuner._tuned_freq = dict()
+        variables, tunings = [], []
+        start = time.perf_counter()
+        for c, chord in enumerate(chords):
+            if c % every == 0:
+                variables.append(len(chord[0]))
+                tuned = tuner.dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp)['x']
+            else:
+                variables.append(len([p for p in pitches[c] if p not in tuner._tuned_freq]))
+                tuned = tuner.partial_tune(pitches[c], chord[1], partials_pos, partials_amp, np.array([]), np.array([]))
+            tuner._tuned_freq = dict(zip(pitches[c], tuned))
+            tunings.append(tuned)
+        elapsed = time.perf_counter() - start
+        dissonances = [tuner.dissonancereduction.dissonance_many([tuned], chord[1], partials_pos, partials_amp,
+                                                                 reference_freq=chord[0], gradient=False)[0][0]
+                       for tuned, chord in zip(tunings, chords)]
+        print("{:>22} {:>10.3f} {:>10.2f} {:>12.4f}".format(
+            '{} chords'.format(every), elapsed / len(chords) * 1e3, np.mean(variables), np.mean(dissonances)))
+
+
+def benchmark_degradation_levels(nr_chords=30, nr_notes=16, nr_fixed=40):
+    """Time per tuning and dissonance (of the full problem) at every degradation level of the Tuner on big chords
+    with the pad timbre and many fixed frequencies, like many notes and analyzer peaks arriving together.
+    Voices that are left out keep their 12TET frequencies."""
+    tuner = Tuner()
+    partials_pos = np.array(Audiogenerator.presets['pad']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['pad']['partials_amp'])
+    problems = [random_problem(nr_notes, 1, nr_fixed, seed=seed) for seed in range(nr_chords)]
+    print("degradation levels ({} chords, {} notes, {} fixed frequencies, pad timbre)".format(
+        nr_chords, nr_notes, nr_fixed))
+    print("{:>6} {:>8} {:>10} {:>10} {:>12}".format('level', 'voices', 'pairs', 'time (ms)', 'dissonance'))
+    for level in range(len(tuner.degradation_levels)):
+        nr_pairs, times, dissonances = [], [], []
+        for fundamentals_freq, fundamentals_amp, _, _, fixed_freq, fixed_amp in problems:
+            start = time.perf_counter()
+            voices, pos, amp, shrunk_fixed_freq, shrunk_fixed_amp = tuner.shrink_problem(
+                fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp, level=level)
+            quasi_constants = tuner.dissonancereduction.quasi_constants(
+                fundamentals_freq[voices], fundamentals_amp[voices], pos, amp, shrunk_fixed_freq, shrunk_fixed_amp)
+            tuned = fundamentals_freq.copy()
+            tuned[voices] = tuner.dissonancereduction.tune(
+                fundamentals_freq[voices], fundamentals_amp[voices], pos, amp, shrunk_fixed_freq, shrunk_fixed_amp,
+                quasi_constants=quasi_constants)['x']
+            times.append(time.perf_counter() - start)
+            nr_pairs.append(len(quasi_constants[0]))
+            dissonances.append(tuner.dissonancereduction.dissonance_many(
+                [tuned], fundamentals_amp, partials_pos, partials_amp, fixed_freq, fixed_amp,
+                reference_freq=fundamentals_freq, gradient=False)[0][0])
+        print("{:>6} {:>8} {:>10.0f} {:>10.2f} {:>12.4f}".format(
+            level, len(voices), np.mean(nr_pairs), np.mean(times) * 1e3, np.mean(dissonances)))
+
+
+def benchmark_scheduler(nr_messages=(100, 1000), delay=0.3, interval=0.001):
+    """Lateness of delayed calls (like the delayed midi messages of the Tuner) with one thread per call that sleeps
+    for the delay and with a Scheduler, for bursts of messages arriving every interval seconds."""
+    print("scheduler (delay {} s, one message every {} ms)".format(delay, interval * 1e3))
+    print("{:>10} {:>20} {:>14} {:>18} {:>18}".format(
+        'messages', '', 'max threads', 'mean late (ms)', 'max late (ms)'))
+    for n in nr_messages:
+        # one thread per message
+        lateness = []
+        threads = []
+        max_threads = 0
+        def handler(due_time):
+            time.sleep(delay)
+            lateness.append(time.monotonic() - due_time)
+        for _ in range(n):
+            thread = threading.Thread(target=handler, args=(time.monotonic() + delay,))
+            thread.start()
+            threads.append(thread)
+            max_threads = max(max_threads, threading.active_count())
+            time.sleep(interval)
+        for thread in threads:
+            thread.join()
+        print("{:>10} {:>20} {:>14} {:>18.3f} {:>18.3f}".format(
+            n, 'thread per message', max_threads, np.mean(lateness) * 1e3, np.max(lateness) * 1e3))
+
+        scheduler = Scheduler()
+        scheduler.start()
+        max_threads = 0
+        for _ in range(n):
+            scheduler.schedule(delay, lambda: None)
+            max_threads = max(max_threads, threading.active_count())
+            time.sleep(interval)
+        scheduler.stop()
+        statistics = scheduler.statistics
+        print("{:>10} {:>20} {:>14} {:>18.3f} {:>18.3f}".format(
+            n, 'scheduler', max_threads, statistics['mean_lateness'] * 1e3, statistics['max_lateness'] * 1e3))
+
+
+def benchmark_tune_loop(nr_requests=200, idle_time=2):
+    """Time from Tuner.request_tuning until the tuner thread starts a tuning (the tuning itself is left out) and the
+    CPU time the tuner thread uses while it waits for idle_time seconds without any requests."""
+    tuner = Tuner(tuning_interval=10)
+    started = []
+    tuner.tune_running_notes = lambda: started.append(time.monotonic())
+    tuner._stop_signal.clear()
+    tuner._stop_tuning_signal.clear()
+    thread = threading.Thread(target=tuner.tune_loop)
+    thread.start()
+    delays = []
+    for _ in range(nr_requests):
+        time.sleep(0.003)
+        requested = time.monotonic()
+        tuner.request_tuning()
+        while len(started) == len(delays):
+            time.sleep(0.0001)
+        delays.append(started[-1] - requested)
+    cpu_start = time.process_time()
+    time.sleep(idle_time)
+    cpu_time = time.process_time() - cpu_start
+    tuner._stop_signal.set()
+    with tuner._tuning_condition:
+        tuner._tuning_condition.notify()
+    thread.join()
+    print("tune loop: request to tuning median {:.3f} ms, max {:.3f} ms, idle CPU time {:.2f} ms/s".format(
+        np.median(delays) * 1e3, np.max(delays) * 1e3, cpu_time / idle_time * 1e3))
+
+
+def random_midi_messages(nr_messages, max_sounding=5, seed=0):
+    """Random note-on and note-off messages with at most max_sounding notes sounding at the same time.
+
+    Parameters
+    ----------
+    nr_messages : int
+        Number of messages.
+    max_sounding : int
+        Maximal number of notes sounding at the same time. (Default value = 5)
+    seed : int
+        Seed of the random number generator. (Default value = 0)
+
+    Returns
+    -------
+    messages : list
+        List of tuples ('note_on', pitch, amp) and ('note_off', pitch) as used by AsyncTuner.run.
+    """
+    rng = np.random.default_rng(seed)
+    sounding, messages = [], []
+    for _ in range(nr_messages):
+        if len(sounding) >= max_sounding or (len(sounding) > 0 and rng.random() < 0.4):
+            messages.append(('note_off', sounding.pop(rng.integers(len(sounding)))))
+        else:
+            pitch = int(rng.choice([p for p in range(48, 80) if p not in sounding]))
+            sounding.append(pitch)
+            messages.append(('note_on', pitch, 0.8))
+    return messages
+
+
+def random_chord_changes(nr_chords, notes_per_chord=(3, 6), spread=0.005, chord_interval=0.4, seed=0):
+    """Random chords whose note-on messages arrive spread seconds apart, as when a chord is played on a keyboard.
+    The notes of a chord are released right before the next chord starts, the chords start at random times
+    (0.5 to 1.5 times chord_interval apart), so they don't keep the same phase to the regular tunings. A chord has
+    no pitch of the two chords before it, which may still sound in their release time.
+
+    Parameters
+    ----------
+    nr_chords : int
+        Number of chords.
+    notes_per_chord : pair of int
+        Smallest and largest number of notes of a chord. (Default value = (3, 6))
+    spread : float
+        Time (in seconds) between two note-on messages of a chord. (Default value = 0.005)
+    chord_interval : float
+        Mean time (in seconds) between the first note-on messages of two chords. (Default value = 0.4)
+    seed : int
+        Seed of the random number generator. (Default value = 0)
+
+    Returns
+    -------
+    messages : list
+        List of tuples ('note_on', pitch, amp) and ('note_off', pitch), see random_midi_messages.
+    times : list of float
+        Time (in seconds from the start) of every message.
+    """
+    rng = np.random.default_rng(seed)
+    messages, times, sounding, released = [], [], [], []
+    start = 0
+    for _ in range(nr_chords):
+        start += rng.uniform(0.5, 1.5) * chord_interval
+        for pitch in sounding:
+            messages.append(('note_off', pitch))
+            times.append(start)
+        candidates = [p for p in range(36, 96) if p not in sounding and p not in released]
+        released = sounding
+        sounding = sorted(rng.choice(candidates, rng.integers(notes_per_chord[0], notes_per_chord[1] + 1),
+                                     replace=False).tolist())
+        for k, pitch in enumerate(sounding):
+            messages.append(('note_on', pitch, 0.8))
+            times.append(start + k * spread)
+    return messages, times
+
+
+def play_tuner_sessions(tuners, streams, interval, times=None):
+    """Feed midi messages to Tuner sessions (with scheduler and tuner thread, without midi and audio input) in real
+    time, one message every interval seconds, and stop the sessions when all messages were played.
+
+    Parameters
+    ----------
+    tuners : list of adaptivetuning.Tuner
+        The sessions.
+    streams : list of list
+        The messages for every session, see random_midi_messages.
+    interval : float
+        Time (in seconds) between two messages.
+    times : list of list of float or None
+        Time (in seconds from the start) of every message for every session, see random_chord_changes.
+        If None is given, the messages are interval seconds apart. (Default value = None)
+
+    Returns
+    -------
+    input_lateness : list of float
+        Time (in seconds) between the due time of every message and the time it was handed to the Tuner, which shows
+        how much the tuning delays a midi input thread.
+    """
+    input_lateness = []
+    for tuner in tuners:
+        tuner._stop_signal.clear()
+        tuner._stop_tuning_signal.clear()
+        if tuner.use_tuning_process:
+            tuner.tuning_process.start()
+        tuner.scheduler.start()
+    threads = [threading.Thread(target=tuner.tune_loop) for tuner in tuners]
+
+    def feed(tuner, stream, stream_times):
+        start = time.monotonic()
+        for k, message in enumerate(stream):
+            due_time = start + ((k + 1) * interval if stream_times is None else stream_times[k])
+            time.sleep(max(0, due_time - time.monotonic()))
+            input_lateness.append(time.monotonic() - due_time)
+            if message[0] == 'note_on':
+                tuner.midi_note_on_callback(*message[1:])
+            else:
+                tuner.midi_note_off_callback(message[1])
+    if times is None:
+        times = [None] * len(tuners)
+    threads += [threading.Thread(target=feed, args=(tuner, stream, stream_times))
+                for tuner, stream, stream_times in zip(tuners, streams, times)]
+    with warnings.catch_warnings():
+        # the unbounded optimizations sometimes run off to invalid frequencies
+        warnings.simplefilter('ignore')
+        for thread in threads:
+            thread.start()
+        for thread in threads[len(tuners):]:
+            thread.join()
+        for tuner in tuners:
+            tuner._stop_signal.set()
+            with tuner._tuning_condition:
+                tuner._tuning_condition.notify()
+        for thread in threads[:len(tuners)]:
+            thread.join()
+        for tuner in tuners:
+            tuner.scheduler.stop()
+            tuner.tuning_process.stop()
+    return input_lateness
+
+
+def benchmark_async_tuner(nr_sessions=(1, 4), nr_messages=200, interval=0.005, audio_lag=0.05):
+    """Lateness of the playback of midi messages (compared to audio_lag after their arrival) in concurrent tuning
+    sessions that tune all running notes on every note-on: AsyncTuner sessions on one event loop, Tuner sessions
+    (scheduler thread and tuner thread each) and Tuner sessions with one thread per midi message that sleeps for
+    audio_lag, as the Tuner did before it had a scheduler."""
+    print("async tuner ({} messages per session, one every {} ms, audio lag {} ms)".format(
+        nr_messages, interval * 1e3, audio_lag * 1e3))
+    print("{:>10} {:>20} {:>18} {:>18} {:>10}".format('sessions', '', 'mean late (ms)', 'max late (ms)', 'tunings'))
+    
+    for n in nr_sessions:
+        streams = [random_midi_messages(nr_messages, seed=seed) for seed in range(n)]
+        
+        async def messages(stream):
+            for message in stream:
+                await asyncio.sleep(interval)
+                yield message
+        
+        async def sessions():
+            tuners = [AsyncTuner(audio_lag=audio_lag) for _ in range(n)]
+            await asyncio.gather(*[tuner.run(messages(stream)) for tuner, stream in zip(tuners, streams)])
+            return tuners
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            tuners = asyncio.run(sessions())
+        print("{:>10} {:>20} {:>18.3f} {:>18.3f} {:>10}".format(
+            n, 'AsyncTuner', np.mean([tuner.statistics['mean_lateness'] for tuner in tuners]) * 1e3,
+            np.max([tuner.statistics['max_lateness'] for tuner in tuners]) * 1e3,
+            sum(tuner.statistics['tunings'] for tuner in tuners)))
+        
+        for thread_per_message in (False, True):
+            tuners = [Tuner(audio_lag=audio_lag) for _ in range(n)]
+            lateness = []
+            if thread_per_message:
+                def handler(due_time, function, args):
+                    time.sleep(max(0, due_time - time.monotonic()))
+                    lateness.append(time.monotonic() - due_time)
+                    function(*args)
+                for tuner in tuners:
+                    tuner.scheduler.schedule = lambda delay, function, *args: threading.Thread(
+                        target=handler, args=(time.monotonic() + delay, function, args)).start()
+            play_tuner_sessions(tuners, streams, interval)
+            if not thread_per_message:
+                mean_lateness = np.mean([tuner.scheduler.statistics['mean_lateness'] for tuner in tuners])
+                max_lateness = np.max([tuner.scheduler.statistics['max_lateness'] for tuner in tuners])
+            else:
+                mean_lateness, max_lateness = np.mean(lateness), np.max(lateness)
+            print("{:>10} {:>20} {:>18.3f} {:>18.3f} {:>10}".format(
+                n, 'thread per message' if thread_per_message else 'Tuner', mean_lateness * 1e3, max_lateness * 1e3,
+                ''))
+
+
+def benchmark_tuning_process(nr_messages=300, interval=0.005, audio_lag=0.05, max_sounding=(4, 10)):
+    """Lateness of the midi input (the thread that hands the messages to the Tuner) and of the playback of a Tuner
+    session that tunes all running notes on every note-on, with the optimizer in the tuner thread and in the
+    persistent worker process of Tuner.tuning_process."""
+    print("tuning process ({} messages, one every {} ms, audio lag {} ms)".format(
+        nr_messages, interval * 1e3, audio_lag * 1e3))
+    print("{:>8} {:>10} {:>16} {:>16} {:>16} {:>16} {:>10} {:>10}".format(
+        'notes', 'process', 'input p99 (ms)', 'input max (ms)', 'play mean (ms)', 'play max (ms)', 'stale',
+        'skipped'))
+    for sounding in max_sounding:
+        stream = random_midi_messages(nr_messages, max_sounding=sounding)
+        for use_tuning_process in (False, True):
+            tuner = Tuner(audio_lag=audio_lag)
+            tuner.use_tuning_process = use_tuning_process
+            input_lateness = play_tuner_sessions([tuner], [stream], interval)
+            statistics = tuner.scheduler.statistics
+            process_statistics = tuner.tuning_process.statistics
+            print("{:>8} {:>10} {:>16.3f} {:>16.3f} {:>16.3f} {:>16.3f} {:>10} {:>10}".format(
+                sounding, str(use_tuning_process), np.percentile(input_lateness, 99) * 1e3,
+                np.max(input_lateness) * 1e3, statistics['mean_lateness'] * 1e3, statistics['max_lateness'] * 1e3,
+                process_statistics['stale'], process_statistics['skipped']))
+
+
+def benchmark_preemptive_tuning(nr_chords=40, notes_per_chord=((3, 6), (8, 12)), spreads=(0, 0.01), audio_lag=0.3,
+                                seeds=(0, 1, 2)):
+    """Latency of chord changes in Tuner sessions with and without preemptive_tuning: the time from the first
+    note-on message of a chord (see random_chord_changes) to the first finished tuning that includes all its notes.
+    Chords that were not tuned before the next chord started count as missed. Adaptive degradation is turned off."""
+    print("preemptive tuning ({} chords, audio lag {} ms, seeds {})".format(nr_chords, audio_lag * 1e3, seeds))
+    print("{:>8} {:>11} {:>11} {:>18} {:>18} {:>18} {:>8} {:>10}".format(
+        'notes', 'spread (ms)', 'preemptive', 'median lat. (ms)', 'p95 latency (ms)', 'max latency (ms)', 'missed',
+        'stopped'))
+    for notes in notes_per_chord:
+        for spread in spreads:
+            for preemptive_tuning in (False, True):
+                latencies, missed, stopped = [], 0, 0
+                for seed in seeds:
+                    stream, times = random_chord_changes(nr_chords, notes, spread, seed=seed)
+                    tuner = Tuner(audio_lag=audio_lag, safe_session_log=True)
+                    tuner.adaptive_degradation = False
+                    tuner.preemptive_tuning = preemptive_tuning
+                    tuner.init_session_log()
+                    # the session log is timed from here, the messages from the start of the feeding thread
+                    tuner._start_time = time.time()
+                    play_tuner_sessions([tuner], [stream], None, [times])
+                    stopped += tuner.preempted_tunings
+                    tunings = sorted(tuner.session_log['tunings'].items())
+                    # a chord starts with a note-on message that does not follow a note-on message
+                    starts = [k for k, message in enumerate(stream)
+                              if message[0] == 'note_on' and (k == 0 or stream[k - 1][0] != 'note_on')]
+                    # the session stops right after the last chord started, so it is not taken into account
+                    for start, end in zip(starts, starts[1:]):
+                        pitches = [message[1] for message in stream[start:end] if message[0] == 'note_on']
+                        next_time = times[end]
+                        finished = [t for t, tuning in tunings
+                                    if times[start] <= t < next_time and set(pitches) <= set(tuning['pitches'])]
+                        if len(finished) == 0:
+                            missed += 1
+                        else:
+                            latencies.append(finished[0] - times[start])
+                print("{:>8} {:>11} {:>11} {:>18.1f} {:>18.1f} {:>18.1f} {:>8} {:>10}".format(
+                    '{}-{}'.format(*notes), spread * 1e3, str(preemptive_tuning), np.median(latencies) * 1e3,
+                    np.percentile(latencies, 95) * 1e3, np.max(latencies) * 1e3, missed, stopped))
+
+
+def benchmark_tune_batch(batch_sizes=(1, 8, 32, 128)):
+    """Throughput (chords/second) of Dissonancereduction.tune_batch versus a loop of Dissonancereduction.tune
+    on the chords of a midi file with the piano timbre."""
+    dissonancereduction = Dissonancereduction()
+    chords = midi_chords()
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    print("tune_batch ({} chords)".format(len(chords)))
+    print("{:>12} {:>14} {:>10} {:>14}".format('batch size', 'chords/second', 'converged', 'mean dissonance'))
+    start = time.perf_counter()
+    results = [dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_amp) for chord in chords]
+    print("{:>12} {:>14.1f} {:>10} {:>14.4f}".format(
+        'loop', len(chords) / (time.perf_counter() - start), sum(r['success'] for r in results),
+        np.mean([r['fun'] for r in results])))
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        results = [r for b in range(0, len(chords), batch_size)
+                   for r in dissonancereduction.tune_batch(chords[b:b + batch_size], partials_pos, partials_amp)]
+        print("{:>12} {:>14.1f} {:>10} {:>14.4f}".format(
+            batch_size, len(chords) / (time.perf_counter() - start), sum(r['success'] for r in results),
+            np.mean([r['fun'] for r in results])))
+
+
+def benchmark_tuning_cache(max_sizes=(16, 256, 4096)):
+    """Hit rate and throughput (chords/second) of a Tuningcache on the chords of a midi file."""
+    chords = midi_chords()
+    partials_pos = np.array(Audiogenerator.presets['piano']['partials_pos'])
+    partials_amp = np.array(Audiogenerator.presets['piano']['partials_amp']) / 5.4
+    print("Tuningcache ({} chords)".format(len(chords)))
+    print("{:>10} {:>14} {:>9} {:>10}".format('max size', 'chords/second', 'hit rate', 'evictions'))
+    for max_size in max_sizes:
+        cache = Tuningcache(max_size=max_size)
+        start = time.perf_counter()
+        for chord in chords:
+            cache.tune(chord[0], chord[1], partials_pos, partials_amp)
+        print("{:>10} {:>14.1f} {:>9.3f} {:>10}".format(max_size, len(chords) / (time.perf_counter() - start),
+                                                         cache.statistics['hit_rate'], cache.evictions))
+
+
+if __name__ == '__main__':
+    benchmark_quasi_constants()
+    benchmark_dissonance_and_gradient()
+    benchmark_kernel_tables()
+    benchmark_dissonance_many()
+    benchmark_compact_plans()
+    benchmark_timbres()
+    benchmark_methods()
+    benchmark_coarse_partials()
+    benchmark_decomposition()
+    benchmark_multistart()
+    benchmark_tie_groups()
+    benchmark_partial_retuning()
+    benchmark_degradation_levels()
+    benchmark_scheduler()
+    benchmark_tune_loop()
+    benchmark_async_tuner()
+    benchmark_tuning_process()
+    benchmark_preemptive_tuning()
+    benchmark_tune_batch()
+    benchmark_tuning_cache()
@@ -0,0 +1,56 @@
+from adaptivetuning import AsyncTuner
+import asyncio
+import numpy as np
+import os
+
+
+async def messages(*timed_messages):
+    """Async iterable of the given (time, message) pairs in real time."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for due_time, message in timed_messages:
+        await asyncio.sleep(max(0, start + due_time - loop.time()))
+        yield message
+
+
+def test_asynctuner():
+    major = messages((0, ('note_on', 60, 0.8)), (0, ('note_on', 64, 0.8)), (0, ('note_on', 67, 0.8)),
+                     (0.2, ('note_off', 64)))
+    minor = messages((0, ('note_on', 57, 0.8)), (0.05, ('note_on', 60, 0.8)), (0.1, ('note_on', 64, 0.8)),
+                     (0.2, ('stop',)))
+    peaks = messages((0.15, ([440.], [0.5])))
+    first, second = AsyncTuner(audio_lag=0.05), AsyncTuner(audio_lag=0.05, tuning_interval=0.05)
+    frequencies = dict()
+
+    async def session(tuner, midi_messages, peaks=None):
+        run = asyncio.ensure_future(tuner.run(midi_messages, peaks))
+        await asyncio.sleep(0.18)
+        keys = tuner.audiogenerator.keys
+        frequencies[tuner] = {pitch: keys[pitch].frequency for pitch in keys
+                              if keys[pitch] is not None and keys[pitch].currently_running}
+        await run
+
+    async def sessions():
+        await asyncio.gather(session(first, major), session(second, minor, peaks))
+    asyncio.run(sessions())
+
+    # both sessions tuned their chords concurrently
+    cents = lambda frequency, pitch: 1200 * np.log2(frequency / 440) - 100 * (pitch - 69)
+    assert sorted(frequencies[first]) == [60, 64, 67]
+    assert sorted(frequencies[second]) == [57, 60, 64]
+    # the major third is smaller than in 12TET
+    assert cents(frequencies[first][64], 64) - cents(frequencies[first][60], 60) < -5
+    for tuner, nr_messages in ((first, 4), (second, 4)):
+        statistics = tuner.statistics
+        assert statistics['tunings'] >= 1
+        assert statistics['messages'] == nr_messages
+        assert 0 <= statistics['mean_lateness'] <= statistics['max_lateness'] < 0.05
+    assert second.fixed_freq == [440.]
+
+
+def test_asynctuner_midi_file():
+    tuner = AsyncTuner(audio_lag=0.01)
+    midi_file = os.path.join(os.path.dirname(__file__), 'midi_files', 'cd2.mid')
+    asyncio.run(tuner.run(tuner.midi_file_messages(midi_file)))
+    # the stop message at the end is played, too
+    assert tuner.statistics['messages'] > 1
@@ -1,3 +1,4 @@
+import numpy as np
 from adaptivetuning import Audiogenerator
 from adaptivetuning import Scale
 
@@ -92,3 +93,30 @@ def test_release():
     assert audiogenerator.keys[69].currently_running
     now = 2.1
 
+
+
+def test_running_notes():
+    audiogenerator = Audiogenerator(sc=None)
+    assert audiogenerator.running_notes() == ([], [], [], [])
+
+    audiogenerator.note_on('C4', 0.5)
+    audiogenerator.note_on('E4', 0.7)
+    audiogenerator.note_on('G4', 0.9)
+    audiogenerator.stop_all()
+    audiogenerator.note_on('C4', 0.5)
+    audiogenerator.note_on('E4', 0.7)
+    # only running keys, all with the same timbre which is returned once
+    pitches, amplitudes, partials_pos, partials_amp = audiogenerator.running_notes()
+    assert pitches == [60, 64]
+    assert approx_equal(amplitudes, [0.5 * audiogenerator.global_amplitude, 0.7 * audiogenerator.global_amplitude])
+    assert np.array_equal(partials_pos, audiogenerator.partials_pos)
+    assert np.array_equal(partials_amp, audiogenerator.partials_amp)
+
+    # a key registered with another timbre
+    audiogenerator.partials_pos = [1, 2, 3]
+    audiogenerator.note_on('G4', 0.9)
+    pitches, _, partials_pos, partials_amp = audiogenerator.running_notes()
+    assert pitches == [60, 64, 67]
+    assert len(partials_pos) == len(partials_amp) == 3
+    assert np.array_equal(partials_pos[2], [1, 2, 3]) and len(partials_amp[2]) == 3
+    assert not np.array_equal(partials_pos[0], partials_pos[2])
@@ -1,3 +1,6 @@
+import concurrent.futures
+import pickle
+import pytest
 from adaptivetuning import Dissonancereduction
 import numpy as np
 
@@ -127,4 +130,579 @@ def test_zero_cases():
                                       np.array(partials_pos), np.array(partials_vol),
                                       np.array([]), np.array([]))
     assert len(result['x']) == 1
-    assert result['x'][0] == 440
\ No newline at end of file
+    assert result['x'][0] == 440
+
+def test_quasi_constants_pairs():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    fundamentals = 440 * 2**(np.array([0, 3, 7, 12, 16]) / 12)
+    fixed_freq = np.array([440., 660., 1320.])
+    fixed_vol = np.array([0.5, 0.5, 0.5])
+
+    dissonancereduction = Dissonancereduction()
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol, fixed_freq, fixed_vol)
+    assert len(relevant_pairs) == len(critical_bandwidths) == len(volume_factors) > 0
+
+    tone_pairs = relevant_pairs[relevant_pairs[:,3] >= 0]
+    fixed_pairs = relevant_pairs[relevant_pairs[:,3] < 0]
+    # every pair of partials of two complex tones appears only once and a tone does not form pairs with itself
+    assert all(tone_pairs[:,0] < tone_pairs[:,2])
+    assert len(np.unique(tone_pairs, axis=0)) == len(tone_pairs)
+    # the tonic is also given as fixed frequency, its first partial is relevant to it
+    assert [0, 0, 0, -1] in fixed_pairs.tolist()
+    assert all(fixed_pairs[:,2] < len(fixed_freq))
+    assert all(volume_factors > 0)
+
+
+def brute_force_quasi_constants(dissonancereduction, fundamentals_freq, fundamentals_amp, partials_pos,
+                                partials_amp, fixed_freq, fixed_amp):
+    """The relevant pairs of quasi_constants by comparing every audible partial with every other one,
+    as a sorted list of (i, k, j, l, critical bandwidth, volume factor)."""
+    if not Dissonancereduction.per_tone(partials_pos):
+        partials_pos = [partials_pos] * len(fundamentals_freq)
+        partials_amp = [partials_amp] * len(fundamentals_freq)
+    # (tone or -1, partial or fixed frequency index, frequency, amplitude)
+    partials = [(i, k, f * p, a * q) for i, (f, a) in enumerate(zip(fundamentals_freq, fundamentals_amp))
+                for k, (p, q) in enumerate(zip(partials_pos[i], partials_amp[i]))]
+    partials += [(-1, f, freq, amp) for f, (freq, amp) in enumerate(zip(fixed_freq, fixed_amp))]
+    pairs = []
+    for first, (i, k, f1, a1) in enumerate(partials):
+        for (j, l, f2, a2) in partials[first + 1:]:
+            if i == j or i < 0 and j < 0:
+                continue
+            v1, v2 = dissonancereduction.loudness(np.array([f1, f2]), np.array([a1, a2]))
+            if v1 <= 0 or v2 <= 0:
+                continue
+            cbw = dissonancereduction._critical_bandwidths(np.array([f1 + f2]))[0]
+            if abs(f1 - f2) / cbw >= 1.46:
+                continue
+            if i < 0 or (0 <= j < i):
+                i, k, j, l = j, l, i, k
+            pair = (i, k, l, -1) if j < 0 else (i, k, j, l)
+            pairs.append(pair + (round(cbw, 6), round(min(v1, v2), 6)))
+    return sorted(pairs)
+
+
+def test_quasi_constants_brute_force():
+    partials_pos = np.arange(1, 11)
+    partials_vol = 0.88**np.arange(10)
+    fundamentals = 110 * 2**(np.array([0, 4, 7, 12, 14, 19]) / 12)
+    fixed_freq = np.array([110., 233., 392., 659.3, 1400.])
+    fixed_vol = np.array([0.5, 0.3, 0.2, 0.4, 0.1])
+    per_tone_pos = [np.arange(1, 4 + i) * (1 + 0.01 * i) for i in range(len(fundamentals))]
+    per_tone_vol = [0.8**np.arange(3 + i) for i in range(len(fundamentals))]
+    dissonancereduction = Dissonancereduction()
+
+    for pos, vol, fixed, fixed_amp in ((partials_pos, partials_vol, [], []),
+                                       (partials_pos, partials_vol, fixed_freq, fixed_vol),
+                                       (per_tone_pos, per_tone_vol, [], []),
+                                       (per_tone_pos, per_tone_vol, fixed_freq, fixed_vol)):
+        relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+            fundamentals, np.linspace(1, 0.5, len(fundamentals)), pos, vol, np.array(fixed), np.array(fixed_amp))
+        found = sorted(tuple(pair) + (round(cbw, 6), round(v, 6))
+                       for pair, cbw, v in zip(relevant_pairs.tolist(), critical_bandwidths, volume_factors))
+        expected = brute_force_quasi_constants(dissonancereduction, fundamentals,
+                                               np.linspace(1, 0.5, len(fundamentals)), pos, vol, fixed, fixed_amp)
+        assert len(expected) > 0
+        assert found == expected
+
+
+def test_evaluation_plan():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    fundamentals = 440 * 2**(np.array([0, 4, 7, 10]) / 12)
+    fixed_freq = np.array([445., 660., 1310.])
+    fixed_vol = np.array([0.5, 0.5, 0.5])
+
+    dissonancereduction = Dissonancereduction()
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol, fixed_freq, fixed_vol)
+    plan = dissonancereduction.evaluation_plan(len(fundamentals), partials_pos,
+                                               critical_bandwidths, volume_factors, relevant_pairs)
+    assert plan['nr_tone_pairs'] == np.count_nonzero(relevant_pairs[:,3] >= 0)
+    assert all(plan['index2'][plan['nr_tone_pairs']:] >= len(fundamentals) * len(partials_pos))
+
+    # the order of the relevant pairs does not matter
+    reverse = np.arange(len(relevant_pairs))[::-1]
+    tuned = fundamentals * [1, 0.995, 1.002, 0.99]
+    dissonance, gradient = dissonancereduction.dissonance_and_gradient(
+        tuned, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)
+    dissonance_plan, gradient_plan = dissonancereduction.dissonance_and_gradient(
+        tuned, partials_pos, fixed_freq, None, None, None,
+        dissonancereduction.evaluation_plan(len(fundamentals), partials_pos, critical_bandwidths[reverse],
+                                            volume_factors[reverse], relevant_pairs[reverse]))
+    assert np.isclose(dissonance, dissonance_plan)
+    assert np.allclose(gradient, gradient_plan)
+
+
+def test_gradient_accumulation():
+    partials_pos = np.arange(1, 7)
+    partials_vol = 0.88**np.arange(6)
+    dissonancereduction = Dissonancereduction()
+
+    # a single tone slightly above a fixed frequency is pulled down, the fixed frequency has no gradient
+    dissonance, gradient = dissonancereduction.single_dissonance_and_gradient(
+        np.array([446.]), np.array([1.]), partials_pos, partials_vol, np.array([440.]), np.array([1.]))
+    assert dissonance > 0
+    assert len(gradient) == 1 and gradient[0] > 0
+
+    # a cluster of 24 voices, every gradient is the sum over the pairs the tone is involved in
+    fundamentals = 110 * 2**(np.arange(24) / 7)
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        fundamentals, np.ones(24), partials_pos, partials_vol, np.array([]), np.array([]))
+    dissonance, gradient = dissonancereduction.dissonance_and_gradient(
+        fundamentals, partials_pos, np.array([]), critical_bandwidths, volume_factors, relevant_pairs)
+    assert len(gradient) == 24
+    # a tone without relevant pairs has no gradient
+    lonely = [i for i in range(24) if i not in relevant_pairs[:,0] and i not in relevant_pairs[:,2]]
+    assert all(gradient[lonely] == 0)
+    # the gradient is the sum over all pairs: it does not change if the pairs are split up
+    half = len(relevant_pairs) // 2
+    gradient_halves = sum(dissonancereduction.dissonance_and_gradient(
+        fundamentals, partials_pos, np.array([]), critical_bandwidths[s], volume_factors[s], relevant_pairs[s])[1]
+        for s in [slice(None, half), slice(half, None)])
+    assert np.allclose(gradient, gradient_halves)
+
+
+def test_loudness():
+    dissonancereduction = Dissonancereduction(amplitude_threshold=2e-5)
+    loudness = dissonancereduction.loudness(np.array([1000., 1000., 10., 30000., 1000.]),
+                                            np.array([2e-5, 1., 1., 1., 0.]))
+    # a sine at 1 kHz with an amplitude at the amplitude threshold is barely audible
+    assert abs(loudness[0]) < 0.25
+    assert loudness[1] > 4
+    # very low and very high frequencies and silent partials are inaudible
+    assert all(loudness[2:] <= 0)
+    # invalid simple tones get a loudness of -inf
+    loudness = dissonancereduction.loudness(np.array([0., -440., 440., 440.]), np.array([1., 1., 0., -1.]))
+    assert all(loudness == -np.inf)
+
+    # inaudible partials never form relevant pairs
+    relevant_pairs, _, _ = dissonancereduction.quasi_constants(
+        np.array([440., 445.]), np.array([1., 1.]), np.array([1, 2, 80]), np.array([1., 0., 1.]),
+        np.array([]), np.array([]))
+    assert relevant_pairs.tolist() == [[0, 0, 1, 0]]
+
+
+def test_tune_batch():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    major = 440 * 2**(np.array([0, 4, 7]) / 12)
+    minor = 330 * 2**(np.array([0, 3, 7, 12]) / 12)
+    chords = [(major, np.ones(3)), (np.array([]), np.array([])), (minor, np.ones(4)),
+              (np.array([440.]), np.array([1.]), np.array([442.]), np.array([1.]))]
+
+    dissonancereduction = Dissonancereduction()
+    results = dissonancereduction.tune_batch(chords, partials_pos, partials_vol)
+    assert len(results) == len(chords)
+    assert [len(r['x']) for r in results] == [3, 0, 4, 1]
+    assert all(r['success'] for r in results)
+
+    # every chord ends up about as consonant as if it was tuned on its own
+    for chord, result in zip(chords, results):
+        single = dissonancereduction.tune(chord[0], chord[1], partials_pos, partials_vol,
+                                          *(chord[2:] if len(chord) > 2 else ([], [])))
+        assert abs(result['fun'] - single['fun']) < 1e-3
+        assert np.allclose(result['x'], single['x'], rtol=1e-3)
+    # the tone is pulled to the fixed frequency
+    assert abs(results[3]['x'][0] - 442) < 0.01
+
+    # fixed frequencies without amplitudes
+    with pytest.raises(ValueError):
+        dissonancereduction.tune_batch([(major, np.ones(3), np.array([442.]))], partials_pos, partials_vol)
+
+
+def test_patch_quasi_constants():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    fundamentals = 440 * 2**(np.array([-12, 0, 4, 7]) / 12)
+    fixed_freq = np.array([445., 1310.])
+    fixed_vol = np.array([0.5, 0.5])
+    as_set = lambda pairs: set(map(tuple, pairs.tolist()))
+
+    dissonancereduction = Dissonancereduction()
+    quasi_constants = dissonancereduction.quasi_constants(
+        fundamentals, np.ones(4), partials_pos, partials_vol, fixed_freq, fixed_vol)
+
+    # removing a tone is the same as never adding it
+    removed = dissonancereduction.remove_tones(*quasi_constants, [1])
+    without = dissonancereduction.quasi_constants(
+        fundamentals[[0, 2, 3]], np.ones(3), partials_pos, partials_vol, fixed_freq, fixed_vol)
+    assert as_set(removed[0]) == as_set(without[0])
+    assert np.isclose(np.sum(removed[2]), np.sum(without[2]))
+
+    # adding the pairs of a tone to the quasi-constants without it gives all quasi-constants
+    added = dissonancereduction.quasi_constants(
+        fundamentals[[0, 2, 3, 1]], np.ones(4), partials_pos, partials_vol, fixed_freq, fixed_vol, tones=[3])
+    assert all(np.logical_or(added[0][:,0] == 3, np.logical_and(added[0][:,2] == 3, added[0][:,3] >= 0)))
+    assert len(removed[0]) + len(added[0]) == len(quasi_constants[0])
+
+    # warm start with precomputed quasi-constants
+    result = dissonancereduction.tune(fundamentals, np.ones(4), partials_pos, partials_vol, fixed_freq, fixed_vol)
+    warm = dissonancereduction.tune(fundamentals, np.ones(4), partials_pos, partials_vol, fixed_freq, fixed_vol,
+                                    initial_freq=result['x'], quasi_constants=quasi_constants)
+    assert warm['nfev'] <= result['nfev']
+    assert np.allclose(warm['x'], result['x'], rtol=1e-3)
+
+
+def test_time_budget():
+    partials_pos = np.arange(1, 13)
+    partials_vol = 0.88**np.arange(12)
+    fundamentals = 110 * 2**(np.arange(0, 40, 2) / 12)
+    dissonancereduction = Dissonancereduction()
+    dissonance_start, _ = dissonancereduction.single_dissonance_and_gradient(
+        fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol)
+
+    result = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol,
+                                      time_budget=0)
+    assert not result['success']
+    assert result['message'] == b'TIME BUDGET EXCEEDED'
+    assert len(result['x']) == len(fundamentals)
+    assert result['fun'] <= dissonance_start
+
+    result = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol,
+                                      time_budget=100)
+    assert result['success']
+
+
+def test_should_stop():
+    partials_pos = np.arange(1, 13)
+    partials_vol = 0.88**np.arange(12)
+    fundamentals = 110 * 2**(np.arange(0, 40, 2) / 12)
+    dissonancereduction = Dissonancereduction()
+    full = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol)
+
+    # stop after 5 evaluations of the dissonance
+    calls = []
+    should_stop = lambda: calls.append(None) or len(calls) > 5
+    result = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol,
+                                      should_stop=should_stop)
+    assert not result['success']
+    assert result['message'] == b'STOPPED'
+    assert result['nfev'] == 6 < full['nfev']
+    assert len(result['x']) == len(fundamentals)
+
+    # the partial result is a warm start
+    warm = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol,
+                                    initial_freq=result['x'])
+    assert warm['success']
+    assert np.allclose(warm['x'], full['x'], rtol=1e-3)
+
+    result = dissonancereduction.tune(fundamentals, np.ones(len(fundamentals)), partials_pos, partials_vol,
+                                      should_stop=lambda: False)
+    assert result['success'] and np.array_equal(result['x'], full['x'])
+
+
+def test_hessian_and_cents():
+    ji_intervals = [1, 16/15, 9/8, 6/5, 5/4, 4/3, 45/32, 3/2, 8/5, 5/3, 9/5, 15/8, 2]
+    partials_vol_piano = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    partials_pos = np.arange(1, len(partials_vol_piano) + 1)
+    notes = [4, 7, 12]
+    et_fundamentals = np.array([440 * 2**(i/12) for i in notes])
+    ji_fundamentals = [440 * ji_intervals[i] for i in notes]
+    fundamentals_vol = np.ones(len(notes))
+    # the partials of the tonic are used as fixed positions
+    fixed_freq = 440 * partials_pos
+    fixed_vol = partials_vol_piano
+    dissonancereduction = Dissonancereduction()
+
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        et_fundamentals, fundamentals_vol, partials_pos, partials_vol_piano, fixed_freq, fixed_vol)
+    gradient = lambda fs: dissonancereduction.dissonance_and_gradient(
+        fs, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)[1]
+    hessian = dissonancereduction.dissonance_hessian(
+        et_fundamentals, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)
+
+    # the Hessian is the symmetrized Jacobian of the (corrected) gradient
+    jacobian = np.array([(gradient(et_fundamentals + e * 1e-4) - gradient(et_fundamentals - e * 1e-4)) / 2e-4
+                         for e in np.eye(len(notes))]).T
+    assert np.allclose(hessian, hessian.T)
+    assert np.allclose(hessian, 0.5 * (jacobian + jacobian.T), atol=1e-4 * np.max(np.abs(hessian)))
+
+    # optimizing in cents gives the same tuning as optimizing in Hz
+    result_hz = dissonancereduction.tune(et_fundamentals, fundamentals_vol, partials_pos, partials_vol_piano,
+                                         fixed_freq, fixed_vol)
+    dissonancereduction.parametrization = "cents"
+    result_cents = dissonancereduction.tune(et_fundamentals, fundamentals_vol, partials_pos, partials_vol_piano,
+                                            fixed_freq, fixed_vol)
+    assert result_cents['success']
+    assert approx_equal(result_cents['x'].tolist(), ji_fundamentals, epsilon=0.001)
+
+    # and so does a trust region method using the Hessian, with less evaluations of the objective
+    dissonancereduction.method = "trust-exact"
+    dissonancereduction.relative_bounds = None
+    result_newton = dissonancereduction.tune(et_fundamentals, fundamentals_vol, partials_pos, partials_vol_piano,
+                                             fixed_freq, fixed_vol)
+    assert result_newton['success']
+    assert result_newton['nfev'] < result_hz['nfev']
+    assert approx_equal(result_newton['x'].tolist(), ji_fundamentals, epsilon=0.001)
+
+
+def test_tone_components():
+    partials_pos = np.arange(1, 12)
+    partials_vol = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    # two low notes far below a cluster of high notes
+    pitches = np.array([28, 35, 88, 89, 91, 93, 96])
+    fundamentals = 440 * 2**((pitches - 69) / 12)
+    fundamentals_vol = np.ones(len(pitches))
+    dissonancereduction = Dissonancereduction()
+
+    relevant_pairs, _, _ = dissonancereduction.quasi_constants(
+        fundamentals, fundamentals_vol, partials_pos, partials_vol, np.array([]), np.array([]))
+    components = dissonancereduction.tone_components(len(pitches), relevant_pairs)
+    assert [c.tolist() for c in components] == [[0, 1], [2, 3, 4, 5, 6]]
+
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    assert result['success']
+    assert result['nr_components'] == 2
+    dissonancereduction.decompose = False
+    result_joint = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    assert approx_equal(result['x'].tolist(), result_joint['x'].tolist(), epsilon=0.001)
+    assert approx_equal(result['fun'], result_joint['fun'])
+
+    # the components can be solved concurrently, the executor is not pickled
+    dissonancereduction.decompose = True
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        dissonancereduction.executor = executor
+        result_concurrent = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+        assert np.allclose(result_concurrent['x'], result['x'])
+        assert pickle.loads(pickle.dumps(dissonancereduction)).executor is None
+
+
+def test_tie_groups():
+    partials_pos = np.arange(1, 12)
+    partials_vol = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    # two low notes far below a cluster of high notes, E1 and E6 are the same pitch class
+    pitches = np.array([28, 35, 88, 89, 91, 93, 96])
+    fundamentals = 440 * 2**((pitches - 69) / 12)
+    fundamentals_vol = np.ones(len(pitches))
+    dissonancereduction = Dissonancereduction()
+
+    labels = dissonancereduction.tie_labels(fundamentals, "pitch_class")
+    assert labels.tolist() == [0, 1, 0, 2, 3, 4, 5]
+    assert dissonancereduction.tie_labels(fundamentals, [[3, 5]]).tolist() == [0, 1, 2, 3, 4, 3, 5]
+    assert dissonancereduction.tie_labels(fundamentals, None) is None
+    with pytest.raises(ValueError):
+        dissonancereduction.tie_labels(fundamentals, [[0, 1], [1, 4]])
+    with pytest.raises(ValueError):
+        dissonancereduction.tie_labels(fundamentals, "octave")
+
+    # E1 is tied to E6, so the low notes can't be tuned independently of the cluster
+    quasi_constants = dissonancereduction.quasi_constants(
+        fundamentals, fundamentals_vol, partials_pos, partials_vol, np.array([]), np.array([]))
+    assert len(dissonancereduction.tone_components(len(pitches), quasi_constants[0])) == 2
+    assert len(dissonancereduction.tone_components(len(pitches), quasi_constants[0], labels)) == 1
+
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol,
+                                      tie_groups="pitch_class")
+    assert result['success']
+    assert result['nr_tie_groups'] == 6
+    # the interval between the tied notes stays the same
+    assert approx_equal(result['x'][2] / result['x'][0], 32)
+    relevant_pairs, critical_bandwidths, volume_factors = quasi_constants
+    assert result['fun'] < dissonancereduction.dissonance_and_gradient(
+        fundamentals, partials_pos, np.array([]), critical_bandwidths, volume_factors, relevant_pairs)[0]
+
+    # the tied Hessian is consistent with the tied gradient
+    dissonancereduction.method = 'trust-ncg'
+    dissonancereduction.relative_bounds = None
+    result_newton = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol,
+                                             tie_groups="pitch_class")
+    assert approx_equal(result_newton['fun'], result['fun'], epsilon=0.01)
+
+
+def test_per_tone_timbres():
+    piano_pos = np.arange(1, 12)
+    piano_vol = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    pad_pos = np.arange(1, 4)
+    pad_vol = np.array([1, 0.6, 0.36])
+    fundamentals = 440 * 2**(np.array([-9, -5, -2, 3]) / 12)
+    fundamentals_vol = np.ones(4)
+    fixed_freq, fixed_vol = np.array([300.]), np.array([1.])
+    dissonancereduction = Dissonancereduction()
+
+    offsets, values = dissonancereduction.partials_layout(3, [[1, 2], [1], [1, 2, 3]])
+    assert offsets.tolist() == [0, 2, 3, 6]
+    assert values.tolist() == [1, 2, 1, 1, 2, 3]
+    offsets, values = dissonancereduction.partials_layout(2, [1, 2, 3])
+    assert offsets.tolist() == [0, 3, 6]
+    assert values.tolist() == [1, 2, 3, 1, 2, 3]
+    with pytest.raises(ValueError):
+        dissonancereduction.partials_layout(3, [[1, 2], [1]])
+
+    # a pad with 3 partials is the same as a pad with 11 partials of which 8 are silent
+    partials_pos = [piano_pos, pad_pos, piano_pos, pad_pos]
+    partials_vol = [piano_vol, pad_vol, piano_vol, pad_vol]
+    padded_vol = [piano_vol, np.append(pad_vol, np.zeros(8)), piano_vol, np.append(pad_vol, np.zeros(8))]
+    quasi_constants = dissonancereduction.quasi_constants(
+        fundamentals, fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol)
+    padded_quasi_constants = dissonancereduction.quasi_constants(
+        fundamentals, fundamentals_vol, [piano_pos] * 4, padded_vol, fixed_freq, fixed_vol)
+    for a, b in zip(quasi_constants, padded_quasi_constants):
+        assert np.array_equal(a, b)
+    relevant_pairs, critical_bandwidths, volume_factors = quasi_constants
+    dissonance, gradient = dissonancereduction.dissonance_and_gradient(
+        fundamentals, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)
+    padded_dissonance, padded_gradient = dissonancereduction.dissonance_and_gradient(
+        fundamentals, piano_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)
+    assert approx_equal(dissonance, padded_dissonance)
+    assert np.allclose(gradient, padded_gradient)
+    assert np.allclose(dissonancereduction.dissonance_hessian(
+                           fundamentals, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs),
+                       dissonancereduction.dissonance_hessian(
+                           fundamentals, piano_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs))
+    dissonances, gradients = dissonancereduction.dissonance_many(
+        [fundamentals, fundamentals * 1.001], fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol,
+        reference_freq=fundamentals)
+    assert approx_equal(dissonances[0], dissonance)
+    assert np.allclose(gradients[0], gradient)
+
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol)
+    assert result['success']
+    assert result['fun'] < dissonance
+    # independent groups with different timbres
+    fundamentals = 440 * 2**(np.array([-40, -33, 30, 31]) / 12)
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    assert result['success']
+    assert result['nr_components'] == 2
+
+
+def test_coarse_partials():
+    partials_pos = np.arange(1, 12)
+    partials_vol = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    fundamentals = 440 * 2**(np.array([-9, -5, -2, 3]) / 12)
+    fundamentals_vol = np.ones(4)
+    dissonancereduction = Dissonancereduction()
+
+    loudest_pos, loudest_vol = dissonancereduction.loudest_partials(partials_pos, partials_vol, 3)
+    assert loudest_pos.tolist() == [1, 2, 3]
+    loudest_pos, loudest_vol = dissonancereduction.loudest_partials([partials_pos, [1, 2]], [partials_vol[::-1], [1, 1]], 2)
+    assert [p.tolist() for p in loudest_pos] == [[10, 11], [1, 2]]
+
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    dissonancereduction.coarse_partials = [3, 20]
+    result_coarse = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    # the stage with 20 partials is skipped, there are only 11
+    assert len(result_coarse['nfev_stages']) == 2
+    assert result_coarse['nfev'] == sum(result_coarse['nfev_stages'])
+    assert result_coarse['fun'] < 1.05 * result['fun']
+
+
+def test_tune_multistart():
+    partials_pos = np.arange(1, 12)
+    partials_vol = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    # a cluster
+    fundamentals = 440 * 2**(np.array([-12, -9, -8, -5, -2, -1]) / 12)
+    fundamentals_vol = np.ones(len(fundamentals))
+    dissonancereduction = Dissonancereduction()
+
+    result = dissonancereduction.tune(fundamentals, fundamentals_vol, partials_pos, partials_vol)
+    result_multistart = dissonancereduction.tune_multistart(fundamentals, fundamentals_vol, partials_pos,
+                                                            partials_vol, nr_random=3, seed=0)
+    # 12TET, JI on each of the 6 pitch classes and 3 random starting points
+    assert len(result_multistart['fun_starts']) == 10
+    assert result_multistart['fun'] == np.min(result_multistart['fun_starts'])
+    assert result_multistart['fun'] <= result['fun']
+    assert approx_equal(result_multistart['fun_starts'][0], result['fun'])
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        dissonancereduction.executor = executor
+        result_concurrent = dissonancereduction.tune_multistart(fundamentals, fundamentals_vol, partials_pos,
+                                                                partials_vol, nr_random=3, seed=0)
+    assert np.allclose(result_concurrent['x'], result_multistart['x'])
+
+
+def test_compact_plans():
+    partials_vol_piano = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    partials_pos = np.arange(1, len(partials_vol_piano) + 1)
+    fundamentals = 440 * 2**(np.array([-12, -8, -5, 0, 4]) / 12)
+    fixed_freq = [440 * 3/2, 880]
+    dissonancereduction = Dissonancereduction()
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        fundamentals, np.ones(5), partials_pos, partials_vol_piano, fixed_freq, [1, 1])
+    plan = dissonancereduction.evaluation_plan(len(fundamentals), partials_pos, critical_bandwidths, volume_factors,
+                                               relevant_pairs)
+    compact_plan = dissonancereduction.evaluation_plan(len(fundamentals), partials_pos, critical_bandwidths,
+                                                       volume_factors, relevant_pairs, compact=True)
+    assert compact_plan['index1'].dtype == np.int16
+    assert compact_plan['volume_factors'].dtype == np.float32
+    assert dissonancereduction.plan_nbytes(compact_plan) < dissonancereduction.plan_nbytes(plan) / 2
+    assert Dissonancereduction._index_type(2**15) == np.int16
+    assert Dissonancereduction._index_type(2**15 + 1) == np.int32
+
+    dissonance, gradient = dissonancereduction.dissonance_and_gradient(fundamentals, partials_pos, fixed_freq,
+                                                                       None, None, None, plan)
+    compact_dissonance, compact_gradient = dissonancereduction.dissonance_and_gradient(
+        fundamentals, partials_pos, fixed_freq, None, None, None, compact_plan)
+    assert approx_equal(compact_dissonance, dissonance, epsilon=1e-6 * dissonance)
+    assert np.allclose(compact_gradient, gradient, rtol=1e-5, atol=1e-12)
+
+    result = dissonancereduction.tune(fundamentals, np.ones(5), partials_pos, partials_vol_piano, fixed_freq, [1, 1])
+    dissonancereduction.compact_plans = True
+    compact_result = dissonancereduction.tune(fundamentals, np.ones(5), partials_pos, partials_vol_piano,
+                                              fixed_freq, [1, 1])
+    assert np.max(np.abs(1200 * np.log2(compact_result['x'] / result['x']))) < 0.01
+
+
+def test_kernel_tables():
+    dissonancereduction = Dissonancereduction(kernel_tolerance=1e-4)
+
+    # the interpolation error stays within the bound, also beyond the end of the tables
+    hs = np.linspace(0, 5, 100001)
+    ds, ddhs = dissonancereduction._interpolated_kernel(hs)
+    exact_ds = hs**2 * np.exp(- 8 * hs)
+    exact_ddhs = 2 * hs * np.exp(- 8 * hs) * (1 - 4 * hs)
+    assert np.max(np.abs(ds - exact_ds)) <= 1e-4 * np.max(exact_ds)
+    assert np.max(np.abs(ddhs - exact_ddhs)) <= 1e-4 * np.max(np.abs(exact_ddhs))
+    sums = np.linspace(0, 60000, 100001)
+    exact_bandwidths = 25 + 75 * (1 + 3.5e-07 * sums**2)**0.69
+    assert np.max(np.abs(dissonancereduction._critical_bandwidths(sums) / exact_bandwidths - 1)) <= 1e-4
+
+    # tuning with the tables gives practically the same result as the exact calculation
+    ji_intervals = [1, 16/15, 9/8, 6/5, 5/4, 4/3, 45/32, 3/2, 8/5, 5/3, 9/5, 15/8, 2]
+    partials_vol_piano = np.array([3.7, 5.4, 1.2, 1.1, 0.95, 0.6, 0.5, 0.65, 0.001, 0.1, 0.2]) / 5.4
+    partials_pos = np.arange(1, len(partials_vol_piano) + 1)
+    notes = [4, 7, 12]
+    fundamentals = np.array([440 * 2**(i/12) for i in notes])
+    fixed_freq = 440 * partials_pos
+    result = dissonancereduction.tune(fundamentals, np.ones(3), partials_pos, partials_vol_piano,
+                                      fixed_freq, partials_vol_piano)
+    assert result['success']
+    assert approx_equal(result['x'].tolist(), [440 * ji_intervals[i] for i in notes], epsilon=0.001)
+    dissonancereduction.kernel_tolerance = None
+    exact_result = dissonancereduction.tune(fundamentals, np.ones(3), partials_pos, partials_vol_piano,
+                                            fixed_freq, partials_vol_piano)
+    assert approx_equal(result['fun'], exact_result['fun'], epsilon=0.001)
+
+
+def test_dissonance_many():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    fundamentals = 440 * 2**(np.array([0, 4, 7, 10]) / 12)
+    fundamentals_vol = np.array([1., 0.8, 0.9, 0.5])
+    fixed_freq = np.array([330., 555.])
+    fixed_vol = np.array([0.3, 0.6])
+    rng = np.random.default_rng(0)
+    candidates = fundamentals * 2**(rng.uniform(-20, 20, (25, 4)) / 1200)
+    dissonancereduction = Dissonancereduction()
+
+    # every candidate is evaluated with the quasi-constants of the reference
+    relevant_pairs, critical_bandwidths, volume_factors = dissonancereduction.quasi_constants(
+        fundamentals, fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol)
+    expected = [dissonancereduction.dissonance_and_gradient(
+        candidate, partials_pos, fixed_freq, critical_bandwidths, volume_factors, relevant_pairs)
+        for candidate in candidates]
+    for chunk_size in [None, 1, 7]:
+        dissonances, gradients = dissonancereduction.dissonance_many(
+            candidates, fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol,
+            reference_freq=fundamentals, chunk_size=chunk_size)
+        assert np.allclose(dissonances, [e[0] for e in expected])
+        assert np.allclose(gradients, [e[1] for e in expected])
+
+    dissonances, gradients = dissonancereduction.dissonance_many(
+        candidates, fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol, gradient=False)
+    assert gradients is None
+    # without reference, the quasi-constants of the first candidate are used
+    assert approx_equal(dissonances[0], dissonancereduction.single_dissonance_and_gradient(
+        candidates[0], fundamentals_vol, partials_pos, partials_vol, fixed_freq, fixed_vol)[0], epsilon=1e-9)
@@ -0,0 +1,41 @@
+from adaptivetuning import Scheduler
+import time
+
+
+def test_scheduler():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.start()
+    start = time.monotonic()
+    scheduler.schedule(0.06, lambda: calls.append(('c', time.monotonic() - start)))
+    scheduler.schedule(0.02, lambda: calls.append(('a', time.monotonic() - start)))
+    # calls with the same due time keep their order
+    due_time = start + 0.04
+    for name in ('b1', 'b2', 'b3'):
+        scheduler.schedule_at(due_time, calls.append, (name, None))
+    assert scheduler.queue_depth == 5
+    time.sleep(0.1)
+    assert [name for name, _ in calls] == ['a', 'b1', 'b2', 'b3', 'c']
+    assert calls[0][1] >= 0.02 and calls[-1][1] >= 0.06
+
+    statistics = scheduler.statistics
+    assert statistics['calls'] == 5
+    assert statistics['queue_depth'] == 0
+    assert statistics['max_queue_depth'] == 5
+    assert 0 <= statistics['mean_lateness'] <= statistics['max_lateness'] < 0.05
+
+    # errors don't stop the scheduler, calls can schedule new calls
+    scheduler.schedule(0, lambda: 1 / 0)
+    scheduler.schedule(0, lambda: scheduler.schedule(0.01, calls.append, ('d', None)))
+    # stop waits for the pending calls
+    scheduler.stop()
+    assert calls[-1][0] == 'd'
+    assert scheduler.statistics['errors'] == 1
+    assert scheduler.statistics['calls'] == 8
+
+    # cancel drops the pending calls
+    scheduler.start()
+    scheduler.schedule(10, calls.append, ('e', None))
+    scheduler.stop(cancel=True)
+    assert calls[-1][0] == 'd'
+    assert scheduler.queue_depth == 0
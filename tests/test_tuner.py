@@ -0,0 +1,249 @@
+from adaptivetuning import Tuner
+import concurrent.futures
+import numpy as np
+import threading
+import time
+
+
+partials_pos = np.arange(1, 9)
+partials_vol = 0.88**np.arange(8)
+
+
+def test_preemptive_tuning():
+    pitches = [60, 64, 67]
+    fundamentals_freq = 440 * 2**((np.array(pitches) - 69) / 12)
+    tuner = Tuner()
+    tuner.preemptive_tuning = True
+
+    # outside tune_running_notes nothing is preempted, not even when no session is running
+    tuned = tuner.incremental_tune(pitches, np.ones(3), partials_pos, partials_vol, np.array([]), np.array([]))
+    assert np.allclose(tuned, tuner.dissonancereduction.tune(fundamentals_freq, np.ones(3), partials_pos,
+                                                             partials_vol)['x'])
+    assert not np.allclose(tuned, fundamentals_freq)
+
+    # a tuning requested during the optimization stops it
+    for pitch in pitches:
+        tuner.audiogenerator.register_note_on(pitch, 0.8)
+    tune = tuner.dissonancereduction.tune
+    def tune_and_request(*args, **kwargs):
+        tuner.request_tuning()
+        return tune(*args, **kwargs)
+    tuner.dissonancereduction.tune = tune_and_request
+    tuner._tuning_state = None
+    note_on_time = time.monotonic()
+    tuner._tuning_request_time = note_on_time
+    tuner.tune_running_notes()
+    assert tuner.preempted_tunings == 1
+    # the next tuning has to be done before the note that requested this one sounds
+    assert tuner._tuning_request_time == note_on_time
+    # and it starts from the partial result
+    assert sorted(tuner._tuning_state['tuned']) == pitches
+
+    # without preemption the tuning finishes
+    tuner.preemptive_tuning = False
+    tuner.tune_running_notes()
+    assert tuner.preempted_tunings == 1
+    assert tuner._tuning_request_time is None
+
+
+def test_preemptive_tuning_with_process_executor():
+    # two groups of independent complex tones that are optimized in the worker processes
+    pitches = [36, 37, 96, 97]
+    tuner = Tuner()
+    tuner.preemptive_tuning = True
+    for pitch in pitches:
+        tuner.audiogenerator.register_note_on(pitch, 0.8)
+    with concurrent.futures.ProcessPoolExecutor(2) as executor:
+        tuner.dissonancereduction.executor = executor
+        # request a tuning after tune_running_notes read the generation (the Dissonancereduction itself is pickled)
+        shrink_problem = tuner.shrink_problem
+        def shrink_and_request(*args, **kwargs):
+            tuner.request_tuning()
+            return shrink_problem(*args, **kwargs)
+        tuner.shrink_problem = shrink_and_request
+        tuner.tune_running_notes()
+    # the groups in the worker processes are not stopped
+    assert tuner.preempted_tunings == 0
+    tuned = np.array([tuner._tuning_state['tuned'][pitch] for pitch in pitches])
+    assert np.all(np.isfinite(tuned))
+    assert not np.allclose(tuned, 440 * 2**((np.array(pitches) - 69) / 12))
+
+
+def test_note_on_generation():
+    # the generation of a note-on message changes together with the registered notes
+    tuner = Tuner()
+    locked = []
+    tuner.request_tuning = lambda: locked.append(tuner._midi_lock.locked())
+    tuner.midi_note_on_callback(60, 0.8)
+    assert locked == [True]
+
+
+def test_update_degradation_level():
+    tuner = Tuner(audio_lag=0.3)
+    assert tuner.degradation_level == 0
+
+    # a tuning that took longer than audio_lag
+    tuner.update_degradation_level(0.31)
+    assert tuner.degradation_level == 1
+    # a mean latency above degradation_thresholds[1] * audio_lag
+    tuner.update_degradation_level(0.25)
+    assert tuner.degradation_level == 2
+    # a mean latency between the thresholds keeps the level
+    for _ in range(20):
+        tuner.update_degradation_level(0.15)
+    assert tuner.degradation_level == 2
+    # the last level is not left upwards
+    for _ in range(5):
+        tuner.update_degradation_level(1)
+    assert tuner.degradation_level == len(Tuner.degradation_levels) - 1
+
+    # a better level is only used again after latency_window fast tunings
+    tuner = Tuner(audio_lag=0.3)
+    tuner.update_degradation_level(1)
+    tuner.update_degradation_level(1)
+    assert tuner.degradation_level == 2
+    for _ in range(tuner.latency_window - 1):
+        tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 2
+    tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 1
+    for _ in range(tuner.latency_window - 1):
+        tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 1
+    tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 0
+
+    # the window can be changed during a session
+    tuner.update_degradation_level(1)
+    assert tuner.degradation_level == 1
+    tuner.latency_window = 3
+    for _ in range(2):
+        tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 1
+    tuner.update_degradation_level(0.01)
+    assert tuner.degradation_level == 0
+
+    tuner.update_degradation_level(1)
+    tuner.adaptive_degradation = False
+    tuner.update_degradation_level(1)
+    assert tuner.degradation_level == 0
+
+
+def test_shrink_problem():
+    tuner = Tuner()
+    fundamentals_amp = np.array([0.1, 0.8, 0.3, 0.9, 0.2, 0.7, 0.6, 0.5])
+    fixed_freq = np.arange(100., 1100., 100.)
+    fixed_amp = np.array([0.1, 0.9, 0.2, 0.8, 0.3, 0.7, 0.4, 0.6, 0.5, 0.05])
+
+    # full quality
+    voices, pos, amp, shrunk_fixed_freq, shrunk_fixed_amp = tuner.shrink_problem(
+        fundamentals_amp, partials_pos, partials_vol, fixed_freq, fixed_amp, level=0)
+    assert np.array_equal(voices, np.arange(8))
+    assert np.array_equal(pos, partials_pos) and np.array_equal(amp, partials_vol)
+    assert np.array_equal(shrunk_fixed_freq, fixed_freq) and np.array_equal(shrunk_fixed_amp, fixed_amp)
+
+    # at most 6 voices, 3 partials and 4 fixed frequencies, the loudest in their original order
+    limits = Tuner.degradation_levels[3]
+    assert (limits['max_voices'], limits['max_partials'], limits['max_fixed']) == (6, 3, 4)
+    voices, pos, amp, shrunk_fixed_freq, shrunk_fixed_amp = tuner.shrink_problem(
+        fundamentals_amp, partials_pos, partials_vol, fixed_freq, fixed_amp, level=3)
+    assert np.array_equal(voices, [1, 2, 3, 5, 6, 7])
+    assert np.array_equal(pos, [1, 2, 3]) and np.array_equal(amp, partials_vol[:3])
+    assert np.array_equal(shrunk_fixed_freq, [200, 400, 600, 800])
+    assert np.array_equal(shrunk_fixed_amp, [0.9, 0.8, 0.7, 0.6])
+
+    # per-tone timbres: the timbres of the selected voices with their loudest partials
+    per_tone_pos = [partials_pos * (i + 1) for i in range(8)]
+    per_tone_amp = [np.roll(partials_vol, i) for i in range(8)]
+    voices, pos, amp, _, _ = tuner.shrink_problem(
+        fundamentals_amp, per_tone_pos, per_tone_amp, fixed_freq, fixed_amp, level=3)
+    assert np.array_equal(voices, [1, 2, 3, 5, 6, 7])
+    assert len(pos) == len(amp) == 6
+    for voice, voice_pos, voice_amp in zip(voices, pos, amp):
+        loudest = np.sort(np.argsort(- per_tone_amp[voice], kind='stable')[:3])
+        assert np.array_equal(voice_pos, per_tone_pos[voice][loudest])
+        assert np.array_equal(voice_amp, per_tone_amp[voice][loudest])
+
+    # the current level is used by default
+    tuner._degradation_level = 1
+    voices, pos, _, shrunk_fixed_freq, _ = tuner.shrink_problem(
+        fundamentals_amp, partials_pos, partials_vol, fixed_freq, fixed_amp)
+    assert len(voices) == 8 and len(pos) == 8 and len(shrunk_fixed_freq) == 10
+
+
+def test_partial_tune():
+    tuner = Tuner()
+    pitches = [60, 64, 67]
+    held_freq = {60: 262., 64: 330.}
+    tuner._tuned_freq = dict(held_freq)
+    calls = []
+    optimize = tuner.optimize
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return optimize(*args, **kwargs)
+    tuner.optimize = spy
+
+    tuned = tuner.partial_tune(pitches, np.array([1., 0.5, 1.]), partials_pos, partials_vol,
+                               np.array([500.]), np.array([0.5]))
+    # the held pitches keep their frequencies
+    assert tuned[0] == 262. and tuned[1] == 330.
+    # only the new pitch is a variable, it starts from 12TET
+    assert len(calls) == 1
+    fundamentals_freq, fundamentals_amp, _, _, fixed_freq, fixed_amp = calls[0]
+    assert np.allclose(fundamentals_freq, [440 * 2**(-2 / 12)])
+    assert np.array_equal(fundamentals_amp, [1.])
+    assert tuned[2] != fundamentals_freq[0]
+    # the partials of the held pitches are fixed frequencies
+    assert np.allclose(fixed_freq, np.concatenate(([500.], 262. * partials_pos, 330. * partials_pos)))
+    assert np.allclose(fixed_amp, np.concatenate(([0.5], partials_vol, 0.5 * partials_vol)))
+
+    # without new pitches nothing is optimized
+    tuner._tuned_freq = dict(zip(pitches, tuned))
+    assert np.array_equal(tuner.partial_tune(pitches, np.ones(3), partials_pos, partials_vol, np.array([]),
+                                             np.array([])), tuned)
+    assert len(calls) == 1
+
+
+def test_tune_loop():
+    tuner = Tuner(tuning_interval=0.5)
+    tunings = []
+    tuned = threading.Event()
+    def tune_running_notes():
+        tunings.append(time.monotonic())
+        tuned.set()
+    tuner.tune_running_notes = tune_running_notes
+    # the tuner thread without midi and audio input
+    tuner._stop_signal.clear()
+    tuner._stop_tuning_signal.clear()
+    tuner._tuner_thread = threading.Thread(target=tuner.tune_loop)
+    tuner._midi_thread = threading.Thread(target=lambda: None)
+    tuner._audio_thread = None
+    tuner._midi_thread.start()
+    tuner._tuner_thread.start()
+    try:
+        # a request wakes the thread up immediately
+        time.sleep(0.05)
+        request_time = time.monotonic()
+        tuner.request_tuning()
+        assert tuned.wait(0.2)
+        assert len(tunings) == 1 and tunings[0] - request_time < 0.1
+        tuned.clear()
+
+        # without requests the thread tunes again after tuning_interval
+        assert tuned.wait(2)
+        assert len(tunings) == 2 and tunings[1] - tunings[0] >= 0.45
+        tuned.clear()
+
+        # new peaks request a tuning, the same peaks don't
+        tuner.audio_analyzer_callback([440.], [0.5])
+        assert tuned.wait(0.2)
+        tuned.clear()
+        generation = tuner._tuning_generation
+        tuner.audio_analyzer_callback([440.], [0.5])
+        assert tuner._tuning_generation == generation
+    finally:
+        # stop returns without waiting for the next regular tuning
+        stop_time = time.monotonic()
+        tuner.stop()
+    assert time.monotonic() - stop_time < 0.2
+    assert not tuner._tuner_thread.is_alive()
@@ -0,0 +1,47 @@
+from adaptivetuning import Tuningcache
+import numpy as np
+import os
+import tempfile
+
+def test_tuningcache():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    major = 440 * 2**(np.array([0, 4, 7]) / 12)
+    minor = 440 * 2**(np.array([0, 3, 7]) / 12)
+
+    cache = Tuningcache(max_size=2)
+    first = cache.tune(major, np.ones(3), partials_pos, partials_vol)
+    assert cache.statistics['misses'] == 1 and cache.statistics['hits'] == 0
+
+    # same chord in a different order and slightly different amplitudes is a hit
+    second = cache.tune(major[::-1], np.ones(3) * 1.01, partials_pos, partials_vol)
+    assert cache.statistics['hits'] == 1
+    assert second['message'] == b'CACHE HIT'
+    assert np.allclose(second['x'], first['x'][::-1])
+
+    # a different timbre, different fixed frequencies or a different chord is a miss
+    cache.tune(major, np.ones(3), partials_pos, partials_vol[::-1])
+    cache.tune(major, np.ones(3), partials_pos, partials_vol, [445.], [1.])
+    cache.tune(minor, np.ones(3), partials_pos, partials_vol)
+    assert cache.statistics['misses'] == 4
+    # only the last two results are kept
+    assert cache.statistics['evictions'] == 2
+    assert len(cache) == 2
+    cache.tune(major, np.ones(3), partials_pos, partials_vol)
+    assert cache.statistics['misses'] == 5
+
+    # results of the decomposed and the joint optimization are cached separately
+    signature = cache.signature(major, np.ones(3), partials_pos, partials_vol)
+    cache.dissonancereduction.decompose = not cache.dissonancereduction.decompose
+    assert cache.signature(major, np.ones(3), partials_pos, partials_vol) != signature
+    cache.dissonancereduction.decompose = not cache.dissonancereduction.decompose
+
+    # persistence
+    file_name = os.path.join(tempfile.mkdtemp(), 'cache.pkl')
+    cache.file_name = file_name
+    cache.save()
+    loaded = Tuningcache(max_size=2, file_name=file_name)
+    assert len(loaded) == 2
+    assert np.allclose(loaded.tune(minor, np.ones(3), partials_pos, partials_vol)['x'],
+                       cache.tune(minor, np.ones(3), partials_pos, partials_vol)['x'])
+    assert loaded.statistics['hits'] == 1
@@ -0,0 +1,37 @@
+from adaptivetuning import Dissonancereduction, TuningProcess
+from adaptivetuning.tuningprocess import Superseded
+import numpy as np
+import pytest
+
+
+def test_tuningprocess():
+    partials_pos = np.arange(1, 9)
+    partials_vol = 0.88**np.arange(8)
+    major = 440 * 2**(np.array([0, 4, 7]) / 12)
+    minor = 440 * 2**(np.array([0, 3, 7]) / 12)
+    dissonancereduction = Dissonancereduction()
+    tuning_process = TuningProcess(dissonancereduction)
+    try:
+        tuning_process.start()
+        result = tuning_process.tune(major, np.ones(3), partials_pos, partials_vol)
+        assert np.allclose(result['x'], dissonancereduction.tune(major, np.ones(3), partials_pos, partials_vol)['x'])
+
+        # the result of a superseded request is discarded, the next call gets the result of its own request
+        with pytest.raises(Superseded):
+            tuning_process.tune(major, np.ones(3), partials_pos, partials_vol, superseded=lambda: True)
+        result = tuning_process.tune(minor, np.ones(3), partials_pos, partials_vol)
+        assert np.allclose(result['x'], dissonancereduction.tune(minor, np.ones(3), partials_pos, partials_vol)['x'])
+        statistics = tuning_process.statistics
+        assert statistics['requests'] == 3 and statistics['superseded'] == 1
+        assert statistics['stale'] + statistics['skipped'] == 1
+
+        # changed parameters are sent to the worker
+        dissonancereduction.max_iterations = 1
+        assert tuning_process.tune(minor, np.ones(3), partials_pos, partials_vol)['nit'] <= 1
+
+        # exceptions are raised in the calling process
+        with pytest.raises(ValueError):
+            tuning_process.tune(major, np.ones(3), partials_pos, partials_vol, tie_groups='octaves')
+    finally:
+        tuning_process.stop()
+    assert not tuning_process.running